@@ -0,0 +1,209 @@
+import bisect
+import pandas as pd
+from database import create_debt_streaks_batch_table_if_not_exists
+from debt_levels import classify_saldos, get_level_label
+from month_calendar import to_day_number, day_to_iso, month_of, month_start_day, is_month_start
+from logic import (
+    classify_saldo_rows,
+    get_client_first_appearance_and_retiro_dates,
+    new_streak,
+    continues_streak
+)
+
+# Nivel de los saldos de relleno (saldo 0)
+NIVEL_RELLENO = int(classify_saldos([0])[0])
+
+def get_fechas_base_range(fecha_inicio_str, fecha_fin_str):
+    """
+    Genera una fecha_base por mes entre dos fechas (ambas incluidas). Si la fecha de
+    inicio es fin de mes se usan los fines de mes; si no, se conserva su día del mes.
+
+    Args:
+        fecha_inicio_str (str): Primera fecha_base en formato YYYY-MM-DD.
+        fecha_fin_str (str): Última fecha_base en formato YYYY-MM-DD.
+
+    Returns:
+        list: Lista de fechas_base en formato YYYY-MM-DD.
+    """
+    fecha_inicio = pd.to_datetime(fecha_inicio_str)
+    fecha_fin = pd.to_datetime(fecha_fin_str)
+    if fecha_inicio.is_month_end:
+        fechas = pd.date_range(fecha_inicio, fecha_fin, freq='ME')
+    else:
+        fechas = [fecha_inicio + pd.DateOffset(months=i) for i in range((fecha_fin.year - fecha_inicio.year) * 12 + fecha_fin.month - fecha_inicio.month + 1)]
+        fechas = [fecha for fecha in fechas if fecha <= fecha_fin]
+    return [fecha.strftime('%Y-%m-%d') for fecha in fechas]
+
+def _build_client_segments(fechas, niveles):
+    """
+    Calcula una sola vez las rachas (segmentos) de la historia real de un cliente.
+    Cada segmento guarda además los índices de su primera y última fila, y se
+    precalcula para cada posición la mejor racha desde ese segmento hasta el final
+    (la más larga y, ante empates, la más antigua).
+    """
+    segments = []
+    for index, (fecha, nivel_deuda) in enumerate(zip(fechas, niveles)):
+        if segments and continues_streak(segments[-1], fecha, nivel_deuda):
+            segments[-1]['fecha_fin'] = fecha
+            segments[-1]['racha'] += 1
+            segments[-1]['fila_fin'] = index
+        else:
+            segment = new_streak(fecha, nivel_deuda)
+            segment['fila_inicio'] = index
+            segment['fila_fin'] = index
+            segments.append(segment)
+
+    best_from = [None] * (len(segments) + 1)
+    for index in range(len(segments) - 1, -1, -1):
+        best = best_from[index + 1]
+        best_from[index] = segments[index] if best is None or segments[index]['racha'] >= best['racha'] else best
+    return {
+        'fechas': fechas,
+        'segments': segments,
+        'fines': [segment['fecha_fin'] for segment in segments],
+        'best_from': best_from
+    }
+
+def _has_n0_fill_at(client, dates_info, fecha_base):
+    """
+    Indica si `fill_missing_saldos_with_n0`, ejecutado con esta fecha_base, habría insertado
+    un saldo N0 con fecha igual a la fecha_base, el único relleno que entra en la ventana
+    de rachas (los rellenos van al día 1 de cada mes y nunca pasan de la fecha_base).
+    """
+    if dates_info is None or not is_month_start(fecha_base):
+        return False
+    if month_start_day(month_of(dates_info['first_appearance'])) > fecha_base:
+        return False
+    if dates_info['fecha_retiro'] is not None and fecha_base > dates_info['fecha_retiro']:
+        return False
+    fechas = client['fechas'] if client else []
+    index = bisect.bisect_left(fechas, fecha_base)
+    return not (index < len(fechas) and fechas[index] < month_start_day(month_of(fecha_base) + 1))
+
+def _select_client_streak(client, fill_n0, fecha_base, min_racha_length):
+    """
+    Selecciona, a partir de los segmentos precalculados, la racha más larga (la más antigua
+    ante empates) de la ventana que empieza en la fecha_base.
+    """
+    candidates = []
+    first_segment = None
+    rest_best = None
+    if client:
+        index = bisect.bisect_left(client['fines'], fecha_base)
+        if index < len(client['segments']):
+            segment = client['segments'][index]
+            # La racha que cruza la fecha_base solo cuenta sus filas desde la fecha_base
+            primera_fila = bisect.bisect_left(client['fechas'], fecha_base, segment['fila_inicio'], segment['fila_fin'] + 1)
+            first_segment = {
+                'nivel': segment['nivel'],
+                'fecha_inicio': client['fechas'][primera_fila],
+                'fecha_fin': segment['fecha_fin'],
+                'racha': segment['fila_fin'] - primera_fila + 1
+            }
+            rest_best = client['best_from'][index + 1]
+
+    if fill_n0:
+        fill_streak = new_streak(fecha_base, NIVEL_RELLENO)
+        if first_segment is not None and continues_streak(fill_streak, first_segment['fecha_inicio'], first_segment['nivel']):
+            first_segment['racha'] += 1
+            first_segment['fecha_inicio'] = fecha_base
+        else:
+            candidates.append(fill_streak)
+    if first_segment is not None:
+        candidates.append(first_segment)
+    if rest_best is not None:
+        candidates.append(rest_best)
+
+    longest_streak = None
+    for streak in candidates:
+        if longest_streak is None or streak['racha'] > longest_streak['racha']:
+            longest_streak = streak
+    if longest_streak is None or longest_streak['racha'] < min_racha_length:
+        return None
+    return longest_streak
+
+def find_longest_debt_streaks_batch(session, fechas_base, min_racha_length, sink):
+    """
+    Calcula las rachas de deuda para varias fechas_base con una sola lectura de los saldos.
+
+    Las rachas de la historia real de cada cliente se calculan una sola vez; cada fecha_base
+    se responde desde esos segmentos (recortando la racha que cruza la fecha_base y
+    añadiendo el relleno N0 que le correspondería), con los mismos resultados que una
+    ejecución de `main.py --fecha_base` por cada fecha.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        fechas_base (list): Lista de fechas_base en formato YYYY-MM-DD.
+        min_racha_length (int): Longitud mínima de la racha.
+        sink (StreakResultsSink): Destino de los resultados (`debt_streaks_batch_results` y archivo de salida).
+
+    Returns:
+        int: Número de rachas escritas entre todas las fechas_base.
+    """
+    print(f"\n--- Identificando rachas de deuda para {len(fechas_base)} fechas_base y racha mínima: {min_racha_length} ---")
+
+    query_saldos = """
+    SELECT
+        identificacion,
+        fecha,
+        saldo
+    FROM
+        saldos_clientes
+    WHERE
+        relleno = 0
+    ORDER BY
+        identificacion, fecha;
+    """
+    classified_saldos = classify_saldo_rows(session.iter_rows(query_saldos))
+
+    # Paso 1: calcular una sola vez los segmentos de cada cliente
+    clients = {}
+    current_id = None
+    fechas, niveles = [], []
+    for identificacion, fecha, nivel_deuda in classified_saldos:
+        if identificacion != current_id:
+            if current_id is not None:
+                clients[current_id] = _build_client_segments(fechas, niveles)
+            current_id, fechas, niveles = identificacion, [], []
+        fechas.append(fecha)
+        niveles.append(nivel_deuda)
+    if current_id is not None:
+        clients[current_id] = _build_client_segments(fechas, niveles)
+
+    client_dates_info = get_client_first_appearance_and_retiro_dates(session)
+    identificaciones = sorted(set(clients) | set(client_dates_info))
+    max_real_date = max((client['fechas'][-1] for client in clients.values()), default=None)
+
+    create_debt_streaks_batch_table_if_not_exists(session)
+    session.execute("DELETE FROM debt_streaks_batch_results;")
+
+    # Paso 2: responder cada fecha_base desde los segmentos precalculados
+    total_results = 0
+    for fecha_base_str in fechas_base:
+        fecha_base = to_day_number(fecha_base_str)
+        fills = {
+            identificacion for identificacion in identificaciones
+            if _has_n0_fill_at(clients.get(identificacion), client_dates_info.get(identificacion), fecha_base)
+        }
+        max_db_date = max_real_date
+        if fills and (max_db_date is None or fecha_base > max_db_date):
+            max_db_date = fecha_base
+        if max_db_date is None or fecha_base > max_db_date:
+            print(f"La fecha base ({fecha_base_str}) es posterior a la fecha máxima de datos disponibles. No se pueden encontrar rachas.")
+            continue
+
+        results = 0
+        for identificacion in identificaciones:
+            streak = _select_client_streak(clients.get(identificacion), identificacion in fills, fecha_base, min_racha_length)
+            if streak:
+                sink.write({
+                    'fecha_base': fecha_base_str,
+                    'identificacion': identificacion,
+                    'racha': streak['racha'],
+                    'fecha_fin': day_to_iso(streak['fecha_fin']),
+                    'nivel': get_level_label(streak['nivel'])
+                })
+                results += 1
+        print(f"Fecha base {fecha_base_str}: {results} rachas encontradas.")
+        total_results += results
+    return total_results
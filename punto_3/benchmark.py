@@ -0,0 +1,228 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from contextlib import redirect_stdout
+import pandas as pd
+from database import create_session, create_table_saldos_clientes_if_not_exists, create_table_retiros_if_not_exists, create_debt_streaks_table_if_not_exists
+from logic import (
+    insert_data_into_db,
+    insert_retiros_data_into_db,
+    fill_missing_saldos_with_n0,
+    classify_debt_levels,
+    find_longest_debt_streak
+)
+from results_sink import StreakResultsSink
+from duckdb_backend import (
+    create_duckdb_connection,
+    create_duckdb_tables,
+    load_dataframes_into_duckdb,
+    fill_missing_saldos_with_n0_duckdb,
+    find_longest_debt_streak_duckdb
+)
+from config import DUCKDB_SETTINGS
+from synthetic import add_portfolio_arguments, generate_portfolio_from_args
+
+RESULT_FIELDS = ['identificacion', 'racha', 'fecha_fin', 'nivel']
+
+def measure_stage(nombre, funcion, verbose=False):
+    """
+    Ejecuta una etapa midiendo su tiempo y, si tracemalloc está activo, el pico de memoria de
+    Python asignada durante la etapa (tracemalloc hace más lentas las etapas).
+
+    Args:
+        nombre (str): Nombre de la etapa.
+        funcion (callable): Función sin argumentos que ejecuta la etapa.
+        verbose (bool, optional): Si es False, se descarta lo que la etapa imprime en consola.
+
+    Returns:
+        tuple: (valor devuelto por la etapa, diccionario con etapa, segundos y memoria_pico_mb).
+    """
+    midiendo_memoria = tracemalloc.is_tracing()
+    if midiendo_memoria:
+        tracemalloc.reset_peak()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+    inicio = time.perf_counter()
+    if verbose:
+        resultado = funcion()
+    else:
+        with redirect_stdout(io.StringIO()):
+            resultado = funcion()
+    segundos = time.perf_counter() - inicio
+    memoria_pico_mb = None
+    if midiendo_memoria:
+        memoria_pico_mb = (tracemalloc.get_traced_memory()[1] - memoria_inicial) / 2 ** 20
+    return resultado, {'etapa': nombre, 'segundos': segundos, 'memoria_pico_mb': memoria_pico_mb}
+
+def run_pipeline(df_historia, df_retiros, fecha_base_str, min_racha_length, workers, work_dir, verbose=False):
+    """
+    Ejecuta las etapas de `main.py` sobre una base de datos nueva en `work_dir` y mide cada una.
+
+    Returns:
+        list: Medición de cada etapa (ver `measure_stage`).
+    """
+    db_file = os.path.join(work_dir, 'benchmark.db')
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    session = create_session(db_file)
+    if session is None:
+        raise RuntimeError(f"No se pudo abrir la base de datos {db_file}")
+
+    def carga():
+        create_table_saldos_clientes_if_not_exists(session)
+        insert_data_into_db(session, df_historia)
+        create_table_retiros_if_not_exists(session)
+        insert_retiros_data_into_db(session, df_retiros)
+        create_debt_streaks_table_if_not_exists(session)
+
+    def rachas():
+        with StreakResultsSink(session, 'debt_streaks_results', RESULT_FIELDS, work_dir, 'debt_streaks_results.csv') as sink:
+            return find_longest_debt_streak(session, fecha_base_str, min_racha_length, workers=workers, sink=sink)
+
+    etapas = [
+        ('carga', carga),
+        ('relleno_n0', lambda: fill_missing_saldos_with_n0(session, fecha_base=pd.to_datetime(fecha_base_str))),
+        ('clasificacion', lambda: classify_debt_levels(session, agregado=True)),
+        ('rachas', rachas),
+    ]
+    mediciones = []
+    try:
+        for nombre, funcion in etapas:
+            _, medicion = measure_stage(nombre, funcion, verbose)
+            mediciones.append(medicion)
+    finally:
+        session.close()
+    return mediciones
+
+def run_pipeline_duckdb(df_historia, df_retiros, fecha_base_str, min_racha_length, work_dir, verbose=False):
+    """
+    Igual que `run_pipeline`, pero con el motor DuckDB (la clasificación va dentro de la etapa de rachas).
+
+    Returns:
+        list: Medición de cada etapa (ver `measure_stage`).
+    """
+    db_file = os.path.join(work_dir, 'benchmark.duckdb')
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    connection = create_duckdb_connection(db_file, {**DUCKDB_SETTINGS, 'temp_directory': os.path.join(work_dir, 'duckdb_tmp')})
+    if connection is None:
+        raise RuntimeError(f"No se pudo abrir la base de datos {db_file}")
+
+    def carga():
+        create_duckdb_tables(connection)
+        load_dataframes_into_duckdb(connection, df_historia, df_retiros)
+
+    etapas = [
+        ('carga', carga),
+        ('relleno_n0', lambda: fill_missing_saldos_with_n0_duckdb(connection, fecha_base=pd.to_datetime(fecha_base_str))),
+        ('rachas', lambda: find_longest_debt_streak_duckdb(connection, fecha_base_str, min_racha_length)),
+    ]
+    mediciones = []
+    try:
+        for nombre, funcion in etapas:
+            _, medicion = measure_stage(nombre, funcion, verbose)
+            mediciones.append(medicion)
+    finally:
+        connection.close()
+    return mediciones
+
+def summarize_runs(corridas):
+    """
+    Resume varias corridas: mediana de los segundos y máximo del pico de memoria por etapa.
+    """
+    resumen = []
+    for mediciones in zip(*corridas):
+        resumen.append({
+            'etapa': mediciones[0]['etapa'],
+            'segundos': statistics.median(m['segundos'] for m in mediciones),
+            'memoria_pico_mb': max((m['memoria_pico_mb'] for m in mediciones if m['memoria_pico_mb'] is not None), default=None)
+        })
+    return resumen
+
+def format_change(actual, base):
+    if not base or actual is None:
+        return "n/a"
+    return f"{(actual - base) / base * 100:+.1f}%"
+
+def format_number(valor, decimales):
+    return "n/a" if valor is None else f"{valor:.{decimales}f}"
+
+def print_report(reporte, base=None):
+    """
+    Muestra las mediciones por etapa y, si se da un reporte base, la variación respecto a él.
+    """
+    print(f"\n--- Benchmark: {reporte['parametros']['clientes']} clientes, {reporte['saldos']} saldos ---")
+    etapas_base = {etapa['etapa']: etapa for etapa in base['etapas']} if base else {}
+    encabezado = f"{'Etapa':<15}{'Segundos':>12}{'Memoria MB':>12}"
+    if base:
+        encabezado += f"{'Base s':>12}{'Var. s':>10}{'Base MB':>12}{'Var. MB':>10}"
+    print(encabezado)
+    for etapa in reporte['etapas']:
+        linea = f"{etapa['etapa']:<15}{etapa['segundos']:>12.3f}{format_number(etapa['memoria_pico_mb'], 1):>12}"
+        etapa_base = etapas_base.get(etapa['etapa'])
+        if etapa_base:
+            linea += (f"{etapa_base['segundos']:>12.3f}{format_change(etapa['segundos'], etapa_base['segundos']):>10}"
+                      f"{format_number(etapa_base['memoria_pico_mb'], 1):>12}{format_change(etapa['memoria_pico_mb'], etapa_base['memoria_pico_mb']):>10}")
+        print(linea)
+    total = sum(etapa['segundos'] for etapa in reporte['etapas'])
+    linea_total = f"{'total':<15}{total:>12.3f}"
+    if base:
+        total_base = sum(etapa['segundos'] for etapa in base['etapas'])
+        linea_total += f"{'':>12}{total_base:>12.3f}{format_change(total, total_base):>10}"
+    print(linea_total)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el tiempo y la memoria de cada etapa del pipeline sobre una cartera sintética.")
+    add_portfolio_arguments(parser)
+    parser.add_argument('--fecha_base', type=str, help='Fecha base del análisis (por defecto, el corte de mes de la mitad del periodo).')
+    parser.add_argument('--min_racha', type=int, default=1, help='Longitud mínima de la racha de deuda.')
+    parser.add_argument('--workers', type=int, default=1, help='Número de procesos para calcular las rachas.')
+    parser.add_argument('--motor', choices=['sqlite', 'duckdb'], default='sqlite', help='Motor del análisis que se mide.')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Número de corridas (se reporta la mediana de los tiempos).')
+    parser.add_argument('--reporte', type=str, help='Archivo JSON donde se guarda el reporte.')
+    parser.add_argument('--comparar', type=str, help='Reporte JSON base con el que se comparan los resultados.')
+    parser.add_argument('--sin_memoria', action='store_true', help='No mide la memoria (tracemalloc), para tiempos sin su sobrecosto.')
+    parser.add_argument('--verbose', action='store_true', help='Muestra la salida de cada etapa.')
+    args = parser.parse_args()
+
+    df_historia, df_retiros = generate_portfolio_from_args(args)
+    fecha_base_str = args.fecha_base or pd.date_range(args.fecha_inicio, periods=args.meses, freq='ME')[args.meses // 2].strftime('%Y-%m-%d')
+    print(f"Cartera sintética: {df_historia['identificacion'].nunique()} clientes, {len(df_historia)} saldos, {len(df_retiros)} retiros. Fecha base: {fecha_base_str}")
+
+    if not args.sin_memoria:
+        tracemalloc.start()
+    corridas = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for _ in range(args.repeticiones):
+            if args.motor == 'duckdb':
+                corridas.append(run_pipeline_duckdb(df_historia, df_retiros, fecha_base_str, args.min_racha, work_dir, args.verbose))
+            else:
+                corridas.append(run_pipeline(df_historia, df_retiros, fecha_base_str, args.min_racha, args.workers, work_dir, args.verbose))
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    reporte = {
+        'parametros': {**vars(args), 'fecha_base': fecha_base_str},
+        'saldos': len(df_historia),
+        'python': sys.version.split()[0],
+        'etapas': summarize_runs(corridas)
+    }
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+    print_report(reporte, base)
+
+    if args.reporte:
+        os.makedirs(os.path.dirname(os.path.abspath(args.reporte)), exist_ok=True)
+        with open(args.reporte, 'w', encoding='utf-8') as archivo:
+            json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+        print(f"Reporte guardado en {args.reporte}")
+
+if __name__ == "__main__":
+    main()
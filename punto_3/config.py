@@ -1,8 +1,47 @@
 DB_FILE = "./data/saldos_clientes.db"
+# Motor del análisis: 'sqlite' o 'duckdb' (requiere el paquete duckdb, ver duckdb_backend.py)
+ANALYTICS_ENGINE = 'sqlite'
+DUCKDB_FILE = "./data/saldos_clientes.duckdb"
+# Opciones de DuckDB (SET). Por defecto usa todos los núcleos; con memory_limit y temp_directory
+# vuelca a disco los datos que no caben en memoria (None deja el valor por defecto de DuckDB)
+DUCKDB_SETTINGS = {
+    'threads': None,
+    'memory_limit': None,
+    'temp_directory': "./data/duckdb_tmp",
+}
+# PRAGMAs que se aplican a cada sesión de la base de datos (ver `DatabaseSession`)
+DB_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -65536,  # en KiB (64 MiB)
+}
+# Filas por bloque al recorrer consultas con fetchmany y sentencias preparadas que se conservan por conexión
+DB_FETCH_SIZE = 10000
+DB_STATEMENT_CACHE_SIZE = 256
 
 EXCEL_FILE_PATH = "rachas/rachas.xlsx"
 EXCEL_SHEET_HISTORIA = "historia"
 EXCEL_SHEET_RETIROS = "retiros" 
+# Motor de lectura del Excel: None usa 'calamine' si está instalado, si no 'openpyxl'
+EXCEL_ENGINE = None
+# Directorio del caché Parquet del Excel (usado con --parquet_cache)
+PARQUET_CACHE_DIR = "./data/cache"
+
+# Bandas de niveles de deuda: (límite inferior incluido, etiqueta). Cada banda llega hasta el
+# límite de la siguiente (excluido) y la última no tiene tope; los saldos negativos son 'Desconocido'.
+NIVELES_DEUDA = [
+    (0, 'N0'),
+    (300000, 'N1'),
+    (1000000, 'N2'),
+    (3000000, 'N3'),
+    (5000000, 'N4'),
+]
 
 CSV_OUTPUT_DIR = "./output_results"
-CSV_FILE_NAME = "debt_streaks_results.csv" 
+CSV_FILE_NAME = "debt_streaks_results.csv"
+CSV_BATCH_FILE_NAME = "debt_streaks_batch_results.csv"
+# Filas por lote al insertar/exportar resultados y tamaño de la muestra que se imprime en consola
+RESULTS_BATCH_SIZE = 10000
+CONSOLE_SAMPLE_SIZE = 10
+# Filas por página al consultar la clasificación de niveles de deuda (paginación por clave)
+DEBT_LEVEL_PAGE_SIZE = 5000
@@ -1,5 +1,7 @@
 import sqlite3
 import os
+from contextlib import contextmanager
+from config import DB_PRAGMAS, DB_FETCH_SIZE, DB_STATEMENT_CACHE_SIZE
 
 def create_connection(db_file):
     """
@@ -14,41 +16,192 @@ def create_connection(db_file):
     connection = None
     try:
         os.makedirs(os.path.dirname(db_file), exist_ok=True)
-        connection = sqlite3.connect(db_file)
+        connection = sqlite3.connect(db_file, cached_statements=DB_STATEMENT_CACHE_SIZE)
         print(f"Conexión a SQLite exitosa: {db_file}")
     except sqlite3.Error as e:
         print(f"Error al conectar a SQLite: {e}")
     return connection
 
-def execute_query(connection, query, data=None):
+def returns_rows(cursor):
     """
-    Ejecuta una consulta SQL en la base de datos.
+    Indica si la última sentencia ejecutada en el cursor devuelve filas (SELECT, WITH ... SELECT,
+    PRAGMA, ... RETURNING), según la descripción de columnas del cursor.
+    """
+    return cursor.description is not None
+
+class DatabaseSession:
+    """
+    Sesión sobre una conexión SQLite con transacciones explícitas.
+
+    Fuera de `transaction()` cada sentencia se confirma sola (modo autocommit); dentro,
+    todas las sentencias se confirman o se revierten juntas al salir del bloque. Las
+    lecturas se pueden recorrer por bloques de `fetch_size` filas con `iter_rows` sin
+    cargarlas completas en memoria. Las sentencias se reutilizan desde la caché de
+    sentencias preparadas de la conexión, por lo que conviene usar siempre el mismo
+    texto SQL con parámetros `?` en lugar de interpolar valores.
+    """
+    def __init__(self, connection, pragmas=None, fetch_size=DB_FETCH_SIZE):
+        """
+        Args:
+            connection (connection object): Objeto de conexión a la base de datos.
+            pragmas (dict, optional): PRAGMAs a aplicar a la conexión ({nombre: valor}).
+            fetch_size (int, optional): Número de filas por bloque en `iter_rows`.
+        """
+        self.connection = connection
+        self.connection.isolation_level = None
+        self.fetch_size = fetch_size
+        self._depth = 0
+        for name, value in (pragmas or {}).items():
+            self.connection.execute(f"PRAGMA {name} = {value};")
+
+    @contextmanager
+    def transaction(self):
+        """
+        Abre un bloque transaccional. Si el bloque termina con una excepción se revierte
+        y la excepción se propaga. Los bloques anidados usan SAVEPOINTs, de modo que un
+        error en un bloque interno solo revierte ese bloque.
+        """
+        depth = self._depth
+        self.connection.execute("BEGIN;" if depth == 0 else f"SAVEPOINT nivel_{depth};")
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth = depth
+            if depth == 0:
+                self.connection.execute("ROLLBACK;")
+            else:
+                self.connection.execute(f"ROLLBACK TO nivel_{depth};")
+                self.connection.execute(f"RELEASE nivel_{depth};")
+            raise
+        else:
+            self._depth = depth
+            self.connection.execute("COMMIT;" if depth == 0 else f"RELEASE nivel_{depth};")
+
+    @property
+    def in_transaction(self):
+        return self._depth > 0
+
+    def execute(self, query, params=()):
+        """
+        Ejecuta una sentencia que no devuelve filas (INSERT, UPDATE, DELETE, DDL).
+
+        Returns:
+            int: Número de filas modificadas (-1 si no aplica).
+        """
+        cursor = self.connection.execute(query, params)
+        try:
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def executemany(self, query, rows):
+        """
+        Ejecuta una sentencia parametrizada para cada fila de `rows` (puede ser un generador)
+        dentro de una transacción.
+
+        Returns:
+            int: Número de filas modificadas.
+        """
+        with self.transaction():
+            cursor = self.connection.executemany(query, rows)
+            try:
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    def execute_statements(self, *queries):
+        """
+        Ejecuta varias sentencias en una sola transacción, informando del error si alguna falla.
+
+        Returns:
+            bool: True si todas se ejecutaron, False en caso de error (se revierten todas).
+        """
+        try:
+            with self.transaction():
+                for query in queries:
+                    self.execute(query)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error al ejecutar la consulta: {e}")
+            return False
+
+    def iter_chunks(self, query, params=(), fetch_size=None):
+        """
+        Recorre el resultado de una consulta por bloques de `fetch_size` filas (`fetchmany`),
+        para procesar cada bloque de forma vectorizada.
+
+        Yields:
+            list: Bloque de filas del resultado.
+        """
+        cursor = self.connection.execute(query, params)
+        try:
+            if not returns_rows(cursor):
+                return
+            while True:
+                rows = cursor.fetchmany(fetch_size or self.fetch_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    def iter_rows(self, query, params=(), fetch_size=None):
+        """
+        Recorre las filas de una consulta por bloques de `fetch_size` filas (ver `iter_chunks`).
+
+        Yields:
+            tuple: Cada fila del resultado.
+        """
+        for rows in self.iter_chunks(query, params, fetch_size):
+            yield from rows
+
+    def fetch_all(self, query, params=()):
+        """
+        Devuelve todas las filas de una consulta (para resultados acotados).
+        """
+        return list(self.iter_rows(query, params))
+
+    def fetch_one(self, query, params=()):
+        """
+        Devuelve la primera fila de una consulta, o None si no hay filas.
+        """
+        cursor = self.connection.execute(query, params)
+        try:
+            return cursor.fetchone() if returns_rows(cursor) else None
+        finally:
+            cursor.close()
+
+    def fetch_value(self, query, params=()):
+        """
+        Devuelve la primera columna de la primera fila de una consulta, o None si no hay filas.
+        """
+        row = self.fetch_one(query, params)
+        return row[0] if row else None
+
+    def close(self):
+        close_connection(self.connection)
+
+def create_session(db_file, pragmas=DB_PRAGMAS):
+    """
+    Abre una conexión con la base de datos y crea una sesión sobre ella.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
-        query (str): Consulta SQL a ejecutar.
-        data (tuple, optional): Datos a insertar en la consulta (para consultas parametrizadas).
+        db_file (str): Ruta al archivo de la base de datos SQLite.
+        pragmas (dict, optional): PRAGMAs a aplicar a la conexión.
 
     Returns:
-        tuple: Las filas resultantes si la consulta es un SELECT, True para otras operaciones, False en caso de error.
+        DatabaseSession: La sesión si la conexión es exitosa, None en caso de error.
     """
-    cursor = connection.cursor()
+    connection = create_connection(db_file)
+    if connection is None:
+        return None
     try:
-        if data:
-            cursor.execute(query, data)
-        else:
-            cursor.execute(query)
-        
-        if query.strip().upper().startswith("SELECT"):
-            return cursor.fetchall()
-        connection.commit()
-        #print("Consulta ejecutada exitosamente")
-        return True
+        return DatabaseSession(connection, pragmas=pragmas)
     except sqlite3.Error as e:
-        print(f"Error al ejecutar la consulta: {e}")
-        return False
-    finally:
-        cursor.close()
+        print(f"Error al configurar la conexión a SQLite: {e}")
+        connection.close()
+        return None
 
 def close_connection(connection):
     """
@@ -61,30 +214,35 @@ def close_connection(connection):
         connection.close()
         print("Conexión a SQLite cerrada")
 
-def create_table_saldos_clientes_if_not_exists(connection):
+def create_table_saldos_clientes_if_not_exists(session):
     """
     Crea la tabla `saldos_clientes` en la base de datos si no existe.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
+        session (DatabaseSession): Sesión de la base de datos.
     """
     create_table_query = """
     CREATE TABLE IF NOT EXISTS saldos_clientes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         identificacion TEXT NOT NULL,
         fecha DATE,
-        saldo DECIMAL
+        saldo DECIMAL,
+        relleno INTEGER NOT NULL DEFAULT 0
     );
     """
-    if execute_query(connection, create_table_query):
+    create_index_query = """
+    CREATE INDEX IF NOT EXISTS idx_saldos_clientes_identificacion_fecha
+    ON saldos_clientes (identificacion, fecha);
+    """
+    if session.execute_statements(create_table_query, create_index_query):
         print("Tabla 'saldos_clientes' verificada/creada exitosamente.")
 
-def create_table_retiros_if_not_exists(connection):
+def create_table_retiros_if_not_exists(session):
     """
     Crea la tabla `retiros` en la base de datos si no existe.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
+        session (DatabaseSession): Sesión de la base de datos.
     """
     create_table_query = """
     CREATE TABLE IF NOT EXISTS retiros (
@@ -93,15 +251,15 @@ def create_table_retiros_if_not_exists(connection):
         fecha_retiro DATE
     );
     """
-    if execute_query(connection, create_table_query):
+    if session.execute_statements(create_table_query):
         print("Tabla 'retiros' verificada/creada exitosamente.")
 
-def create_debt_streaks_table_if_not_exists(connection):
+def create_debt_streaks_table_if_not_exists(session):
     """
     Crea la tabla `debt_streaks_results` en la base de datos si no existe.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
+        session (DatabaseSession): Sesión de la base de datos.
     """
     create_table_query = """
     CREATE TABLE IF NOT EXISTS debt_streaks_results (
@@ -112,5 +270,83 @@ def create_debt_streaks_table_if_not_exists(connection):
         nivel TEXT
     );
     """
-    if execute_query(connection, create_table_query):
-        print("Tabla 'debt_streaks_results' verificada/creada exitosamente.") 
\ No newline at end of file
+    if session.execute_statements(create_table_query):
+        print("Tabla 'debt_streaks_results' verificada/creada exitosamente.")
+
+def create_incremental_state_tables_if_not_exist(session):
+    """
+    Crea las tablas que mantienen el estado del modo incremental si no existen:
+    `estado_incremental` (fecha_base con la que se construyó el estado),
+    `meses_cargados` (cortes de mes ya ingeridos desde el Excel) y
+    `rachas_estado` (racha abierta y mejor racha cerrada de cada cliente, con el nivel
+    guardado como código entero de `debt_levels`).
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+    """
+    create_table_queries = [
+        """
+        CREATE TABLE IF NOT EXISTS estado_incremental (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            fecha_base DATE NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS meses_cargados (
+            corte_mes DATE PRIMARY KEY
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rachas_estado (
+            identificacion TEXT PRIMARY KEY,
+            abierta_nivel INTEGER NOT NULL,
+            abierta_inicio DATE NOT NULL,
+            abierta_fin DATE NOT NULL,
+            abierta_racha INTEGER NOT NULL,
+            mejor_nivel INTEGER,
+            mejor_fin DATE,
+            mejor_racha INTEGER
+        );
+        """
+    ]
+    if session.execute_statements(*create_table_queries):
+        print("Tablas de estado incremental verificadas/creadas exitosamente.")
+
+def create_clients_shard_table_if_not_exists(session):
+    """
+    Crea la tabla `clientes_shard` (asignación de cada cliente a un shard para el
+    cálculo paralelo de rachas) si no existe.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS clientes_shard (
+        identificacion TEXT PRIMARY KEY,
+        shard INTEGER NOT NULL
+    );
+    """
+    create_index_query = "CREATE INDEX IF NOT EXISTS idx_clientes_shard_shard ON clientes_shard (shard);"
+    if session.execute_statements(create_table_query, create_index_query):
+        print("Tabla 'clientes_shard' verificada/creada exitosamente.")
+
+def create_debt_streaks_batch_table_if_not_exists(session):
+    """
+    Crea la tabla `debt_streaks_batch_results` (rachas por fecha_base del modo por lotes)
+    en la base de datos si no existe.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS debt_streaks_batch_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha_base DATE NOT NULL,
+        identificacion TEXT NOT NULL,
+        racha INTEGER,
+        fecha_fin DATE,
+        nivel TEXT
+    );
+    """
+    if session.execute_statements(create_table_query):
+        print("Tabla 'debt_streaks_batch_results' verificada/creada exitosamente.")
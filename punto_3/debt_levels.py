@@ -0,0 +1,77 @@
+import numpy as np
+from config import NIVELES_DEUDA
+
+# Código del nivel de los saldos que no caen en ninguna banda (negativos o nulos)
+NIVEL_DESCONOCIDO = -1
+ETIQUETA_DESCONOCIDO = 'Desconocido'
+
+def get_level_bands(niveles=NIVELES_DEUDA):
+    """
+    Construye la tabla de bandas de niveles de deuda.
+
+    Args:
+        niveles (list, optional): Lista de tuplas (límite_inferior, etiqueta) ordenada por límite.
+                                  Cada banda va desde su límite inferior (incluido) hasta el
+                                  límite de la siguiente (excluido); la última no tiene tope.
+
+    Returns:
+        tuple: (límites como array float64, etiquetas como tupla). El código de cada nivel es
+               su posición en la tabla.
+    """
+    limites = np.array([limite for limite, _ in niveles], dtype=np.float64)
+    if np.any(np.diff(limites) <= 0):
+        raise ValueError("Los límites de los niveles de deuda deben ser estrictamente crecientes.")
+    if len(niveles) > np.iinfo(np.int8).max:
+        raise ValueError("Se admiten como máximo 127 niveles de deuda.")
+    return limites, tuple(etiqueta for _, etiqueta in niveles)
+
+def classify_saldos(saldos, niveles=NIVELES_DEUDA):
+    """
+    Clasifica un vector de saldos en códigos de nivel de deuda con `numpy.searchsorted`.
+
+    Args:
+        saldos (array-like): Saldos a clasificar; None/NaN se clasifican como desconocidos.
+        niveles (list, optional): Tabla de bandas (ver `get_level_bands`).
+
+    Returns:
+        ndarray: Códigos int8 (0 = primera banda, ..., NIVEL_DESCONOCIDO si no cae en ninguna).
+    """
+    limites, _ = get_level_bands(niveles)
+    saldos = np.asarray(saldos, dtype=np.float64)
+    codigos = np.searchsorted(limites, saldos, side='right').astype(np.int8) - 1
+    codigos[np.isnan(saldos)] = NIVEL_DESCONOCIDO
+    return codigos
+
+def get_level_label(codigo, niveles=NIVELES_DEUDA):
+    """
+    Devuelve la etiqueta (ej. 'N2') de un código de nivel de deuda.
+    """
+    if codigo == NIVEL_DESCONOCIDO:
+        return ETIQUETA_DESCONOCIDO
+    return niveles[codigo][1]
+
+def get_level_range_sql(etiqueta, columna='saldo', niveles=NIVELES_DEUDA):
+    """
+    Genera la condición SQL de rango que cumplen los saldos de un nivel (ej. para 'N1':
+    `saldo >= 300000 AND saldo < 1000000`), de modo que los filtros por nivel comparan
+    directamente la columna de saldo.
+    """
+    limites, etiquetas = get_level_bands(niveles)
+    if etiqueta == ETIQUETA_DESCONOCIDO:
+        return f"({columna} IS NULL OR {columna} < {limites[0]:.15g})"
+    if etiqueta not in etiquetas:
+        raise ValueError(f"Nivel de deuda desconocido: {etiqueta}")
+    indice = etiquetas.index(etiqueta)
+    condicion = f"{columna} >= {limites[indice]:.15g}"
+    if indice + 1 < len(limites):
+        condicion += f" AND {columna} < {limites[indice + 1]:.15g}"
+    return condicion
+
+def get_debt_level_case_sql(columna='saldo', niveles=NIVELES_DEUDA):
+    """
+    Genera la expresión SQL CASE equivalente a `classify_saldos` que devuelve la etiqueta
+    del nivel, para las consultas que clasifican directamente en la base de datos.
+    """
+    _, etiquetas = get_level_bands(niveles)
+    condiciones = [f"WHEN {get_level_range_sql(etiqueta, columna, niveles)} THEN '{etiqueta}'" for etiqueta in etiquetas]
+    return "CASE " + " ".join(condiciones) + f" ELSE '{ETIQUETA_DESCONOCIDO}' END"
@@ -0,0 +1,316 @@
+import os
+from debt_levels import get_debt_level_case_sql
+from month_calendar import to_day_number, day_to_iso
+from results_sink import print_streak_summary
+from logic import MAX_DIAS_ENTRE_SALDOS
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+def create_duckdb_connection(db_file, settings=None):
+    """
+    Crea una conexión a una base de datos DuckDB y aplica sus opciones (SET). Con
+    `memory_limit` y `temp_directory` DuckDB vuelca a disco lo que no cabe en memoria,
+    de modo que el análisis puede procesar carteras más grandes que la RAM.
+
+    Args:
+        db_file (str): Ruta al archivo de la base de datos DuckDB.
+        settings (dict, optional): Opciones de DuckDB, ej. {'threads': 4, 'memory_limit': '2GB'}.
+
+    Returns:
+        DuckDBPyConnection: Objeto de conexión, o None si DuckDB no está instalado o hay un error.
+    """
+    if duckdb is None:
+        print("El motor DuckDB requiere el paquete duckdb (pip install duckdb).")
+        return None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        connection = duckdb.connect(db_file)
+        for nombre, valor in (settings or {}).items():
+            if valor is None:
+                continue
+            if nombre == 'temp_directory':
+                os.makedirs(valor, exist_ok=True)
+            connection.execute(f"SET {nombre} = {valor!r};" if isinstance(valor, str) else f"SET {nombre} = {valor};")
+        print(f"Conexión a DuckDB exitosa: {db_file}")
+        return connection
+    except duckdb.Error as e:
+        print(f"Error al conectar a DuckDB: {e}")
+        return None
+
+def close_duckdb_connection(connection):
+    """
+    Cierra la conexión a la base de datos DuckDB.
+    """
+    if connection:
+        connection.close()
+        print("Conexión a DuckDB cerrada")
+
+def create_duckdb_tables(connection):
+    """
+    Crea las tablas `saldos_clientes`, `retiros` y `debt_streaks_results` con las mismas
+    columnas que en SQLite. El `id` de los saldos es su posición en el origen y desempata,
+    como el rowid de SQLite, los saldos de un cliente con la misma fecha.
+    """
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS saldos_clientes (
+        id BIGINT NOT NULL,
+        identificacion VARCHAR NOT NULL,
+        fecha DATE,
+        saldo DOUBLE,
+        relleno INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS retiros (
+        id BIGINT NOT NULL,
+        identificacion VARCHAR,
+        fecha_retiro DATE
+    );
+    """)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS debt_streaks_results (
+        id BIGINT NOT NULL,
+        identificacion VARCHAR NOT NULL,
+        racha INTEGER,
+        fecha_fin DATE,
+        nivel VARCHAR
+    );
+    """)
+    print("Tablas 'saldos_clientes', 'retiros' y 'debt_streaks_results' verificadas/creadas exitosamente en DuckDB.")
+
+def load_dataframes_into_duckdb(connection, df_historia, df_retiros):
+    """
+    Carga en DuckDB las hojas 'historia' y 'retiros' ya leídas del Excel (o de su caché Parquet).
+    DuckDB lee los DataFrames directamente, sin convertirlos fila a fila.
+
+    Args:
+        connection (DuckDBPyConnection): Conexión a DuckDB.
+        df_historia (DataFrame): Saldos con identificacion, corte_mes y saldo (o None).
+        df_retiros (DataFrame): Retiros con identificacion y fecha_retiro (o None).
+    """
+    if df_historia is not None:
+        historia = df_historia[['corte_mes', 'saldo']].assign(identificacion=df_historia['identificacion'].astype(str), fila=range(1, len(df_historia) + 1))
+        connection.register('historia_origen', historia)
+        load_saldos_into_duckdb(connection, "SELECT fila, identificacion, corte_mes, saldo FROM historia_origen")
+        connection.unregister('historia_origen')
+    if df_retiros is not None:
+        retiros = df_retiros[['fecha_retiro']].assign(identificacion=df_retiros['identificacion'].astype(str), fila=range(1, len(df_retiros) + 1))
+        connection.register('retiros_origen', retiros)
+        load_retiros_into_duckdb(connection, "SELECT fila, identificacion, fecha_retiro FROM retiros_origen")
+        connection.unregister('retiros_origen')
+
+def load_parquet_into_duckdb(connection, parquet_dir):
+    """
+    Carga en DuckDB `historia.parquet` y `retiros.parquet` de `parquet_dir` (como los escribe
+    synthetic.py). DuckDB los lee por bloques, sin pasar por pandas ni cargarlos completos en memoria.
+    """
+    for nombre, cargar in (('historia', load_saldos_into_duckdb), ('retiros', load_retiros_into_duckdb)):
+        path = os.path.join(parquet_dir, f"{nombre}.parquet").replace("'", "''")
+        columnas = "identificacion, corte_mes, saldo" if nombre == 'historia' else "identificacion, fecha_retiro"
+        cargar(connection, f"SELECT file_row_number + 1 AS fila, {columnas} FROM read_parquet('{path}', file_row_number = true)")
+
+def load_saldos_into_duckdb(connection, origen):
+    """
+    Inserta en `saldos_clientes` las filas (fila, identificacion, corte_mes, saldo) de la consulta `origen`.
+    Los saldos NaN se guardan como NULL, igual que en SQLite.
+    """
+    try:
+        connection.execute(f"""
+        INSERT INTO saldos_clientes (id, identificacion, fecha, saldo)
+        SELECT fila, CAST(identificacion AS VARCHAR), CAST(corte_mes AS DATE),
+               CASE WHEN isnan(CAST(saldo AS DOUBLE)) THEN NULL ELSE CAST(saldo AS DOUBLE) END
+        FROM ({origen});
+        """)
+    except duckdb.Error as e:
+        print(f"Error al insertar los datos en DuckDB: {e}")
+        return
+    print("Datos insertados en la base de datos DuckDB exitosamente.")
+
+def load_retiros_into_duckdb(connection, origen):
+    """
+    Inserta en `retiros` las filas (fila, identificacion, fecha_retiro) de la consulta `origen`.
+    """
+    try:
+        connection.execute(f"""
+        INSERT INTO retiros (id, identificacion, fecha_retiro)
+        SELECT fila, CAST(identificacion AS VARCHAR), CAST(fecha_retiro AS DATE)
+        FROM ({origen});
+        """)
+    except duckdb.Error as e:
+        print(f"Error al insertar los datos de retiros en DuckDB: {e}")
+        return
+    print("Datos de retiros insertados en la base de datos DuckDB exitosamente.")
+
+def fill_missing_saldos_with_n0_duckdb(connection, fecha_base=None):
+    """
+    Equivalente en SQL de `fill_missing_saldos_with_n0`: inserta un saldo 0 (relleno) el día 1
+    de cada mes sin saldo desde la primera aparición del cliente hasta el mes de la fecha_base,
+    salvo los meses cuyo día 1 es posterior a la fecha de retiro. Se resuelve en una sola
+    sentencia: `generate_series` produce los meses de cada cliente y un ANTI JOIN descarta
+    los que ya tienen saldo.
+
+    Args:
+        connection (DuckDBPyConnection): Conexión a DuckDB.
+        fecha_base (Timestamp | str, optional): Fecha base; si es None se usa la fecha máxima de los saldos.
+    """
+    print("\n--- Rellenando saldos faltantes con N0 (DuckDB) ---")
+    if fecha_base is None:
+        fecha_base = connection.execute("SELECT MAX(fecha) FROM saldos_clientes;").fetchone()[0]
+        if fecha_base is None:
+            print("No se pudo determinar la fecha base. Saliendo del rellenado de saldos.")
+            return
+    query = """
+    INSERT INTO saldos_clientes (id, identificacion, fecha, saldo, relleno)
+    WITH clientes AS (
+        SELECT s.identificacion, MIN(s.fecha) AS primera_fecha, MAX(r.fecha_retiro) AS fecha_retiro
+        FROM saldos_clientes s
+        LEFT JOIN retiros r ON s.identificacion = r.identificacion
+        GROUP BY s.identificacion
+    ),
+    meses AS (
+        SELECT identificacion, fecha_retiro,
+               CAST(unnest(generate_series(date_trunc('month', primera_fecha), date_trunc('month', CAST(? AS DATE)), INTERVAL 1 MONTH)) AS DATE) AS mes
+        FROM clientes
+    ),
+    meses_con_saldo AS (
+        SELECT DISTINCT identificacion, CAST(date_trunc('month', fecha) AS DATE) AS mes
+        FROM saldos_clientes
+    )
+    SELECT
+        (SELECT COALESCE(MAX(id), 0) FROM saldos_clientes) + row_number() OVER (ORDER BY m.identificacion, m.mes),
+        m.identificacion, m.mes, 0, 1
+    FROM meses m
+    ANTI JOIN meses_con_saldo e ON m.identificacion = e.identificacion AND m.mes = e.mes
+    WHERE m.fecha_retiro IS NULL OR m.mes <= m.fecha_retiro;
+    """
+    try:
+        connection.execute(query, [day_to_iso(to_day_number(fecha_base))])
+    except duckdb.Error as e:
+        print(f"Error al insertar los saldos N0: {e}")
+        return
+    print("Relleno de saldos faltantes completado.")
+
+def get_streaks_query_duckdb():
+    """
+    Genera la consulta que calcula, por cliente, la racha más larga entre la fecha_base y la
+    fecha máxima (parámetros $fecha_base, $fecha_hasta y $min_racha) como un problema de
+    "gaps and islands": un saldo inicia una racha nueva si cambia de nivel o si está a más de
+    MAX_DIAS_ENTRE_SALDOS días del anterior, y la suma acumulada de esos inicios numera las
+    rachas. Desempata igual que `select_longest_streak`: la más larga, luego la de fecha_fin más
+    cercana a la fecha_base y luego la primera.
+    """
+    return f"""
+    WITH clasificados AS (
+        SELECT identificacion, fecha, id, {get_debt_level_case_sql()} AS nivel
+        FROM saldos_clientes
+        WHERE fecha >= CAST($fecha_base AS DATE) AND fecha <= CAST($fecha_hasta AS DATE)
+    ),
+    inicios AS (
+        SELECT identificacion, fecha, id, nivel,
+               CASE WHEN nivel = lag(nivel) OVER cliente
+                         AND fecha - lag(fecha) OVER cliente <= {MAX_DIAS_ENTRE_SALDOS}
+                    THEN 0 ELSE 1 END AS inicio
+        FROM clasificados
+        WINDOW cliente AS (PARTITION BY identificacion ORDER BY fecha, id)
+    ),
+    islas AS (
+        SELECT identificacion, fecha, nivel,
+               SUM(inicio) OVER (PARTITION BY identificacion ORDER BY fecha, id ROWS UNBOUNDED PRECEDING) AS isla
+        FROM inicios
+    ),
+    rachas AS (
+        SELECT identificacion, isla, any_value(nivel) AS nivel, COUNT(*) AS racha, MAX(fecha) AS fecha_fin
+        FROM islas
+        GROUP BY identificacion, isla
+    )
+    SELECT identificacion, racha, fecha_fin, nivel
+    FROM rachas
+    WHERE racha >= $min_racha
+    QUALIFY row_number() OVER (PARTITION BY identificacion ORDER BY racha DESC, abs(fecha_fin - CAST($fecha_base AS DATE)) ASC, isla ASC) = 1
+    """
+
+def find_longest_debt_streak_duckdb(connection, fecha_base_str, min_racha_length):
+    """
+    Identifica la racha de deuda más larga de cada cliente desde la fecha_base y la guarda en
+    `debt_streaks_results`, con los mismos resultados que `find_longest_debt_streak`.
+
+    Args:
+        connection (DuckDBPyConnection): Conexión a DuckDB.
+        fecha_base_str (str): Fecha base en formato YYYY-MM-DD.
+        min_racha_length (int): Longitud mínima de la racha.
+
+    Returns:
+        int: Número de rachas guardadas, o None si no hay datos para la fecha base.
+    """
+    print(f"\n--- Identificando rachas de deuda para fecha_base (inicio): {fecha_base_str} y racha mínima: {min_racha_length} (DuckDB) ---")
+
+    fecha_base = to_day_number(fecha_base_str)
+    max_db_date_result = connection.execute("SELECT MAX(fecha) FROM saldos_clientes;").fetchone()[0]
+    max_db_date = to_day_number(max_db_date_result) if max_db_date_result is not None else None
+
+    if max_db_date is None or fecha_base > max_db_date:
+        print(f"La fecha base ({fecha_base_str}) es posterior a la fecha máxima de datos disponibles en la base de datos ({day_to_iso(max_db_date) if max_db_date is not None else 'N/A'}). No se pueden encontrar rachas.")
+        return
+    parametros = {'fecha_base': day_to_iso(fecha_base), 'fecha_hasta': day_to_iso(max_db_date)}
+    hay_saldos = connection.execute(
+        "SELECT 1 FROM saldos_clientes WHERE fecha >= CAST($fecha_base AS DATE) AND fecha <= CAST($fecha_hasta AS DATE) LIMIT 1;",
+        parametros
+    ).fetchone()
+    if hay_saldos is None:
+        print("No se encontraron datos clasificados para la fecha base y el rango especificados.")
+        return
+
+    try:
+        connection.execute("DELETE FROM debt_streaks_results;")
+        connection.execute(f"""
+        INSERT INTO debt_streaks_results (id, identificacion, racha, fecha_fin, nivel)
+        SELECT row_number() OVER (ORDER BY identificacion), identificacion, racha, fecha_fin, nivel
+        FROM ({get_streaks_query_duckdb()});
+        """, {**parametros, 'min_racha': min_racha_length})
+    except duckdb.Error as e:
+        print(f"Error al calcular las rachas de deuda: {e}")
+        return
+    return connection.execute("SELECT COUNT(*) FROM debt_streaks_results;").fetchone()[0]
+
+def export_streak_results_duckdb(connection, output_dir, file_name, output_format='csv', sample_size=10):
+    """
+    Exporta `debt_streaks_results` con COPY (CSV o Parquet, con las mismas columnas y formato
+    que `StreakResultsSink`) y muestra el resumen de las rachas.
+
+    Returns:
+        str: Ruta del archivo exportado, o None si no hay resultados o hubo un error.
+    """
+    if output_format == 'parquet':
+        file_name = f"{os.path.splitext(file_name)[0]}.parquet"
+        opciones = "FORMAT PARQUET"
+    else:
+        opciones = "FORMAT CSV, HEADER, DELIMITER ',', NEW_LINE '\r\n'"
+    output_path = os.path.join(output_dir, file_name)
+
+    count = connection.execute("SELECT COUNT(*) FROM debt_streaks_results;").fetchone()[0]
+    if count:
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            connection.execute(f"""
+            COPY (
+                SELECT identificacion, CAST(racha AS BIGINT) AS racha, strftime(fecha_fin, '%Y-%m-%d') AS fecha_fin, nivel
+                FROM debt_streaks_results
+                ORDER BY id
+            ) TO '{output_path.replace("'", "''")}' ({opciones});
+            """)
+        except duckdb.Error as e:
+            print(f"Error al exportar los resultados: {e}")
+            return None
+    level_counts = dict(connection.execute("SELECT nivel, COUNT(*) FROM debt_streaks_results GROUP BY nivel;").fetchall())
+    sample = [
+        {'identificacion': identificacion, 'racha': racha, 'fecha_fin': fecha_fin, 'nivel': nivel}
+        for identificacion, racha, fecha_fin, nivel in connection.execute(
+            "SELECT identificacion, racha, strftime(fecha_fin, '%Y-%m-%d'), nivel FROM debt_streaks_results ORDER BY id LIMIT ?;",
+            [sample_size]
+        ).fetchall()
+    ]
+    print_streak_summary(count, level_counts, sample, output_path)
+    return output_path if count else None
@@ -0,0 +1,292 @@
+from database import create_incremental_state_tables_if_not_exist
+from debt_levels import get_level_label
+from month_calendar import parse_dates, to_day_number, day_to_iso, month_of, month_start_day
+from logic import (
+    classify_saldo_rows,
+    insert_data_into_db,
+    insert_retiros_data_into_db,
+    register_affected_clients,
+    fill_missing_saldos_with_n0,
+    new_streak,
+    continues_streak
+)
+
+def has_incremental_state(session, fecha_base_str):
+    """
+    Indica si la base de datos tiene un estado incremental construido para la fecha_base dada.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        fecha_base_str (str): Fecha base en formato YYYY-MM-DD.
+
+    Returns:
+        bool: True si el estado existe y corresponde a la misma fecha_base.
+    """
+    query = "SELECT name FROM sqlite_master WHERE type='table' AND name='estado_incremental';"
+    if session.fetch_one(query) is None:
+        return False
+    result = session.fetch_value("SELECT fecha_base FROM estado_incremental WHERE id = 1;")
+    fecha_base = day_to_iso(to_day_number(fecha_base_str))
+    return result == fecha_base
+
+def _empty_state():
+    return {'abierta': None, 'mejor': None}
+
+def _apply_saldo_to_state(state, fecha, nivel_deuda):
+    """
+    Avanza el estado de rachas de un cliente con un nuevo saldo clasificado.
+    Al cerrarse la racha abierta se conserva como mejor racha si es estrictamente
+    más larga, de modo que ante empates se mantiene la racha más antigua.
+    """
+    abierta = state['abierta']
+    if abierta is not None and continues_streak(abierta, fecha, nivel_deuda):
+        abierta['fecha_fin'] = fecha
+        abierta['racha'] += 1
+        return
+    if abierta is not None and (state['mejor'] is None or abierta['racha'] > state['mejor']['racha']):
+        state['mejor'] = abierta
+    state['abierta'] = new_streak(fecha, nivel_deuda)
+
+def _load_states(session):
+    """
+    Lee de `rachas_estado` el estado de los clientes registrados en `clientes_afectados`.
+    """
+    query = """
+    SELECT
+        e.identificacion, e.abierta_nivel, e.abierta_inicio, e.abierta_fin, e.abierta_racha,
+        e.mejor_nivel, e.mejor_fin, e.mejor_racha
+    FROM
+        rachas_estado e
+    JOIN
+        temp.clientes_afectados a ON e.identificacion = a.identificacion;
+    """
+    rows = session.fetch_all(query)
+    # Las fechas se convierten por columna (números de día, ver month_calendar)
+    inicios = parse_dates(row[2] for row in rows).tolist()
+    fines = parse_dates(row[3] for row in rows).tolist()
+    mejores_fines = parse_dates(row[6] for row in rows).tolist()
+    states = {}
+    for row, inicio, fin, mejor_fin in zip(rows, inicios, fines, mejores_fines):
+        identificacion, nivel, _, _, racha, mejor_nivel, _, mejor_racha = row
+        state = _empty_state()
+        state['abierta'] = {
+            'nivel': nivel,
+            'fecha_inicio': inicio,
+            'fecha_fin': fin,
+            'racha': racha
+        }
+        if mejor_nivel is not None:
+            state['mejor'] = {
+                'nivel': mejor_nivel,
+                'fecha_inicio': None,
+                'fecha_fin': mejor_fin,
+                'racha': mejor_racha
+            }
+        states[identificacion] = state
+    return states
+
+def _save_states(session, states):
+    """
+    Guarda (reemplazando) el estado de rachas de los clientes dados en `rachas_estado`.
+    """
+    upsert_query = """
+    INSERT OR REPLACE INTO rachas_estado (
+        identificacion, abierta_nivel, abierta_inicio, abierta_fin, abierta_racha,
+        mejor_nivel, mejor_fin, mejor_racha
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    upserts = []
+    deletes = []
+    for identificacion, state in states.items():
+        abierta = state['abierta']
+        mejor = state['mejor']
+        if abierta is None:
+            deletes.append((identificacion,))
+            continue
+        upserts.append((
+            identificacion,
+            abierta['nivel'],
+            day_to_iso(abierta['fecha_inicio']),
+            day_to_iso(abierta['fecha_fin']),
+            abierta['racha'],
+            mejor['nivel'] if mejor else None,
+            day_to_iso(mejor['fecha_fin']) if mejor else None,
+            mejor['racha'] if mejor else None
+        ))
+    with session.transaction():
+        session.executemany("DELETE FROM rachas_estado WHERE identificacion = ?;", deletes)
+        session.executemany(upsert_query, upserts)
+
+def _advance_affected_states(session, states):
+    """
+    Recorre, en orden de fecha, los saldos de los clientes afectados a partir de su fecha
+    `desde`, los clasifica por nivel y los aplica sobre su estado de rachas.
+    """
+    query = """
+    SELECT
+        s.identificacion,
+        s.fecha,
+        s.saldo
+    FROM
+        saldos_clientes s
+    JOIN
+        temp.clientes_afectados a ON s.identificacion = a.identificacion
+    WHERE
+        s.fecha >= a.desde
+    ORDER BY
+        s.identificacion, s.fecha;
+    """
+    for identificacion, fecha, nivel_deuda in classify_saldo_rows(session.iter_rows(query)):
+        state = states.setdefault(identificacion, _empty_state())
+        _apply_saldo_to_state(state, fecha, nivel_deuda)
+
+def initialize_incremental_state(session, fecha_base_str):
+    """
+    Construye desde cero el estado incremental a partir de los datos ya cargados y
+    rellenados en la base de datos (tras una ejecución completa).
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        fecha_base_str (str): Fecha base en formato YYYY-MM-DD.
+    """
+    print("\n--- Inicializando estado incremental ---")
+    fecha_base = day_to_iso(to_day_number(fecha_base_str))
+    create_incremental_state_tables_if_not_exist(session)
+    with session.transaction():
+        session.execute("DELETE FROM rachas_estado;")
+        session.execute("DELETE FROM meses_cargados;")
+        session.execute("INSERT OR REPLACE INTO estado_incremental (id, fecha_base) VALUES (1, ?);", (fecha_base,))
+        session.execute("INSERT INTO meses_cargados (corte_mes) SELECT DISTINCT fecha FROM saldos_clientes WHERE relleno = 0;")
+
+        clientes = session.iter_rows("SELECT DISTINCT identificacion FROM saldos_clientes;")
+        register_affected_clients(session, {row[0]: fecha_base for row in clientes})
+        states = {}
+        _advance_affected_states(session, states)
+        _save_states(session, states)
+    print(f"Estado incremental inicializado para {len(states)} clientes.")
+
+def update_incremental(session, df_historia, df_retiros, fecha_base_str):
+    """
+    Ingiere solo los cortes de mes y retiros nuevos, rellena los meses faltantes únicamente
+    de los clientes afectados y actualiza su estado de rachas.
+
+    Los clientes cuyos saldos nuevos son todos posteriores a su racha abierta y caen en meses
+    posteriores a la fecha_base (que no se rellenan) solo extienden su estado; el resto
+    (clientes nuevos, con retiros nuevos o con meses intermedios) se recalculan desde la fecha_base.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        df_historia (DataFrame): Datos de la hoja 'historia'.
+        df_retiros (DataFrame): Datos de la hoja 'retiros'.
+        fecha_base_str (str): Fecha base en formato YYYY-MM-DD.
+    """
+    print("\n--- Actualización incremental ---")
+    # Toda la actualización se confirma o se revierte en una sola transacción
+    with session.transaction():
+        fecha_base = to_day_number(fecha_base_str)
+        fecha_base_iso = day_to_iso(fecha_base)
+
+        # 1. Cortes de mes que aún no se han cargado
+        meses_cargados = {row[0] for row in session.iter_rows("SELECT corte_mes FROM meses_cargados;")}
+        df_nuevos = df_historia[~df_historia['corte_mes'].dt.strftime('%Y-%m-%d').isin(meses_cargados)] if df_historia is not None else None
+        if df_nuevos is not None and not df_nuevos.empty:
+            insert_data_into_db(session, df_nuevos)
+            session.executemany("INSERT INTO meses_cargados (corte_mes) VALUES (?);", ((corte_mes,) for corte_mes in df_nuevos['corte_mes'].dt.strftime('%Y-%m-%d').unique()))
+            print(f"Cortes de mes nuevos ingeridos: {df_nuevos['corte_mes'].nunique()} ({len(df_nuevos)} saldos).")
+        else:
+            print("No hay cortes de mes nuevos para ingerir.")
+
+        # 2. Retiros nuevos o modificados
+        retiros_actuales = {(row[0], row[1]) for row in session.iter_rows("SELECT identificacion, fecha_retiro FROM retiros;")}
+        clientes_retiro = set()
+        if df_retiros is not None and not df_retiros.empty:
+            claves = list(zip(df_retiros['identificacion'].astype(str), df_retiros['fecha_retiro'].dt.strftime('%Y-%m-%d')))
+            df_retiros_nuevos = df_retiros[[clave not in retiros_actuales for clave in claves]]
+            clientes_retiro = set(df_retiros_nuevos['identificacion'].astype(str))
+            session.executemany("DELETE FROM retiros WHERE identificacion = ?;", ((identificacion,) for identificacion in clientes_retiro))
+            if not df_retiros_nuevos.empty:
+                insert_retiros_data_into_db(session, df_retiros_nuevos)
+        print(f"Clientes con retiros nuevos o modificados: {len(clientes_retiro)}")
+
+        # 3. Clasificar los clientes afectados en recalculados y extendidos
+        nuevos_por_cliente = {}
+        if df_nuevos is not None and not df_nuevos.empty:
+            primeras_fechas = df_nuevos.groupby(df_nuevos['identificacion'].astype(str))['corte_mes'].min()
+            nuevos_por_cliente = dict(zip(primeras_fechas.index, parse_dates(primeras_fechas).tolist()))
+
+        afectados = set(nuevos_por_cliente) | clientes_retiro
+        register_affected_clients(session, {identificacion: fecha_base_iso for identificacion in afectados})
+        states = _load_states(session)
+
+        recalcular = {}
+        extender = {}
+        for identificacion in afectados:
+            state = states.get(identificacion)
+            primera_fecha_nueva = nuevos_por_cliente.get(identificacion)
+            if (state is not None and identificacion not in clientes_retiro
+                    and month_start_day(month_of(primera_fecha_nueva)) > fecha_base
+                    and primera_fecha_nueva > state['abierta']['fecha_fin']):
+                extender[identificacion] = day_to_iso(primera_fecha_nueva)
+            else:
+                recalcular[identificacion] = fecha_base_iso
+        print(f"Clientes afectados: {len(afectados)} (extendidos: {len(extender)}, recalculados: {len(recalcular)})")
+
+        # 4. Rellenar con N0 solo los clientes que se recalculan
+        if recalcular:
+            register_affected_clients(session, recalcular)
+            session.execute("DELETE FROM saldos_clientes WHERE relleno = 1 AND identificacion IN (SELECT identificacion FROM temp.clientes_afectados);")
+            fill_missing_saldos_with_n0(session, fecha_base=fecha_base, solo_afectados=True)
+
+        # 5. Actualizar el estado de rachas de los clientes afectados
+        for identificacion in recalcular:
+            states[identificacion] = _empty_state()
+        register_affected_clients(session, {**recalcular, **extender})
+        _advance_affected_states(session, states)
+        _save_states(session, {identificacion: states.get(identificacion, _empty_state()) for identificacion in afectados})
+
+def get_streak_results_from_state(session, min_racha_length):
+    """
+    Obtiene, a partir de `rachas_estado`, la racha más larga de cada cliente (la más antigua
+    ante empates) que cumpla la longitud mínima.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        min_racha_length (int): Longitud mínima de la racha.
+
+    Yields:
+        dict: Resultado con identificacion, racha, fecha_fin y nivel, en orden de identificacion.
+    """
+    query = """
+    SELECT identificacion, racha, fecha_fin, nivel
+    FROM (
+        SELECT
+            identificacion,
+            CASE WHEN COALESCE(mejor_racha, 0) >= abierta_racha THEN mejor_racha ELSE abierta_racha END as racha,
+            CASE WHEN COALESCE(mejor_racha, 0) >= abierta_racha THEN mejor_fin ELSE abierta_fin END as fecha_fin,
+            CASE WHEN COALESCE(mejor_racha, 0) >= abierta_racha THEN mejor_nivel ELSE abierta_nivel END as nivel
+        FROM
+            rachas_estado
+    )
+    WHERE
+        racha >= ?
+    ORDER BY
+        identificacion;
+    """
+    for row in session.iter_rows(query, (min_racha_length,)):
+        yield {'identificacion': row[0], 'racha': row[1], 'fecha_fin': row[2], 'nivel': get_level_label(row[3])}
+
+def find_longest_debt_streak_incremental(session, min_racha_length, sink):
+    """
+    Reemplaza el contenido de `debt_streaks_results` con las rachas derivadas del estado incremental.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        min_racha_length (int): Longitud mínima de la racha.
+        sink (StreakResultsSink): Destino de los resultados (tabla y archivo de salida).
+
+    Returns:
+        int: Número de rachas escritas.
+    """
+    print(f"\n--- Rachas de deuda desde el estado incremental con racha mínima: {min_racha_length} ---")
+    session.execute("DELETE FROM debt_streaks_results;")
+    return sink.write_many(get_streak_results_from_state(session, min_racha_length))
@@ -1,35 +1,131 @@
 import pandas as pd
-from database import execute_query, create_debt_streaks_table_if_not_exists
+from database import DatabaseSession, create_debt_streaks_table_if_not_exists, create_clients_shard_table_if_not_exists
+from config import DB_PRAGMAS, DB_STATEMENT_CACHE_SIZE, DEBT_LEVEL_PAGE_SIZE
 import os
-import csv
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import sqlite3
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from debt_levels import classify_saldos, get_level_label, get_debt_level_case_sql, get_level_range_sql
+from month_calendar import parse_dates, is_nat, to_day_number, day_to_iso, day_to_timestamp, month_of, months_of, month_start_day, month_start_iso, month_range
+
+
+# Columnas y tipos que se leen de cada hoja del Excel de rachas
+HISTORIA_COLUMNS = {
+    'usecols': ['identificacion', 'corte_mes', 'saldo'],
+    'dtype': {'identificacion': str, 'saldo': 'float64'},
+    'parse_dates': ['corte_mes']
+}
+RETIROS_COLUMNS = {
+    'usecols': ['identificacion', 'fecha_retiro'],
+    'dtype': {'identificacion': str},
+    'parse_dates': ['fecha_retiro']
+}
+
+def get_excel_engine(engine=None):
+    """
+    Devuelve el motor de lectura de Excel a usar: el indicado, o `calamine` si
+    el paquete python-calamine está instalado y `openpyxl` en caso contrario.
+    """
+    if engine:
+        return engine
+    return 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+
+def get_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo leyéndolo por bloques.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def read_excel_data(file_path, sheet_name=None):
+def read_excel_sheets(file_path, sheet_specs, engine=None, parquet_cache_dir=None):
     """
-    Lee los datos del archivo Excel.
+    Lee varias hojas del archivo Excel abriendo el libro una sola vez, leyendo solo
+    las columnas necesarias con tipos explícitos.
+
+    Si se indica `parquet_cache_dir` (y pyarrow está instalado), las hojas se guardan
+    como Parquet con el hash del archivo en el nombre, de modo que las siguientes
+    ejecuciones con el mismo Excel no lo vuelven a parsear.
 
     Args:
         file_path (str): Ruta del archivo Excel.
-        sheet_name (str, optional): Nombre de la hoja a leer. Si es None, lee la primera hoja.
+        sheet_specs (dict): Diccionario {nombre_hoja: especificación} con las claves
+                            `usecols`, `dtype` y `parse_dates` de cada hoja.
+        engine (str, optional): Motor de lectura. Si es None se elige con `get_excel_engine`.
+        parquet_cache_dir (str, optional): Directorio del caché Parquet.
 
     Returns:
-        DataFrame: DataFrame de pandas con los datos del Excel.
+        dict: Diccionario {nombre_hoja: DataFrame}, con None en las hojas que no se pudieron leer.
     """
-    try:
-        if sheet_name:
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            print(f"Columnas del archivo Excel: {df.columns.tolist()}")
-            print(f"Datos leídos de {file_path} (hoja '{sheet_name}') exitosamente.")
+    frames = {sheet_name: None for sheet_name in sheet_specs}
+
+    cache_paths = None
+    if parquet_cache_dir:
+        if importlib.util.find_spec('pyarrow'):
+            try:
+                file_hash = get_file_hash(file_path)
+                base_name = os.path.splitext(os.path.basename(file_path))[0]
+                cache_paths = {
+                    sheet_name: os.path.join(parquet_cache_dir, f"{base_name}_{file_hash[:16]}_{sheet_name}.parquet")
+                    for sheet_name in sheet_specs
+                }
+            except IOError as e:
+                print(f"Error al leer el archivo Excel: {e}")
+                return frames
+            if all(os.path.exists(path) for path in cache_paths.values()):
+                for sheet_name, path in cache_paths.items():
+                    frames[sheet_name] = pd.read_parquet(path)
+                print(f"Datos leídos del caché Parquet de {file_path} (hash {file_hash[:16]}).")
+                return frames
         else:
-            df = pd.read_excel(file_path)
-            print(f"Columnas del archivo Excel: {df.columns.tolist()}")
-            print(f"Datos leídos de {file_path} exitosamente.")
-        return df
+            print("pyarrow no está instalado; se omite el caché Parquet.")
+
+    engine = get_excel_engine(engine)
+    try:
+        with pd.ExcelFile(file_path, engine=engine) as workbook:
+            for sheet_name, spec in sheet_specs.items():
+                try:
+                    frames[sheet_name] = workbook.parse(sheet_name, **spec)
+                    print(f"Datos leídos de {file_path} (hoja '{sheet_name}', motor '{engine}') exitosamente.")
+                except Exception as e:
+                    print(f"Error al leer el archivo Excel (hoja '{sheet_name}'): {e}")
     except Exception as e:
-        print(f"Error al leer el archivo Excel (hoja 'historia'): {e}")
-        return None
+        print(f"Error al abrir el archivo Excel {file_path}: {e}")
+        return frames
+
+    if cache_paths and all(df is not None for df in frames.values()):
+        os.makedirs(parquet_cache_dir, exist_ok=True)
+        for sheet_name, path in cache_paths.items():
+            frames[sheet_name].to_parquet(path, index=False)
+        print(f"Caché Parquet guardado en {parquet_cache_dir}.")
+    return frames
 
-def get_client_first_appearance_and_retiro_dates(connection):
-    query = """
+def register_affected_clients(session, clientes):
+    """
+    Registra en la tabla temporal `clientes_afectados` los clientes que deben
+    reprocesarse en una actualización incremental.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        clientes (dict): Diccionario {identificacion: fecha_desde} con la fecha (YYYY-MM-DD)
+                         a partir de la cual se deben releer los saldos de cada cliente.
+    """
+    with session.transaction():
+        session.execute("DROP TABLE IF EXISTS temp.clientes_afectados;")
+        session.execute("CREATE TEMP TABLE clientes_afectados (identificacion TEXT PRIMARY KEY, desde DATE);")
+        session.executemany("INSERT INTO temp.clientes_afectados (identificacion, desde) VALUES (?, ?);", clientes.items())
+
+def get_client_first_appearance_and_retiro_dates(session, solo_afectados=False):
+    filtro_afectados = ""
+    if solo_afectados:
+        filtro_afectados = "WHERE s.identificacion IN (SELECT identificacion FROM temp.clientes_afectados)"
+    query = f"""
     SELECT
         s.identificacion,
         MIN(s.fecha) as first_appearance_date,
@@ -38,269 +134,581 @@ def get_client_first_appearance_and_retiro_dates(connection):
         saldos_clientes s
     LEFT JOIN
         retiros r ON s.identificacion = r.identificacion
+    {filtro_afectados}
     GROUP BY
         s.identificacion, r.fecha_retiro;
     """
-    results = execute_query(connection, query)
-    if results:
-        return {row[0]: {'first_appearance': pd.to_datetime(row[1]), 'fecha_retiro': pd.to_datetime(row[2]) if row[2] else None} for row in results}
-    return {}
+    rows = session.fetch_all(query)
+    # Las fechas se convierten por columna (números de día, ver month_calendar)
+    first_appearances = parse_dates(row[1] for row in rows).tolist()
+    fechas_retiro = parse_dates(row[2] for row in rows)
+    sin_retiro = is_nat(fechas_retiro).tolist()
+    return {
+        row[0]: {'first_appearance': first_appearance, 'fecha_retiro': None if nulo else fecha_retiro}
+        for row, first_appearance, fecha_retiro, nulo in zip(rows, first_appearances, fechas_retiro.tolist(), sin_retiro)
+    }
 
 def get_all_months_between(start_date, end_date):
-    months = []
-    current_date = start_date.replace(day=1)
-    while current_date <= end_date:
-        months.append(current_date)
-        if current_date.month == 12:
-            current_date = current_date.replace(year=current_date.year + 1, month=1)
-        else:
-            current_date = current_date.replace(month=current_date.month + 1)
-    return months
+    """
+    Devuelve el día 1 de cada mes entre dos fechas (Timestamps), desde el mes de `start_date`
+    hasta el último día 1 que no pasa de `end_date`.
+    """
+    end_day = to_day_number(end_date)
+    return [
+        day_to_timestamp(month_start_day(mes))
+        for mes in month_range(month_of(to_day_number(start_date)), month_of(end_day))
+        if month_start_day(mes) <= end_day
+    ]
+
+def iter_client_saldo_months(session, solo_afectados=False):
+    """
+    Recorre los meses con saldo de cada cliente (incluidos los rellenos), leyendo las fechas
+    por bloques y convirtiéndolas a ordinales de mes de forma vectorizada.
 
-def fill_missing_saldos_with_n0(connection, fecha_base=None):
+    Yields:
+        tuple: (identificacion, set de ordinales de mes con saldo), en orden de identificacion.
+    """
+    filtro_afectados = ""
+    if solo_afectados:
+        filtro_afectados = "WHERE identificacion IN (SELECT identificacion FROM temp.clientes_afectados)"
+    query = f"SELECT identificacion, fecha FROM saldos_clientes {filtro_afectados} ORDER BY identificacion;"
+
+    current_id = None
+    months = set()
+    for chunk in session.iter_chunks(query):
+        identificaciones = [row[0] for row in chunk]
+        chunk_months = months_of(parse_dates(row[1] for row in chunk)).tolist()
+        for identificacion, mes in zip(identificaciones, chunk_months):
+            if identificacion != current_id:
+                if current_id is not None:
+                    yield current_id, months
+                current_id = identificacion
+                months = set()
+            months.add(mes)
+    if current_id is not None:
+        yield current_id, months
+
+def fill_missing_saldos_with_n0(session, fecha_base=None, solo_afectados=False):
     print("\n--- Rellenando saldos faltantes con N0 ---")
-    client_dates_info = get_client_first_appearance_and_retiro_dates(connection)
+    client_dates_info = get_client_first_appearance_and_retiro_dates(session, solo_afectados)
 
     if not fecha_base:
         query_max_date = "SELECT MAX(fecha) FROM saldos_clientes;"
-        max_date_result = execute_query(connection, query_max_date)
-        if max_date_result and max_date_result[0][0]:
-            fecha_base = pd.to_datetime(max_date_result[0][0])
+        max_date_result = session.fetch_value(query_max_date)
+        if max_date_result:
+            fecha_base = max_date_result
         else:
             print("No se pudo determinar la fecha base. Saliendo del rellenado de saldos.")
             return
+    # El mes de la fecha_base es el último que se rellena (su día 1 nunca pasa de la fecha_base)
+    mes_base = month_of(to_day_number(fecha_base))
 
-    for identificacion, dates_info in client_dates_info.items():
-        first_appearance = dates_info['first_appearance']
+    fill_rows = []
+    for identificacion, existing_months in iter_client_saldo_months(session, solo_afectados):
+        dates_info = client_dates_info.get(identificacion)
+        if dates_info is None:
+            continue
         fecha_retiro = dates_info['fecha_retiro']
 
-        all_months_for_client = get_all_months_between(first_appearance, fecha_base)
-
-        # Obtener saldos existentes para el cliente
-        query_existing_saldos = "SELECT fecha, saldo FROM saldos_clientes WHERE identificacion = ?;"
-        existing_saldos_raw = execute_query(connection, query_existing_saldos, (identificacion,))
-        existing_saldos = {pd.to_datetime(row[0]).replace(day=1): row[1] for row in existing_saldos_raw}
-
-        for month_date in all_months_for_client:
-            # Si el cliente no tiene un saldo para este mes y la fecha_base no es posterior a la fecha_retiro
-            if month_date not in existing_saldos:
-                should_fill_n0 = True
-                if fecha_retiro and month_date > fecha_retiro:
-                    should_fill_n0 = False
-
-                if should_fill_n0:
-                    # Insertar saldo N0 (0) para el mes faltante
-                    insert_query = "INSERT INTO saldos_clientes (identificacion, fecha, saldo) VALUES (?, ?, ?);"
-                    if not execute_query(connection, insert_query, (identificacion, month_date.strftime('%Y-%m-%d'), 0)):
-                        print(f"Error al insertar saldo N0 para {identificacion} en {month_date.strftime('%Y-%m-%d')}")
+        for mes in month_range(month_of(dates_info['first_appearance']), mes_base):
+            # Si el cliente no tiene un saldo para este mes y el mes no es posterior a la fecha_retiro
+            if mes not in existing_months:
+                if fecha_retiro is not None and month_start_day(mes) > fecha_retiro:
+                    continue
+                # Saldo N0 (0) para el mes faltante
+                fill_rows.append((identificacion, month_start_iso(mes), 0))
+
+    # Insertar todos los saldos N0 en una sola transacción
+    insert_query = "INSERT INTO saldos_clientes (identificacion, fecha, saldo, relleno) VALUES (?, ?, ?, 1);"
+    try:
+        session.executemany(insert_query, fill_rows)
+    except sqlite3.Error as e:
+        print(f"Error al insertar los saldos N0: {e}")
+        return
     print("Relleno de saldos faltantes completado.")
 
 def get_debt_level_classification_query():
-    return """
+    return f"""
     SELECT
         identificacion,
         fecha,
         saldo,
-        CASE
-            WHEN saldo >= 0 AND saldo < 300000 THEN 'N0'
-            WHEN saldo >= 300000 AND saldo < 1000000 THEN 'N1'
-            WHEN saldo >= 1000000 AND saldo < 3000000 THEN 'N2'
-            WHEN saldo >= 3000000 AND saldo < 5000000 THEN 'N3'
-            WHEN saldo >= 5000000 THEN 'N4'
-            ELSE 'Desconocido'
-        END as nivel_deuda
+        {get_debt_level_case_sql()} as nivel_deuda
     FROM
         saldos_clientes
     ORDER BY
         identificacion, fecha;
     """
 
-def classify_debt_levels(connection):
+DEBT_LEVEL_COLUMNS = ['identificacion', 'fecha', 'saldo', 'nivel_deuda']
+DEBT_LEVEL_AGGREGATE_COLUMNS = ['mes', 'nivel_deuda', 'cantidad']
+
+def build_debt_level_filters(niveles=None, identificaciones=None, fecha_desde=None, fecha_hasta=None):
     """
-    Genera una consulta que clasifica los saldos por niveles de deuda y los muestra.
+    Construye las condiciones WHERE (y sus parámetros) de las consultas de clasificación.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
-    """
-    query = get_debt_level_classification_query()
-    results = execute_query(connection, query)
-    if results:
-        print("\n--- Niveles de Deuda ---")
-        for row in results:
-            print(f"Identificacion: {row[0]}, Fecha: {row[1]}, Saldo: {row[2]}, Nivel de Deuda: {row[3]}")
-    else:
-        print("No se encontraron datos para clasificar.")
+        niveles (list, optional): Etiquetas de nivel a incluir (ej. ['N3', 'N4']). Se traducen
+                                  a rangos de saldo de la tabla de niveles.
+        identificaciones (list, optional): Identificaciones de los clientes a incluir.
+        fecha_desde (str, optional): Fecha mínima (incluida) en formato YYYY-MM-DD.
+        fecha_hasta (str, optional): Fecha máxima (incluida) en formato YYYY-MM-DD.
 
-def find_longest_debt_streak(connection, fecha_base_str, min_racha_length):
-    print(f"\n--- Identificando rachas de deuda para fecha_base (inicio): {fecha_base_str} y racha mínima: {min_racha_length} ---")
+    Returns:
+        tuple: (lista de condiciones SQL, lista de parámetros).
+    """
+    conditions = []
+    params = []
+    if niveles:
+        conditions.append("(" + " OR ".join(f"({get_level_range_sql(nivel)})" for nivel in niveles) + ")")
+    if identificaciones:
+        identificaciones = list(identificaciones)
+        conditions.append(f"identificacion IN ({', '.join('?' for _ in identificaciones)})")
+        params.extend(identificaciones)
+    if fecha_desde:
+        conditions.append("fecha >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta:
+        conditions.append("fecha <= ?")
+        params.append(fecha_hasta)
+    return conditions, params
+
+def get_debt_level_page(session, after=None, page_size=DEBT_LEVEL_PAGE_SIZE, **filters):
+    """
+    Obtiene una página de saldos clasificados usando paginación por clave (keyset) sobre
+    `(identificacion, fecha)`; el `id` del saldo desempata las filas con la misma clave.
 
-    fecha_base = pd.to_datetime(fecha_base_str)
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        after (tuple, optional): Clave (identificacion, fecha, id) de la última fila de la página
+                                 anterior. Si es None, se obtiene la primera página.
+        page_size (int, optional): Número máximo de filas de la página.
+        **filters: Filtros de `build_debt_level_filters`.
 
-    # Obtener la fecha máxima en la base de datos para no buscar en el futuro
-    query_max_db_date = "SELECT MAX(fecha) FROM saldos_clientes;"
-    max_db_date_result = execute_query(connection, query_max_db_date)
-    max_db_date = None
-    if max_db_date_result and max_db_date_result[0][0]:
-        max_db_date = pd.to_datetime(max_db_date_result[0][0])
-    
-    if max_db_date is None or fecha_base > max_db_date:
-        print(f"La fecha base ({fecha_base_str}) es posterior a la fecha máxima de datos disponibles en la base de datos ({max_db_date.strftime('%Y-%m-%d') if max_db_date else 'N/A'}). No se pueden encontrar rachas.")
-        return
+    Returns:
+        tuple: (lista de filas (identificacion, fecha, saldo, nivel_deuda), clave de la siguiente
+               página o None si no hay más filas).
+    """
+    conditions, params = build_debt_level_filters(**filters)
+    if after is not None:
+        conditions.append("(identificacion, fecha, id) > (?, ?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT
+        identificacion,
+        fecha,
+        saldo,
+        {get_debt_level_case_sql()} as nivel_deuda,
+        id
+    FROM
+        saldos_clientes
+    {where}
+    ORDER BY
+        identificacion, fecha, id
+    LIMIT ?;
+    """
+    rows = session.fetch_all(query, tuple(params) + (page_size,))
+    if not rows:
+        return [], None
+    next_key = (rows[-1][0], rows[-1][1], rows[-1][4]) if len(rows) == page_size else None
+    return [row[:4] for row in rows], next_key
+
+def iter_debt_levels(session, page_size=DEBT_LEVEL_PAGE_SIZE, **filters):
+    """
+    Recorre página a página los saldos clasificados; en memoria solo se mantiene una página.
 
-    # Paso 1: Obtener todos los saldos clasificados desde la fecha_base hasta la fecha máxima en la DB
-    query_classified_saldos = f"""
+    Yields:
+        tuple: (identificacion, fecha, saldo, nivel_deuda), ordenadas por identificacion y fecha.
+    """
+    after = None
+    while True:
+        rows, after = get_debt_level_page(session, after, page_size, **filters)
+        yield from rows
+        if after is None:
+            return
+
+def get_debt_level_summary(session, **filters):
+    """
+    Cuenta en SQL los saldos de cada nivel de deuda por mes.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        **filters: Filtros de `build_debt_level_filters`.
+
+    Returns:
+        DataFrame: Columnas mes (YYYY-MM), nivel_deuda y cantidad, ordenadas por mes y nivel.
+    """
+    conditions, params = build_debt_level_filters(**filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT
+        substr(fecha, 1, 7) as mes,
+        {get_debt_level_case_sql()} as nivel_deuda,
+        COUNT(*) as cantidad
+    FROM
+        saldos_clientes
+    {where}
+    GROUP BY
+        mes, nivel_deuda
+    ORDER BY
+        mes, nivel_deuda;
+    """
+    return pd.DataFrame(session.fetch_all(query, tuple(params)), columns=DEBT_LEVEL_AGGREGATE_COLUMNS)
+
+def classify_debt_levels(session, niveles=None, identificaciones=None, fecha_desde=None, fecha_hasta=None,
+                         page_size=DEBT_LEVEL_PAGE_SIZE, as_dataframe=False, agregado=False):
+    """
+    Consulta la clasificación de los saldos por niveles de deuda, sin imprimirla.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        niveles (list, optional): Etiquetas de nivel a incluir (ej. ['N3', 'N4']).
+        identificaciones (list, optional): Identificaciones de los clientes a incluir.
+        fecha_desde (str, optional): Fecha mínima (incluida) en formato YYYY-MM-DD.
+        fecha_hasta (str, optional): Fecha máxima (incluida) en formato YYYY-MM-DD.
+        page_size (int, optional): Filas por página de la paginación por clave.
+        as_dataframe (bool, optional): Si es True, devuelve todas las filas filtradas en un DataFrame.
+        agregado (bool, optional): Si es True, devuelve el conteo por mes y nivel (ver `get_debt_level_summary`).
+
+    Returns:
+        iterator | DataFrame: Iterador de filas (identificacion, fecha, saldo, nivel_deuda), o
+                              un DataFrame si `as_dataframe` o `agregado` son True.
+    """
+    filters = {
+        'niveles': niveles,
+        'identificaciones': identificaciones,
+        'fecha_desde': fecha_desde,
+        'fecha_hasta': fecha_hasta
+    }
+    if agregado:
+        return get_debt_level_summary(session, **filters)
+    rows = iter_debt_levels(session, page_size, **filters)
+    if as_dataframe:
+        return pd.DataFrame(list(rows), columns=DEBT_LEVEL_COLUMNS)
+    return rows
+
+# Máximo de días entre dos saldos consecutivos de una misma racha
+MAX_DIAS_ENTRE_SALDOS = 32
+
+def new_streak(fecha, nivel_deuda):
+    """
+    Crea una racha de un mes que inicia y termina en `fecha` (número de día, ver month_calendar).
+    """
+    return {
+        'nivel': nivel_deuda,
+        'fecha_inicio': fecha,
+        'fecha_fin': fecha,
+        'racha': 1
+    }
+
+def continues_streak(streak, fecha, nivel_deuda):
+    """
+    Indica si un saldo (fecha, nivel) continúa la racha dada: mismo nivel y
+    a no más de un mes de su fecha_fin.
+    """
+    return streak['nivel'] == nivel_deuda and fecha - streak['fecha_fin'] <= MAX_DIAS_ENTRE_SALDOS # más de un mes de diferencia rompe la racha
+
+def get_saldos_query(por_shard=False):
+    """
+    Genera la consulta de saldos (identificacion, fecha, saldo) entre dos fechas,
+    ordenados por cliente y fecha. Las fechas (YYYY-MM-DD) se pasan como parámetros
+    de la consulta, precedidas por el shard si se usa `por_shard`, así el texto de la
+    consulta es siempre el mismo y se reutiliza desde la caché de sentencias.
+    """
+    if por_shard:
+        return """
+    SELECT
+        s.identificacion,
+        s.fecha,
+        s.saldo
+    FROM
+        clientes_shard c
+    JOIN
+        saldos_clientes s ON s.identificacion = c.identificacion
+    WHERE
+        c.shard = ? AND s.fecha >= ? AND s.fecha <= ?
+    ORDER BY
+        s.identificacion, s.fecha;
+    """
+    return """
     SELECT
         identificacion,
         fecha,
-        CASE
-            WHEN saldo >= 0 AND saldo < 300000 THEN 'N0'
-            WHEN saldo >= 300000 AND saldo < 1000000 THEN 'N1'
-            WHEN saldo >= 1000000 AND saldo < 3000000 THEN 'N2'
-            WHEN saldo >= 3000000 AND saldo < 5000000 THEN 'N3'
-            WHEN saldo >= 5000000 THEN 'N4'
-            ELSE 'Desconocido'
-        END as nivel_deuda
+        saldo
     FROM
         saldos_clientes
     WHERE
-        fecha >= '{fecha_base.strftime('%Y-%m-%d')}' AND fecha <= '{max_db_date.strftime('%Y-%m-%d')}'
+        fecha >= ? AND fecha <= ?
     ORDER BY
         identificacion, fecha;
     """
 
-    classified_saldos = execute_query(connection, query_classified_saldos)
+def classify_saldo_rows(saldo_rows, chunk_size=100000):
+    """
+    Clasifica filas (identificacion, fecha, saldo) por bloques con `classify_saldos`,
+    convierte sus fechas a números de día con `parse_dates` y produce filas
+    (identificacion, número de día, código de nivel).
 
-    if not classified_saldos:
-        print("No se encontraron datos clasificados para la fecha base y el rango especificados.")
-        return
+    Args:
+        saldo_rows (iterable): Filas (identificacion, fecha YYYY-MM-DD, saldo).
+        chunk_size (int, optional): Número de filas que se clasifican en cada bloque.
+
+    Yields:
+        tuple: (identificacion, número de día int, código de nivel int).
+    """
+    saldo_rows = iter(saldo_rows)
+    while True:
+        chunk = list(itertools.islice(saldo_rows, chunk_size))
+        if not chunk:
+            return
+        codigos = classify_saldos([row[2] for row in chunk]).tolist()
+        dias = parse_dates(row[1] for row in chunk).tolist()
+        for row, dia, codigo in zip(chunk, dias, codigos):
+            yield row[0], dia, codigo
+
+def select_longest_streak(identificacion, streaks, fecha_base, min_racha_length):
+    """
+    Selecciona entre las rachas de un cliente la más larga que cumpla la longitud mínima.
+
+    Returns:
+        dict: Resultado con identificacion, racha, fecha_fin y nivel, o None si ninguna racha es elegible.
+    """
+    eligible_streaks = []
+    for streak in streaks:
+        if streak['racha'] >= min_racha_length:
+            eligible_streaks.append(streak)
     
-    # Crear la tabla de resultados de rachas si no existe
-    create_debt_streaks_table_if_not_exists(connection)
-    # Limpiar resultados anteriores en la tabla de rachas
-    execute_query(connection, "DELETE FROM debt_streaks_results;")
+    if not eligible_streaks:
+        return None
+
+    # Seleccionar la racha más larga
+    longest_streak = None
+    max_length = -1
+    for streak in eligible_streaks:
+        if streak['racha'] > max_length:
+            max_length = streak['racha']
+            longest_streak = streak
+        elif streak['racha'] == max_length:
+            # Si tienen la misma longitud, seleccionar la más reciente (fecha_fin más cercana a fecha_base)
+            if longest_streak is None or abs(streak['fecha_fin'] - fecha_base) < abs(longest_streak['fecha_fin'] - fecha_base):
+                longest_streak = streak
+
+    return {
+        'identificacion': identificacion,
+        'racha': longest_streak['racha'],
+        'fecha_fin': day_to_iso(longest_streak['fecha_fin']),
+        'nivel': get_level_label(longest_streak['nivel'])
+    }
+
+def iter_streak_results(classified_saldos, fecha_base, min_racha_length):
+    """
+    Identifica las rachas de cada cliente y produce, cliente a cliente, la más larga que
+    cumpla la longitud mínima. Solo mantiene en memoria las rachas del cliente en curso,
+    por lo que las filas deben venir ordenadas por cliente y fecha.
 
-    # Procesar rachas por cliente
-    client_streaks = {}
+    Args:
+        classified_saldos (iterable): Filas (identificacion, número de día, código de nivel) ordenadas por
+                                      cliente y fecha, como las produce `classify_saldo_rows`.
+        fecha_base (Timestamp | str | int): Fecha base del análisis.
+        min_racha_length (int): Longitud mínima de la racha.
+
+    Yields:
+        dict: Resultado con identificacion, racha, fecha_fin y nivel, en el orden de los clientes.
+    """
+    fecha_base = to_day_number(fecha_base)
+    current_id = None
+    streaks = []
     for row in classified_saldos:
-        identificacion, fecha_str, nivel_deuda = row
-        fecha = pd.to_datetime(fecha_str)
+        identificacion, fecha, nivel_deuda = row
 
-        if identificacion not in client_streaks:
-            client_streaks[identificacion] = []
+        if identificacion != current_id:
+            if current_id is not None:
+                result = select_longest_streak(current_id, streaks, fecha_base, min_racha_length)
+                if result:
+                    yield result
+            current_id = identificacion
+            streaks = []
 
         # Agrupar por nivel de deuda para encontrar rachas
-        if not client_streaks[identificacion] or \
-           client_streaks[identificacion][-1]['nivel'] != nivel_deuda or \
-           (fecha - client_streaks[identificacion][-1]['fecha_fin']).days > 32: # esto es más de un mes de diferencia
-            
-            # Si hay un salto en la racha o cambio de nivel, empezar una racha d nueva
-            client_streaks[identificacion].append({
-                'nivel': nivel_deuda,
-                'fecha_inicio': fecha,
-                'fecha_fin': fecha,
-                'racha': 1
-            })
-        else:
+        if streaks and continues_streak(streaks[-1], fecha, nivel_deuda):
             # Si no continuar con la racha existnte
-            client_streaks[identificacion][-1]['fecha_fin'] = fecha
-            client_streaks[identificacion][-1]['racha'] += 1
-
-    final_results = []
-    for identificacion, streaks in client_streaks.items():
-        eligible_streaks = []
-        for streak in streaks:
-            if streak['racha'] >= min_racha_length:
-                eligible_streaks.append(streak)
-        
-        if not eligible_streaks:
-            continue
+            streaks[-1]['fecha_fin'] = fecha
+            streaks[-1]['racha'] += 1
+        else:
+            # Si hay un salto en la racha o cambio de nivel, empezar una racha d nueva
+            streaks.append(new_streak(fecha, nivel_deuda))
 
-        # Seleccionar la racha más larga
-        longest_streak = None
-        max_length = -1
-        for streak in eligible_streaks:
-            if streak['racha'] > max_length:
-                max_length = streak['racha']
-                longest_streak = streak
-            elif streak['racha'] == max_length:
-                # Si tienen la misma longitud, seleccionar la más reciente (fecha_fin más cercana a fecha_base)
-                if longest_streak is None or abs((streak['fecha_fin'] - fecha_base).days) < abs((longest_streak['fecha_fin'] - fecha_base).days):
-                    longest_streak = streak
-
-        if longest_streak:
-            final_results.append({
-                'identificacion': identificacion,
-                'racha': longest_streak['racha'],
-                'fecha_fin': longest_streak['fecha_fin'].strftime('%Y-%m-%d'),
-                'nivel': longest_streak['nivel']
-            })
-
-    if final_results:
-        print("\n--- Resultados de Rachas de Deuda ---")
-        for res in final_results:
-            print(f"Identificacion: {res['identificacion']}, Racha: {res['racha']} meses, Fecha Fin: {res['fecha_fin']}, Nivel: {res['nivel']}")
-            # Insertar resultados en la tabla debt_streaks_results
-            insert_query = "INSERT INTO debt_streaks_results (identificacion, racha, fecha_fin, nivel) VALUES (?, ?, ?, ?);"
-            execute_query(connection, insert_query, (res['identificacion'], res['racha'], res['fecha_fin'], res['nivel']))
-        print("Resultados de rachas almacenados en la base de datos.")
+    if current_id is not None:
+        result = select_longest_streak(current_id, streaks, fecha_base, min_racha_length)
+        if result:
+            yield result
+
+def compute_streak_results(classified_saldos, fecha_base, min_racha_length):
+    """
+    Igual que `iter_streak_results`, pero devuelve todos los resultados en una lista.
+    """
+    return list(iter_streak_results(classified_saldos, fecha_base, min_racha_length))
+
+def get_shard(identificacion, num_shards):
+    """
+    Asigna un cliente a un shard con un hash estable entre procesos (CRC32).
+    """
+    return zlib.crc32(identificacion.encode('utf-8')) % num_shards
+
+def assign_client_shards(session, num_shards):
+    """
+    Reparte los clientes de `saldos_clientes` en `num_shards` shards por hash de su
+    identificacion y guarda la asignación en la tabla `clientes_shard`.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        num_shards (int): Número de shards.
+    """
+    create_clients_shard_table_if_not_exists(session)
+    session.connection.create_function('get_shard', 2, get_shard, deterministic=True)
+    with session.transaction():
+        session.execute("DELETE FROM clientes_shard;")
+        session.execute("INSERT INTO clientes_shard (identificacion, shard) SELECT DISTINCT identificacion, get_shard(identificacion, ?) FROM saldos_clientes;", (num_shards,))
+
+def compute_shard_streaks(db_file, shard, fecha_base_str, fecha_hasta, min_racha_length):
+    """
+    Calcula las rachas de los clientes de un shard. Se ejecuta en un proceso
+    independiente con su propia conexión de solo lectura a la base de datos.
+
+    Args:
+        db_file (str): Ruta al archivo de la base de datos SQLite.
+        shard (int): Shard a procesar.
+        fecha_base_str (str): Fecha base en formato YYYY-MM-DD.
+        fecha_hasta (str): Fecha máxima de datos en formato YYYY-MM-DD.
+        min_racha_length (int): Longitud mínima de la racha.
+
+    Returns:
+        list: Resultados del shard ordenados por identificacion.
+    """
+    fecha_base = to_day_number(fecha_base_str)
+    session = DatabaseSession(sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, cached_statements=DB_STATEMENT_CACHE_SIZE), pragmas=DB_PRAGMAS)
+    try:
+        saldos = session.iter_rows(get_saldos_query(por_shard=True), (shard, day_to_iso(fecha_base), fecha_hasta))
+        return compute_streak_results(classify_saldo_rows(saldos), fecha_base, min_racha_length)
+    finally:
+        session.connection.close()
+
+def find_streaks_sharded(session, fecha_base_str, fecha_hasta, min_racha_length, workers):
+    """
+    Calcula las rachas repartiendo los clientes en `workers` shards que se procesan en
+    paralelo, y mezcla los resultados en orden de identificacion.
+
+    Returns:
+        iterator: Resultados de las rachas en el mismo orden que el cálculo secuencial.
+    """
+    db_file = session.fetch_value("SELECT file FROM pragma_database_list WHERE name = 'main';")
+    assign_client_shards(session, workers)
+    print(f"Calculando rachas en {workers} procesos...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(compute_shard_streaks, db_file, shard, fecha_base_str, fecha_hasta, min_racha_length)
+            for shard in range(workers)
+        ]
+        shard_results = [future.result() for future in futures]
+    return heapq.merge(*shard_results, key=lambda res: res['identificacion'])
+
+def find_longest_debt_streak(session, fecha_base_str, min_racha_length, sink, workers=1):
+    """
+    Identifica la racha de deuda más larga de cada cliente desde la fecha_base.
+
+    Args:
+        session (DatabaseSession): Sesión de la base de datos.
+        fecha_base_str (str): Fecha base en formato YYYY-MM-DD.
+        min_racha_length (int): Longitud mínima de la racha.
+        sink (StreakResultsSink): Destino al que se envían los resultados a medida que se
+                                  calculan (`debt_streaks_results` y archivo de salida).
+        workers (int, optional): Número de procesos para el cálculo por shards.
+
+    Returns:
+        int: Número de rachas escritas (0 si no hay saldos desde la fecha_base).
+    """
+    print(f"\n--- Identificando rachas de deuda para fecha_base (inicio): {fecha_base_str} y racha mínima: {min_racha_length} ---")
+
+    fecha_base = to_day_number(fecha_base_str)
+
+    # Obtener la fecha máxima en la base de datos para no buscar en el futuro
+    query_max_db_date = "SELECT MAX(fecha) FROM saldos_clientes;"
+    max_db_date_result = session.fetch_value(query_max_db_date)
+    max_db_date = None
+    if max_db_date_result:
+        max_db_date = to_day_number(max_db_date_result)
+    
+    if max_db_date is None or fecha_base > max_db_date:
+        print(f"La fecha base ({fecha_base_str}) es posterior a la fecha máxima de datos disponibles en la base de datos ({day_to_iso(max_db_date) if max_db_date is not None else 'N/A'}). No se pueden encontrar rachas.")
+        return 0
+
+    if workers > 1:
+        # Paso 1 y 2 en paralelo: cada proceso lee y procesa los saldos clasificados de su shard
+        streak_results = find_streaks_sharded(session, fecha_base_str, day_to_iso(max_db_date), min_racha_length, workers)
+        create_debt_streaks_table_if_not_exists(session)
+        session.execute("DELETE FROM debt_streaks_results;")
     else:
-        print("No se encontraron rachas que cumplan los criterios.")
-    return final_results # Devolver los resultados para su posible exportación a CSV
+        # Paso 1: Recorrer por bloques los saldos desde la fecha_base hasta la fecha máxima en la DB
+        saldos = session.iter_rows(get_saldos_query(), (day_to_iso(fecha_base), day_to_iso(max_db_date)))
+        first_row = next(saldos, None)
+
+        if first_row is None:
+            print("No se encontraron datos clasificados para la fecha base y el rango especificados.")
+            return 0
+        
+        # Crear la tabla de resultados de rachas si no existe
+        create_debt_streaks_table_if_not_exists(session)
+        # Limpiar resultados anteriores en la tabla de rachas
+        session.execute("DELETE FROM debt_streaks_results;")
+
+        # Paso 2: Procesar rachas por cliente
+        streak_results = iter_streak_results(classify_saldo_rows(itertools.chain([first_row], saldos)), fecha_base, min_racha_length)
 
-def insert_data_into_db(connection, df):
+    return sink.write_many(streak_results)
+
+def insert_data_into_db(session, df):
     """
-    Inserta los datos del DataFrame en la tabla `saldos_clientes`.
+    Inserta los datos del DataFrame en la tabla `saldos_clientes` en una sola transacción.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
+        session (DatabaseSession): Sesión de la base de datos.
         df (DataFrame): DataFrame de pandas con los datos a insertar.
     """
     insert_query = """
     INSERT INTO saldos_clientes (identificacion, fecha, saldo) VALUES (?, ?, ?);
     """
-    for index, row in df.iterrows():
-        # Los nombres de las columnas en el Excel son 'corte_mes', 'saldo' y 'identificacion'
-        identificacion = str(row['identificacion'])
-        fecha = row['corte_mes'].strftime('%Y-%m-%d')
-        saldo = row['saldo']
-        if not execute_query(connection, insert_query, (identificacion, fecha, saldo)):
-            print(f"Error al insertar la fila: {row}")
+    # Los nombres de las columnas en el Excel son 'corte_mes', 'saldo' y 'identificacion'
+    rows = zip(
+        df['identificacion'].astype(str),
+        df['corte_mes'].dt.strftime('%Y-%m-%d'),
+        df['saldo'].tolist()
+    )
+    try:
+        session.executemany(insert_query, rows)
+    except sqlite3.Error as e:
+        print(f"Error al insertar los datos (no se insertó ninguna fila): {e}")
+        return
     print("Datos insertados en la base de datos exitosamente.")
 
-def insert_retiros_data_into_db(connection, df):
+def insert_retiros_data_into_db(session, df):
     """
-    Inserta los datos del DataFrame (hoja retiros) en la tabla `retiros`.
+    Inserta los datos del DataFrame (hoja retiros) en la tabla `retiros` en una sola transacción.
 
     Args:
-        connection (connection object): Objeto de conexión a la base de datos.
+        session (DatabaseSession): Sesión de la base de datos.
         df (DataFrame): DataFrame de pandas con los datos a insertar.
     """
     insert_query = """
     INSERT INTO retiros (identificacion, fecha_retiro) VALUES (?, ?);
     """
-    for index, row in df.iterrows():
-        identificacion = str(row['identificacion'])
-        fecha_retiro = row['fecha_retiro'].strftime('%Y-%m-%d')
-        if not execute_query(connection, insert_query, (identificacion, fecha_retiro)):
-            print(f"Error al insertar la fila de retiros: {row}")
-    print("Datos de retiros insertados en la base de datos exitosamente.") 
-
-def export_results_to_csv(results, output_dir, file_name):
-    if not results:
-        print("No hay resultados para exportar a CSV.")
-        return
-    
-    # Asegurarse de que el directorio de salida exista
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, file_name)
-
+    rows = zip(
+        df['identificacion'].astype(str),
+        df['fecha_retiro'].dt.strftime('%Y-%m-%d')
+    )
     try:
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['identificacion', 'racha', 'fecha_fin', 'nivel']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            writer.writerows(results)
-        print(f"Resultados exportados exitosamente a {output_path}")
-    except IOError as e:
-        print(f"Error al exportar a CSV: {e}") 
\ No newline at end of file
+        session.executemany(insert_query, rows)
+    except sqlite3.Error as e:
+        print(f"Error al insertar los datos de retiros (no se insertó ninguna fila): {e}")
+        return
+    print("Datos de retiros insertados en la base de datos exitosamente.") 
@@ -1,69 +1,214 @@
-from database import create_connection, close_connection, create_table_saldos_clientes_if_not_exists, create_table_retiros_if_not_exists, create_debt_streaks_table_if_not_exists
+from database import create_session, create_table_saldos_clientes_if_not_exists, create_table_retiros_if_not_exists, create_debt_streaks_table_if_not_exists
 from logic import (
-    read_excel_data,
+    read_excel_sheets,
+    HISTORIA_COLUMNS,
+    RETIROS_COLUMNS,
     insert_data_into_db,
     insert_retiros_data_into_db,
     classify_debt_levels,
     fill_missing_saldos_with_n0,
-    find_longest_debt_streak,
-    export_results_to_csv
+    find_longest_debt_streak
 )
-from config import DB_FILE, EXCEL_FILE_PATH, EXCEL_SHEET_HISTORIA, EXCEL_SHEET_RETIROS, CSV_OUTPUT_DIR, CSV_FILE_NAME
+from results_sink import StreakResultsSink
+from incremental import (
+    has_incremental_state,
+    initialize_incremental_state,
+    update_incremental,
+    find_longest_debt_streak_incremental
+)
+from batch import get_fechas_base_range, find_longest_debt_streaks_batch
+from duckdb_backend import (
+    create_duckdb_connection,
+    close_duckdb_connection,
+    create_duckdb_tables,
+    load_dataframes_into_duckdb,
+    load_parquet_into_duckdb,
+    fill_missing_saldos_with_n0_duckdb,
+    find_longest_debt_streak_duckdb,
+    export_streak_results_duckdb
+)
+from config import DB_FILE, ANALYTICS_ENGINE, DUCKDB_FILE, DUCKDB_SETTINGS, EXCEL_FILE_PATH, EXCEL_SHEET_HISTORIA, EXCEL_SHEET_RETIROS, EXCEL_ENGINE, PARQUET_CACHE_DIR, CSV_OUTPUT_DIR, CSV_FILE_NAME, CSV_BATCH_FILE_NAME, RESULTS_BATCH_SIZE, CONSOLE_SAMPLE_SIZE
 import os
 import argparse
 import pandas as pd
 
 def main():
     parser = argparse.ArgumentParser(description="Procesa saldos de clientes y clasifica niveles de deuda.")
-    parser.add_argument('--fecha_base', type=str, help='Fecha base en formato YYYY-MM-DD para el análisis.', required=True)
+    fechas_group = parser.add_mutually_exclusive_group(required=True)
+    fechas_group.add_argument('--fecha_base', type=str, help='Fecha base en formato YYYY-MM-DD para el análisis.')
+    fechas_group.add_argument('--fechas_base', type=str, help='Modo por lotes: lista de fechas base YYYY-MM-DD separadas por comas.')
+    fechas_group.add_argument('--rango_fechas_base', type=str, nargs=2, metavar=('INICIO', 'FIN'), help='Modo por lotes: una fecha base por mes entre INICIO y FIN (YYYY-MM-DD).')
     parser.add_argument('--min_racha', type=int, default=1, help='Longitud mínima de la racha de deuda.')
+    parser.add_argument('--workers', type=int, default=1, help='Número de procesos para calcular las rachas en paralelo (por shards de clientes). Solo con --fecha_base.')
+    parser.add_argument('--formato_salida', choices=['csv', 'parquet'], default='csv', help='Formato del archivo de resultados.')
+    parser.add_argument('--parquet_cache', action='store_true', help='Guarda/lee el Excel como un caché Parquet asociado al hash del archivo.')
+    parser.add_argument('--incremental', action='store_true', help='Ingiere solo los meses y retiros nuevos sobre la base de datos existente.')
+    parser.add_argument('--origen_parquet', type=str, metavar='DIR', help='Lee la cartera de DIR/historia.parquet y DIR/retiros.parquet (como los escribe synthetic.py) en lugar del Excel.')
+    parser.add_argument('--motor', choices=['sqlite', 'duckdb'], default=ANALYTICS_ENGINE, help='Motor del análisis (por defecto, ANALYTICS_ENGINE de config.py).')
     args = parser.parse_args()
 
+    # Modo por lotes: varias fechas_base calculadas con una sola carga de datos
+    fechas_base = None
+    if args.fechas_base:
+        fechas_base = [fecha.strip() for fecha in args.fechas_base.split(',') if fecha.strip()]
+    elif args.rango_fechas_base:
+        fechas_base = get_fechas_base_range(*args.rango_fechas_base)
+    if fechas_base is not None and args.incremental:
+        parser.error("--incremental solo se puede usar con --fecha_base.")
+    if fechas_base is not None and args.workers > 1:
+        parser.error("--workers solo se puede usar con --fecha_base; el modo por lotes responde todas las fechas_base desde una sola lectura secuencial de los saldos.")
+
+    # Motor DuckDB: carga, relleno y rachas en SQL vectorizado y multihilo sobre su propia base de datos
+    if args.motor == 'duckdb':
+        if fechas_base is not None or args.incremental or args.workers > 1:
+            parser.error("--motor duckdb solo admite --fecha_base; sus hilos se configuran en DUCKDB_SETTINGS.")
+        run_duckdb(args)
+        return
+
+    # En modo incremental se reutiliza la base de datos si ya tiene estado para la misma fecha_base
+    if args.incremental and os.path.exists(DB_FILE):
+        session = create_session(DB_FILE)
+        if session:
+            try:
+                if has_incremental_state(session, args.fecha_base):
+                    run_incremental(session, args)
+                    return
+                print("No hay estado incremental para esta fecha_base. Se reconstruye la base de datos.")
+            finally:
+                session.close()
+
     # Eliminar la base de datos existente para volver a crearla
     if os.path.exists(DB_FILE):
         os.remove(DB_FILE)
         print(f"Base de datos existente eliminada: {DB_FILE}")
 
-    # 1. Establecer conexión con la base de datos
-    conn = create_connection(DB_FILE)
+    # 1. Establecer conexión con la base de datos y abrir una sesión sobre ella
+    session = create_session(DB_FILE)
 
-    if conn:
+    if session:
         try:
-            # 2. Leer los datos de la hoja 'historia' del archivo Excel y crear la tabla 'saldos_clientes' en la base de datos si no existe
-            df_historia = read_excel_data(EXCEL_FILE_PATH, sheet_name=EXCEL_SHEET_HISTORIA)
+            # 2. Leer las hojas 'historia' y 'retiros' del archivo Excel y crear la tabla 'saldos_clientes' en la base de datos si no existe
+            df_historia, df_retiros = load_input_data(args)
 
             if df_historia is not None:
-                create_table_saldos_clientes_if_not_exists(conn)
-                insert_data_into_db(conn, df_historia)
+                create_table_saldos_clientes_if_not_exists(session)
+                insert_data_into_db(session, df_historia)
             else:
                 print("No se pudieron leer los datos de la hoja 'historia' del archivo Excel.")
 
-            # 3. Leer los datos de la hoja 'retiros' del archivo Excel
-            df_retiros = read_excel_data(EXCEL_FILE_PATH, sheet_name=EXCEL_SHEET_RETIROS)
-
+            # 3. Insertar los datos de la hoja 'retiros' del archivo Excel
             if df_retiros is not None:
-                create_table_retiros_if_not_exists(conn)
-                insert_retiros_data_into_db(conn, df_retiros)
+                create_table_retiros_if_not_exists(session)
+                insert_retiros_data_into_db(session, df_retiros)
             else:
                 print("No se pudieron leer los datos de la hoja 'retiros' del archivo Excel.")
 
+            # En el modo por lotes las rachas de todas las fechas_base salen de una sola lectura de los saldos
+            if fechas_base is not None:
+                with create_results_sink(session, args, 'debt_streaks_batch_results', CSV_BATCH_FILE_NAME, ['fecha_base'] + RESULT_FIELDS) as sink:
+                    find_longest_debt_streaks_batch(session, fechas_base, args.min_racha, sink)
+                return
+
             # Crear la tabla de resultados de rachas
-            create_debt_streaks_table_if_not_exists(conn)
+            create_debt_streaks_table_if_not_exists(session)
 
             # 4. Rellenar saldos faltantes con N0 y considerar fechas de retiro
-            fill_missing_saldos_with_n0(conn, fecha_base=pd.to_datetime(args.fecha_base))
+            fill_missing_saldos_with_n0(session, fecha_base=pd.to_datetime(args.fecha_base))
 
-            # 5. Identificar y mostrar las rachas de deuda y obtener los resultados
-            results = find_longest_debt_streak(conn, args.fecha_base, args.min_racha)
+            # 5. Identificar las rachas de deuda, guardarlas en la base de datos y exportarlas a medida que se calculan
+            with create_results_sink(session, args, 'debt_streaks_results', CSV_FILE_NAME, RESULT_FIELDS) as sink:
+                find_longest_debt_streak(session, args.fecha_base, args.min_racha, workers=args.workers, sink=sink)
 
-            # 6. Exportar los resultados a un archivo CSV
-            export_results_to_csv(results, CSV_OUTPUT_DIR, CSV_FILE_NAME)
+            # Dejar listo el estado para las siguientes ejecuciones incrementales
+            if args.incremental:
+                initialize_incremental_state(session, args.fecha_base)
 
         finally:
             # 4. Cerrar la conexión con la base de datos
-            close_connection(conn)
+            session.close()
     else:
         print("No se pudo establecer la conexión a la base de datos.")
 
+RESULT_FIELDS = ['identificacion', 'racha', 'fecha_fin', 'nivel']
+
+def create_results_sink(session, args, table_name, file_name, fieldnames):
+    """
+    Crea el destino de resultados (tabla de la base de datos y archivo CSV/Parquet).
+    """
+    return StreakResultsSink(
+        session, table_name, fieldnames, CSV_OUTPUT_DIR, file_name,
+        output_format=args.formato_salida,
+        batch_size=RESULTS_BATCH_SIZE,
+        sample_size=CONSOLE_SAMPLE_SIZE
+    )
+
+def load_excel_data(args):
+    """
+    Lee las hojas 'historia' y 'retiros' del archivo Excel en una sola apertura del libro.
+    """
+    sheets = read_excel_sheets(
+        EXCEL_FILE_PATH,
+        {EXCEL_SHEET_HISTORIA: HISTORIA_COLUMNS, EXCEL_SHEET_RETIROS: RETIROS_COLUMNS},
+        engine=EXCEL_ENGINE,
+        parquet_cache_dir=PARQUET_CACHE_DIR if args.parquet_cache else None
+    )
+    return sheets[EXCEL_SHEET_HISTORIA], sheets[EXCEL_SHEET_RETIROS]
+
+def load_input_data(args):
+    """
+    Lee la cartera del directorio Parquet indicado con --origen_parquet o, si no se indica, del Excel.
+    """
+    if args.origen_parquet:
+        return (pd.read_parquet(os.path.join(args.origen_parquet, 'historia.parquet')),
+                pd.read_parquet(os.path.join(args.origen_parquet, 'retiros.parquet')))
+    return load_excel_data(args)
+
+def run_duckdb(args):
+    """
+    Ejecuta el análisis con el motor DuckDB: los Parquet se leen directamente desde DuckDB y el
+    Excel a través de pandas. Los resultados se guardan en la tabla `debt_streaks_results` de
+    DUCKDB_FILE y se exportan igual que con SQLite.
+    """
+    if os.path.exists(DUCKDB_FILE):
+        os.remove(DUCKDB_FILE)
+        print(f"Base de datos existente eliminada: {DUCKDB_FILE}")
+
+    connection = create_duckdb_connection(DUCKDB_FILE, DUCKDB_SETTINGS)
+    if connection is None:
+        print("No se pudo establecer la conexión a la base de datos.")
+        return
+    try:
+        create_duckdb_tables(connection)
+        if args.origen_parquet:
+            load_parquet_into_duckdb(connection, args.origen_parquet)
+        else:
+            df_historia, df_retiros = load_excel_data(args)
+            if df_historia is None:
+                print("No se pudieron leer los datos de la hoja 'historia' del archivo Excel.")
+            if df_retiros is None:
+                print("No se pudieron leer los datos de la hoja 'retiros' del archivo Excel.")
+            load_dataframes_into_duckdb(connection, df_historia, df_retiros)
+
+        fill_missing_saldos_with_n0_duckdb(connection, fecha_base=pd.to_datetime(args.fecha_base))
+        find_longest_debt_streak_duckdb(connection, args.fecha_base, args.min_racha)
+        export_streak_results_duckdb(connection, CSV_OUTPUT_DIR, CSV_FILE_NAME, args.formato_salida, CONSOLE_SAMPLE_SIZE)
+    finally:
+        close_duckdb_connection(connection)
+
+def run_incremental(session, args):
+    """
+    Actualiza la base de datos existente con los meses y retiros nuevos del Excel
+    y recalcula las rachas a partir del estado incremental.
+    """
+    df_historia, df_retiros = load_input_data(args)
+    if df_historia is None:
+        print("No se pudieron leer los datos de la hoja 'historia' del archivo Excel.")
+    if df_retiros is None:
+        print("No se pudieron leer los datos de la hoja 'retiros' del archivo Excel.")
+
+    update_incremental(session, df_historia, df_retiros, args.fecha_base)
+    with create_results_sink(session, args, 'debt_streaks_results', CSV_FILE_NAME, RESULT_FIELDS) as sink:
+        find_longest_debt_streak_incremental(session, args.min_racha, sink)
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
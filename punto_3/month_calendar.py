@@ -0,0 +1,110 @@
+import bisect
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Las fechas se representan como números de día (días desde 1970-01-01) y los meses como
+# ordinales de mes (meses desde 1970-01), los mismos enteros que usa numpy en datetime64[D]
+# y datetime64[M]. Así la diferencia en días entre dos fechas es una resta de enteros.
+EPOCA = np.datetime64('1970-01-01', 'D')
+
+# Tabla precalculada de meses (ordinal <-> día de inicio <-> fecha ISO del día 1)
+CALENDARIO_DESDE = '1900-01'
+CALENDARIO_HASTA = '2200-12'
+_MESES = np.arange(np.datetime64(CALENDARIO_DESDE, 'M'), np.datetime64(CALENDARIO_HASTA, 'M') + 1)
+_PRIMER_MES = int(_MESES[0].astype(np.int64))
+_MES_INICIO_DIA = _MESES.astype('datetime64[D]').astype(np.int64).tolist()
+_MES_INICIO_ISO = [str(dia) for dia in _MESES.astype('datetime64[D]')]
+
+def parse_dates(values):
+    """
+    Convierte de una sola vez una columna de fechas (cadenas YYYY-MM-DD, Timestamps o None)
+    en números de día.
+
+    Args:
+        values (iterable): Fechas a convertir; None o NaT se convierten en NaT.
+
+    Returns:
+        ndarray: Números de día (int64); las fechas nulas quedan como el valor NaT de numpy.
+    """
+    if isinstance(values, (pd.Series, pd.Index)):
+        return values.to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return np.array(list(values), dtype='datetime64[D]').astype(np.int64)
+
+def is_nat(dias):
+    """
+    Indica qué números de día corresponden a fechas nulas (NaT).
+    """
+    return np.isnat(np.asarray(dias).astype('datetime64[D]'))
+
+def to_day_number(fecha):
+    """
+    Convierte una fecha escalar (cadena YYYY-MM-DD, Timestamp, date o número de día) en número de día.
+    Pensada para valores sueltos fuera de los ciclos; para columnas se usa `parse_dates`.
+    """
+    if isinstance(fecha, (int, np.integer)):
+        return int(fecha)
+    return int(np.datetime64(pd.Timestamp(fecha).date(), 'D').astype(np.int64))
+
+@lru_cache(maxsize=65536)
+def day_to_iso(dia):
+    """
+    Convierte un número de día en una fecha YYYY-MM-DD (memoizado: en la práctica hay pocas fechas distintas).
+    """
+    return str(EPOCA + dia)
+
+def day_to_timestamp(dia):
+    """
+    Convierte un número de día en un Timestamp de pandas.
+    """
+    return pd.Timestamp(EPOCA + dia)
+
+def month_of(dia):
+    """
+    Devuelve el ordinal del mes de un número de día.
+    """
+    indice = bisect.bisect_right(_MES_INICIO_DIA, dia) - 1
+    if 0 <= indice < len(_MES_INICIO_DIA) - 1:
+        return _PRIMER_MES + indice
+    return int((EPOCA + dia).astype('datetime64[M]').astype(np.int64))
+
+def months_of(dias):
+    """
+    Devuelve los ordinales de mes de un vector de números de día.
+    """
+    return np.asarray(dias).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+def month_start_day(mes):
+    """
+    Devuelve el número de día del día 1 del mes con el ordinal dado.
+    """
+    indice = mes - _PRIMER_MES
+    if 0 <= indice < len(_MES_INICIO_DIA):
+        return _MES_INICIO_DIA[indice]
+    return int(np.datetime64(mes, 'M').astype('datetime64[D]').astype(np.int64))
+
+def month_start_iso(mes):
+    """
+    Devuelve la fecha YYYY-MM-DD del día 1 del mes con el ordinal dado.
+    """
+    indice = mes - _PRIMER_MES
+    if 0 <= indice < len(_MES_INICIO_ISO):
+        return _MES_INICIO_ISO[indice]
+    return str(np.datetime64(mes, 'M').astype('datetime64[D]'))
+
+def is_month_start(dia):
+    """
+    Indica si un número de día es el día 1 de su mes.
+    """
+    return month_start_day(month_of(dia)) == dia
+
+@lru_cache(maxsize=4096)
+def month_range(primer_mes, ultimo_mes):
+    """
+    Devuelve los ordinales de mes entre dos meses (ambos incluidos). Está memoizada porque
+    muchos clientes comparten el mismo rango (desde su primer mes hasta el mes de la fecha_base).
+
+    Returns:
+        tuple: Ordinales de mes en orden creciente (vacía si `primer_mes` > `ultimo_mes`).
+    """
+    return tuple(range(primer_mes, ultimo_mes + 1))
@@ -0,0 +1,165 @@
+import os
+import csv
+import sqlite3
+from collections import Counter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+class StreakResultsSink:
+    """
+    Destino de los resultados de rachas: los escribe a medida que llegan en un archivo
+    CSV o Parquet y los inserta en la base de datos por lotes, cada lote en una sola
+    transacción. En memoria solo guarda el lote en curso, una muestra para la consola
+    y contadores por nivel.
+    """
+    def __init__(self, session, table_name, fieldnames, output_dir, file_name,
+                 output_format='csv', batch_size=10000, sample_size=10):
+        """
+        Args:
+            session (DatabaseSession): Sesión de la base de datos.
+            table_name (str): Tabla donde se insertan los resultados (con columnas `fieldnames`).
+            fieldnames (list): Columnas de cada resultado, en el orden de salida.
+            output_dir (str): Directorio del archivo de salida.
+            file_name (str): Nombre del archivo de salida; con formato 'parquet' se cambia su extensión a .parquet.
+            output_format (str, optional): 'csv' o 'parquet' (requiere pyarrow).
+            batch_size (int, optional): Número de filas por lote de inserción y escritura.
+            sample_size (int, optional): Número de resultados de muestra que se muestran en consola.
+        """
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f"Formato de salida no soportado: {output_format}")
+        if output_format == 'parquet' and pa is None:
+            raise ValueError("La exportación a Parquet requiere el paquete pyarrow.")
+        self.session = session
+        self.fieldnames = fieldnames
+        self.output_format = output_format
+        self.batch_size = batch_size
+        self.sample_size = sample_size
+        if output_format == 'parquet':
+            file_name = f"{os.path.splitext(file_name)[0]}.parquet"
+        self.output_dir = output_dir
+        self.output_path = os.path.join(output_dir, file_name)
+        self.insert_query = f"INSERT INTO {table_name} ({', '.join(fieldnames)}) VALUES ({', '.join('?' for _ in fieldnames)});"
+
+        self.count = 0
+        self.level_counts = Counter()
+        self.sample = []
+        self._batch = []
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def write(self, result):
+        """
+        Agrega un resultado (diccionario con las columnas `fieldnames`).
+        """
+        self._batch.append(tuple(result[field] for field in self.fieldnames))
+        self.count += 1
+        self.level_counts[result.get('nivel')] += 1
+        if len(self.sample) < self.sample_size:
+            self.sample.append(result)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, results):
+        """
+        Agrega todos los resultados de un iterable.
+
+        Returns:
+            int: Número de resultados agregados.
+        """
+        written = 0
+        for result in results:
+            self.write(result)
+            written += 1
+        return written
+
+    def flush(self):
+        """
+        Inserta el lote en curso en la base de datos y lo escribe en el archivo de salida.
+        """
+        if not self._batch:
+            return
+        try:
+            self.session.executemany(self.insert_query, self._batch)
+        except sqlite3.Error as e:
+            print(f"Error al insertar un lote de {len(self._batch)} resultados: {e}")
+        self._write_batch_to_file(self._batch)
+        self._batch = []
+
+    def _write_batch_to_file(self, batch):
+        if self._writer is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if self.output_format == 'csv':
+                self._file = open(self.output_path, 'w', newline='', encoding='utf-8')
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(self.fieldnames)
+            else:
+                self._schema = pa.schema([
+                    (field, pa.int64() if field == 'racha' else pa.string()) for field in self.fieldnames
+                ])
+                self._writer = pq.ParquetWriter(self.output_path, self._schema)
+
+        if self.output_format == 'csv':
+            self._writer.writerows(batch)
+        else:
+            columns = list(zip(*batch))
+            self._writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=self._schema.field(field).type) for field, column in zip(self.fieldnames, columns)],
+                schema=self._schema
+            ))
+
+    def close(self):
+        """
+        Escribe el último lote, cierra el archivo de salida y muestra un resumen.
+        """
+        self.flush()
+        if self._writer is not None:
+            if self.output_format == 'csv':
+                self._file.close()
+            else:
+                self._writer.close()
+            self._writer = None
+        self.print_summary()
+
+    def print_summary(self):
+        """
+        Muestra el total de rachas, su distribución por nivel y una muestra acotada.
+        """
+        print_streak_summary(self.count, self.level_counts, self.sample, self.output_path)
+
+def print_streak_summary(count, level_counts, sample, output_path):
+    """
+    Muestra el resumen de los resultados de rachas (compartido con el motor DuckDB).
+
+    Args:
+        count (int): Número total de rachas.
+        level_counts (dict): Número de rachas por nivel.
+        sample (list): Muestra de resultados (diccionarios) que se imprime.
+        output_path (str): Archivo al que se exportaron los resultados.
+    """
+    if not count:
+        print("No se encontraron rachas que cumplan los criterios.")
+        print("No hay resultados para exportar.")
+        return
+    print("\n--- Resultados de Rachas de Deuda ---")
+    print(f"Rachas encontradas: {count}")
+    print("Rachas por nivel: " + ", ".join(f"{nivel}: {total}" for nivel, total in sorted(level_counts.items())))
+    print(f"Muestra de {len(sample)} resultados:")
+    for res in sample:
+        prefix = f"Fecha base: {res['fecha_base']}, " if 'fecha_base' in res else ""
+        print(f"  {prefix}Identificacion: {res['identificacion']}, Racha: {res['racha']} meses, Fecha Fin: {res['fecha_fin']}, Nivel: {res['nivel']}")
+    if count > len(sample):
+        print(f"  ... y {count - len(sample)} resultados más.")
+    print("Resultados de rachas almacenados en la base de datos.")
+    print(f"Resultados exportados exitosamente a {output_path}")
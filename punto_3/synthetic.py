@@ -0,0 +1,167 @@
+import os
+import argparse
+import importlib.util
+import numpy as np
+import pandas as pd
+from config import NIVELES_DEUDA
+from debt_levels import get_level_bands
+from database import create_session, create_table_saldos_clientes_if_not_exists, create_table_retiros_if_not_exists
+from logic import insert_data_into_db, insert_retiros_data_into_db
+
+# Caracteres y longitud de las identificaciones generadas (como las de rachas.xlsx)
+ALFABETO_IDENTIFICACION = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+LONGITUD_IDENTIFICACION = 17
+
+def generate_identificaciones(rng, num_clientes):
+    """
+    Genera identificaciones alfanuméricas aleatorias de LONGITUD_IDENTIFICACION caracteres.
+    """
+    alfabeto = np.frombuffer(ALFABETO_IDENTIFICACION.encode('ascii'), dtype='S1')
+    codigos = rng.integers(0, len(alfabeto), size=(num_clientes, LONGITUD_IDENTIFICACION))
+    return alfabeto[codigos].view(f'S{LONGITUD_IDENTIFICACION}').ravel().astype(str)
+
+def generate_portfolio(num_clientes=1000, num_meses=24, fecha_inicio='2023-01-31', tasa_huecos=0.05,
+                       tasa_retiro=0.05, volatilidad=0.3, seed=None, niveles=NIVELES_DEUDA):
+    """
+    Genera una cartera sintética de saldos de clientes con la misma estructura que las hojas
+    'historia' y 'retiros' de rachas.xlsx. Con la misma semilla se obtiene la misma cartera.
+
+    Cada cliente aparece en un mes aleatorio del primer cuarto del periodo y su nivel de deuda
+    sigue una caminata aleatoria sobre las bandas de `niveles`: cada mes cambia a una banda
+    vecina con probabilidad `volatilidad`. El saldo se toma uniforme dentro de la banda.
+
+    Args:
+        num_clientes (int, optional): Número de clientes.
+        num_meses (int, optional): Número de cortes de mes.
+        fecha_inicio (str, optional): Primer corte de mes (fin de mes) en formato YYYY-MM-DD.
+        tasa_huecos (float, optional): Probabilidad de que falte el saldo de un cliente en un mes.
+        tasa_retiro (float, optional): Proporción de clientes con fecha de retiro; sus saldos
+                                       terminan en el mes del retiro.
+        volatilidad (float, optional): Probabilidad mensual de cambiar de nivel de deuda.
+        seed (int, optional): Semilla del generador aleatorio.
+        niveles (list, optional): Tabla de bandas de niveles de deuda (ver `get_level_bands`).
+
+    Returns:
+        tuple: (DataFrame historia con identificacion, corte_mes y saldo,
+                DataFrame retiros con identificacion y fecha_retiro).
+    """
+    rng = np.random.default_rng(seed)
+    meses = pd.date_range(pd.to_datetime(fecha_inicio), periods=num_meses, freq='ME')
+    identificaciones = generate_identificaciones(rng, num_clientes)
+
+    # Niveles: caminata aleatoria acotada a las bandas de la tabla
+    limites, _ = get_level_bands(niveles)
+    num_niveles = len(limites)
+    nivel_inicial = rng.integers(0, num_niveles, size=(num_clientes, 1))
+    pasos = np.where(rng.random((num_clientes, num_meses)) < volatilidad, rng.choice([-1, 1], size=(num_clientes, num_meses)), 0)
+    pasos[:, 0] = 0
+    niveles_cliente = np.clip(nivel_inicial + np.cumsum(pasos, axis=1), 0, num_niveles - 1)
+
+    # Saldos uniformes dentro de cada banda; la última banda se acota con el ancho de la anterior
+    ancho_ultima = limites[-1] - limites[-2] if num_niveles > 1 else max(limites[-1], 1.0)
+    superiores = np.append(limites[1:], limites[-1] + ancho_ultima)
+    inferiores = np.maximum(limites, 0)
+    saldos = inferiores[niveles_cliente] + rng.random((num_clientes, num_meses)) * (superiores - inferiores)[niveles_cliente]
+
+    # Meses presentes: desde la primera aparición, con huecos aleatorios (nunca en el primer mes)
+    indice_mes = np.arange(num_meses)
+    primer_mes = rng.integers(0, max(num_meses // 4, 1), size=(num_clientes, 1))
+    presente = (indice_mes >= primer_mes) & ((rng.random((num_clientes, num_meses)) >= tasa_huecos) | (indice_mes == primer_mes))
+
+    # Retiros: fecha aleatoria posterior a la primera aparición; no hay saldos después del retiro
+    retirado = rng.random(num_clientes) < tasa_retiro
+    mes_retiro = primer_mes[:, 0] + 1 + (rng.random(num_clientes) * np.maximum(num_meses - primer_mes[:, 0] - 1, 1)).astype(int)
+    mes_retiro = np.minimum(mes_retiro, num_meses - 1)
+    presente &= ~retirado[:, None] | (indice_mes <= mes_retiro[:, None])
+    inicio_mes_retiro = meses[mes_retiro].to_period('M').to_timestamp()
+    fechas_retiro = inicio_mes_retiro + pd.to_timedelta(rng.integers(0, 28, size=num_clientes), unit='D')
+
+    filas, columnas = np.nonzero(presente)
+    df_historia = pd.DataFrame({
+        'identificacion': identificaciones[filas],
+        'corte_mes': meses[columnas],
+        'saldo': saldos[filas, columnas].astype(np.int64)
+    })
+    df_retiros = pd.DataFrame({
+        'identificacion': identificaciones[retirado],
+        'fecha_retiro': fechas_retiro[retirado]
+    })
+    return df_historia, df_retiros
+
+def write_portfolio_to_sqlite(db_file, df_historia, df_retiros):
+    """
+    Crea las tablas `saldos_clientes` y `retiros` en la base de datos dada y carga la cartera.
+
+    Returns:
+        bool: True si la cartera se cargó, False si no se pudo abrir la base de datos.
+    """
+    session = create_session(db_file)
+    if session is None:
+        return False
+    try:
+        create_table_saldos_clientes_if_not_exists(session)
+        create_table_retiros_if_not_exists(session)
+        insert_data_into_db(session, df_historia)
+        insert_retiros_data_into_db(session, df_retiros)
+    finally:
+        session.close()
+    return True
+
+def write_portfolio_to_parquet(output_dir, df_historia, df_retiros):
+    """
+    Escribe la cartera en `historia.parquet` y `retiros.parquet` dentro de `output_dir` (requiere pyarrow).
+
+    Returns:
+        bool: True si se escribieron los archivos.
+    """
+    if not importlib.util.find_spec('pyarrow'):
+        print("La exportación a Parquet requiere el paquete pyarrow.")
+        return False
+    os.makedirs(output_dir, exist_ok=True)
+    df_historia.to_parquet(os.path.join(output_dir, 'historia.parquet'), index=False)
+    df_retiros.to_parquet(os.path.join(output_dir, 'retiros.parquet'), index=False)
+    return True
+
+def add_portfolio_arguments(parser):
+    """
+    Agrega a un parser los argumentos de `generate_portfolio` (compartidos con benchmark.py).
+    """
+    parser.add_argument('--clientes', type=int, default=1000, help='Número de clientes.')
+    parser.add_argument('--meses', type=int, default=24, help='Número de cortes de mes.')
+    parser.add_argument('--fecha_inicio', type=str, default='2023-01-31', help='Primer corte de mes (YYYY-MM-DD, fin de mes).')
+    parser.add_argument('--huecos', type=float, default=0.05, help='Probabilidad de que falte un saldo mensual.')
+    parser.add_argument('--retiros', type=float, default=0.05, help='Proporción de clientes retirados.')
+    parser.add_argument('--volatilidad', type=float, default=0.3, help='Probabilidad mensual de cambiar de nivel de deuda.')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla del generador aleatorio.')
+
+def generate_portfolio_from_args(args):
+    return generate_portfolio(
+        num_clientes=args.clientes,
+        num_meses=args.meses,
+        fecha_inicio=args.fecha_inicio,
+        tasa_huecos=args.huecos,
+        tasa_retiro=args.retiros,
+        volatilidad=args.volatilidad,
+        seed=args.seed
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera una cartera sintética de saldos de clientes.")
+    add_portfolio_arguments(parser)
+    parser.add_argument('--formato', choices=['sqlite', 'parquet'], default='sqlite', help='Formato de salida.')
+    parser.add_argument('--destino', type=str, required=True, help='Archivo SQLite o directorio Parquet de salida.')
+    args = parser.parse_args()
+
+    df_historia, df_retiros = generate_portfolio_from_args(args)
+    print(f"Cartera generada: {df_historia['identificacion'].nunique()} clientes, {len(df_historia)} saldos, {len(df_retiros)} retiros.")
+    if args.formato == 'sqlite':
+        if os.path.exists(args.destino):
+            os.remove(args.destino)
+        written = write_portfolio_to_sqlite(args.destino, df_historia, df_retiros)
+    else:
+        written = write_portfolio_to_parquet(args.destino, df_historia, df_retiros)
+    if written:
+        print(f"Cartera escrita en {args.destino}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import tracemalloc
+from collections import defaultdict
+from contextlib import redirect_stdout
+from typing import Callable, Iterator, Optional
+from src.core.html_processor import HtmlProcessor
+from synthetic_site import add_site_arguments, generate_site_from_args
+
+STAGES = ("discover", "read", "match", "encode", "write")
+
+class StageTimer:
+    """
+    Mide el tiempo acumulado de cada etapa del procesamiento envolviendo los métodos de los
+    componentes de un `HtmlProcessor`. El tiempo de cada etapa es exclusivo: si una etapa
+    llama a otra (ej. 'match' codifica las imágenes), el tiempo de la etapa interna se
+    descuenta de la externa. Con varios hilos los tiempos se suman entre hilos.
+    """
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _add(self, stage: str, elapsed: float, nested: float) -> None:
+        stack = self._local.stack
+        if stack:
+            stack[-1] += elapsed
+        with self._lock:
+            self.seconds[stage] += elapsed - nested
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            stack = self._local.__dict__.setdefault('stack', [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._add(stage, elapsed, stack.pop())
+        return timed
+
+    def wrap_iterator(self, stage: str, function: Callable[..., Iterator]) -> Callable[..., Iterator]:
+        def timed(*args, **kwargs):
+            iterator = function(*args, **kwargs)
+            while True:
+                stack = self._local.__dict__.setdefault('stack', [])
+                stack.append(0.0)
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._add(stage, time.perf_counter() - start, stack.pop())
+                yield item
+        return timed
+
+def instrument(processor: HtmlProcessor, timer: StageTimer) -> None:
+    """
+    Envuelve los métodos de los componentes de `processor` con los que se mide cada etapa.
+    En el modo por bloques la codificación de las imágenes grandes ocurre mientras se
+    escribe el archivo y se cuenta en 'match'.
+    """
+    reader = processor.html_reader
+    replacer = processor.html_image_replacer
+    encoder = processor.image_encoder
+    writer = processor.html_file_writer
+    reader.iter_html_files = timer.wrap_iterator("discover", reader.iter_html_files)
+    reader.read_html_content = timer.wrap("read", reader.read_html_content)
+    reader.open_html_file = timer.wrap("read", reader.open_html_file)
+    replacer.replace_images_with_base64 = timer.wrap("match", replacer.replace_images_with_base64)
+    replacer.rewrite_stream = timer.wrap("match", replacer.rewrite_stream)
+    encoder.image_to_base64 = timer.wrap("encode", encoder.image_to_base64)
+    encoder.iter_base64 = timer.wrap("encode", encoder.iter_base64)
+    writer.write_processed_html = timer.wrap("write", writer.write_processed_html)
+    writer.write_processed_html_stream = timer.wrap("write", writer.write_processed_html_stream)
+
+def run_once(site_directory: str, processor_options: dict, verbose: bool = False) -> dict:
+    """
+    Procesa el sitio una vez, en un directorio de salida temporal y con la caché vacía.
+
+    Returns:
+        dict: Segundos totales, segundos por etapa, páginas, bytes leídos y escritos, fallos y,
+              si tracemalloc está activo, el pico de memoria de Python en MB.
+    """
+    with tempfile.TemporaryDirectory() as output_directory:
+        processor = HtmlProcessor(site_directory, output_directory, verbose=False, **processor_options)
+        timer = StageTimer()
+        instrument(processor, timer)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            initial_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if verbose:
+            summary = processor.process_all_html_files()
+        else:
+            with redirect_stdout(io.StringIO()):
+                summary = processor.process_all_html_files()
+        seconds = time.perf_counter() - start
+        peak_memory_mb = None
+        if tracemalloc.is_tracing():
+            peak_memory_mb = (tracemalloc.get_traced_memory()[1] - initial_memory) / 2 ** 20
+
+    pages = sum(summary["pages"].values())
+    return {
+        "segundos": seconds,
+        "etapas": {stage: timer.seconds[stage] for stage in STAGES},
+        "paginas": pages,
+        "bytes_leidos": summary["bytes"]["input"],
+        "bytes_escritos": summary["bytes"]["output"],
+        "imagenes_fallidas": summary["images"]["failed"],
+        "memoria_pico_mb": peak_memory_mb,
+    }
+
+def summarize_runs(runs: list) -> dict:
+    """
+    Resume varias corridas: mediana de los tiempos y máximo del pico de memoria.
+    """
+    seconds = statistics.median(run["segundos"] for run in runs)
+    first = runs[0]
+    peaks = [run["memoria_pico_mb"] for run in runs if run["memoria_pico_mb"] is not None]
+    return {
+        "segundos": seconds,
+        "paginas_por_segundo": first["paginas"] / seconds if seconds else None,
+        "mb_escritos_por_segundo": first["bytes_escritos"] / 2 ** 20 / seconds if seconds else None,
+        "memoria_pico_mb": max(peaks) if peaks else None,
+        "etapas": {stage: statistics.median(run["etapas"][stage] for run in runs) for stage in STAGES},
+        "paginas": first["paginas"],
+        "bytes_leidos": first["bytes_leidos"],
+        "bytes_escritos": first["bytes_escritos"],
+        "imagenes_fallidas": first["imagenes_fallidas"],
+    }
+
+def format_change(current: Optional[float], base: Optional[float]) -> str:
+    if not base or current is None:
+        return "n/a"
+    return f"{(current - base) / base * 100:+.1f}%"
+
+def format_number(value: Optional[float], decimals: int) -> str:
+    return "n/a" if value is None else f"{value:.{decimals}f}"
+
+def print_report(report: dict, base: Optional[dict] = None) -> None:
+    """
+    Muestra las métricas y el tiempo de cada etapa y, si se da un reporte base, la variación
+    respecto a él.
+    """
+    result = report["resultado"]
+    base_result = base["resultado"] if base else {}
+    print(f"\n--- Benchmark: {result['paginas']} páginas, {report['sitio']['images']} imágenes, "
+          f"{result['bytes_escritos'] / 2 ** 20:.1f} MB escritos ---")
+    header = f"{'Métrica':<24}{'Valor':>12}"
+    if base:
+        header += f"{'Base':>12}{'Var.':>10}"
+    print(header)
+    rows = [
+        ("segundos", result["segundos"], base_result.get("segundos"), 3),
+        ("páginas/s", result["paginas_por_segundo"], base_result.get("paginas_por_segundo"), 1),
+        ("MB escritos/s", result["mb_escritos_por_segundo"], base_result.get("mb_escritos_por_segundo"), 1),
+        ("memoria pico MB", result["memoria_pico_mb"], base_result.get("memoria_pico_mb"), 1),
+    ]
+    rows += [(f"etapa {stage} (s)", result["etapas"][stage], base_result.get("etapas", {}).get(stage), 3)
+             for stage in STAGES]
+    for name, value, base_value, decimals in rows:
+        line = f"{name:<24}{format_number(value, decimals):>12}"
+        if base:
+            line += f"{format_number(base_value, decimals):>12}{format_change(value, base_value):>10}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de HtmlProcessor sobre un sitio sintético.")
+    add_site_arguments(parser)
+    parser.add_argument('--sitio', type=str, help='Directorio de un sitio existente a medir (en lugar de generar uno).')
+    parser.add_argument('--workers', type=int, default=1, help='Número de hilos que procesan archivos HTML a la vez.')
+    parser.add_argument('--por_bloques', action='store_true', help='Mide el modo por bloques.')
+    parser.add_argument('--tamano_bloque', type=int, default=64 * 1024, help='Caracteres por bloque en el modo por bloques.')
+    parser.add_argument('--compartir_desde', type=int, default=0, help='Mide el modo de recursos compartidos (ver src/main.py).')
+    parser.add_argument('--limite_incrustar', type=int, default=0, help='Tamaño máximo en bytes de una imagen incrustada.')
+    parser.add_argument('--cache_mb', type=int, default=64, help='Tamaño de la caché de imágenes codificadas en MB (0 la desactiva).')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Número de corridas (se reporta la mediana de los tiempos).')
+    parser.add_argument('--reporte', type=str, help='Archivo JSON donde se guarda el reporte.')
+    parser.add_argument('--comparar', type=str, help='Reporte JSON base con el que se comparan los resultados.')
+    parser.add_argument('--sin_memoria', action='store_true', help='No mide la memoria (tracemalloc), para tiempos sin su sobrecosto.')
+    parser.add_argument('--verbose', action='store_true', help='Muestra la salida del procesamiento.')
+    args = parser.parse_args()
+
+    processor_options = {
+        "workers": args.workers,
+        "streaming": args.por_bloques,
+        "chunk_size": args.tamano_bloque,
+        "shared_asset_min_pages": args.compartir_desde,
+        "inline_max_bytes": args.limite_incrustar,
+        "cache_max_bytes": args.cache_mb * 1024 * 1024,
+    }
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        if args.sitio:
+            site_directory = os.path.abspath(args.sitio)
+            site = {"images": "n/a", "origen": site_directory}
+        else:
+            site_directory = os.path.join(work_directory, "sitio")
+            site = generate_site_from_args(site_directory, args)
+            print(f"Sitio sintético: {site['pages']} páginas, {site['images']} imágenes "
+                  f"({site['image_bytes'] / 2 ** 20:.1f} MB), {site['references']} referencias.")
+
+        if not args.sin_memoria:
+            tracemalloc.start()
+        runs = [run_once(site_directory, processor_options, args.verbose) for _ in range(args.repeticiones)]
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    report = {
+        "parametros": vars(args),
+        "sitio": site,
+        "python": sys.version.split()[0],
+        "resultado": summarize_runs(runs),
+    }
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+    print_report(report, base)
+
+    if args.reporte:
+        os.makedirs(os.path.dirname(os.path.abspath(args.reporte)), exist_ok=True)
+        with open(args.reporte, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Reporte guardado en {args.reporte}")
+
+if __name__ == "__main__":
+    main()
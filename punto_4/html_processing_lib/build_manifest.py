@@ -0,0 +1,243 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Iterable, List, Optional
+
+class BuildManifest:
+    """
+    Manifiesto persistente de una compilación incremental. Guarda, por cada archivo HTML
+    procesado, la huella de su contenido y de las imágenes que referencia, la ruta del archivo
+    generado y los resultados de sus imágenes. En la siguiente ejecución, las páginas cuyas
+    entradas no cambiaron se omiten y se reutilizan sus resultados.
+
+    La huella de un archivo es su tamaño, su fecha de modificación y el hash SHA-256 de su
+    contenido. Si el tamaño y la fecha coinciden no se vuelve a leer el archivo; si cambiaron
+    se compara el hash, así que tocar un archivo sin modificarlo no obliga a reprocesarlo.
+    Es seguro para usarse desde varios hilos.
+    """
+    DEFAULT_FILENAME = ".build_manifest.json"
+    VERSION = 2
+    HASH_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, manifest_path: str, options: Optional[dict] = None):
+        """
+        Inicializa el manifiesto y carga el de la ejecución anterior, si existe.
+
+        Args:
+            manifest_path (str): La ruta del archivo JSON del manifiesto.
+            options (Optional[dict]): Opciones que cambian el resultado del procesamiento. Si son
+                                      distintas a las del manifiesto guardado, se reprocesa todo.
+        """
+        self.manifest_path = os.path.abspath(manifest_path)
+        self.options = {"version": self.VERSION, **(options or {})}
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.unchanged = 0
+        self.rebuilt = 0
+        self.removed = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"No se pudo leer el manifiesto {self.manifest_path}, se reprocesará todo: {e}")
+            return
+        if data.get("options") != self.options:
+            print("Las opciones de procesamiento cambiaron, se reprocesarán todos los archivos.")
+            return
+        self._pages = data.get("pages", {})
+
+    def fingerprint(self, file_path: str, previous: Optional[dict] = None) -> Optional[dict]:
+        """
+        Calcula la huella de un archivo. Si `previous` tiene el mismo tamaño y fecha de
+        modificación, se reutiliza su hash sin leer el archivo.
+
+        Args:
+            file_path (str): La ruta absoluta del archivo.
+            previous (Optional[dict]): La huella guardada del mismo archivo, si existe.
+
+        Returns:
+            Optional[dict]: Tamaño (`size`), fecha de modificación (`mtime_ns`) y hash (`sha256`),
+                            o None si el archivo no existe o no se puede leer.
+        """
+        try:
+            stat_result = os.stat(file_path)
+            if (previous is not None and previous["size"] == stat_result.st_size
+                    and previous["mtime_ns"] == stat_result.st_mtime_ns):
+                return previous
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.HASH_BLOCK_SIZE), b""):
+                    digest.update(block)
+        except OSError:
+            return None
+        return {"size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns, "sha256": digest.hexdigest()}
+
+    def _same_content(self, current: Optional[dict], previous: Optional[dict]) -> bool:
+        if current is None or previous is None:
+            return current is previous
+        return current["sha256"] == previous["sha256"]
+
+    def get_image_references(self, html_file_path: str) -> Optional[List[str]]:
+        """
+        Devuelve las imágenes que referencia un archivo HTML según el manifiesto, si el archivo
+        no cambió desde que se guardaron (no depende de si cambiaron las imágenes).
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
+
+        Returns:
+            Optional[List[str]]: Las rutas absolutas de sus imágenes, o None si hay que leer el archivo.
+        """
+        with self._lock:
+            entry = self._pages.get(html_file_path)
+        if entry is None or not self._same_content(self.fingerprint(html_file_path, entry["html"]), entry["html"]):
+            return None
+        return list(entry["images"])
+
+    def get_unchanged_entry(self, html_file_path: str, shared_image_paths: Optional[set] = None) -> Optional[dict]:
+        """
+        Devuelve la entrada guardada de un archivo HTML si ni él ni sus imágenes cambiaron y
+        su archivo procesado sigue existiendo. Si solo cambiaron las fechas de modificación,
+        actualiza las huellas guardadas.
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
+            shared_image_paths (Optional[set]): Las imágenes que se enlazan como recursos
+                                                compartidos en esta ejecución. Si cambia cuáles de
+                                                las imágenes del archivo se comparten, hay que
+                                                procesarlo.
+
+        Returns:
+            Optional[dict]: La entrada con el archivo generado (`output`) y los resultados de sus
+                            imágenes (`results`), o None si hay que procesar el archivo.
+        """
+        with self._lock:
+            entry = self._pages.get(html_file_path)
+        if entry is None or not os.path.exists(entry["output"]):
+            return None
+        shared_images = sorted(set(entry["images"]) & (shared_image_paths or set()))
+        if entry.get("shared", []) != shared_images:
+            return None
+
+        html_fingerprint = self.fingerprint(html_file_path, entry["html"])
+        if not self._same_content(html_fingerprint, entry["html"]):
+            return None
+        image_fingerprints = {}
+        for image_path, previous in entry["images"].items():
+            current = self.fingerprint(image_path, previous)
+            if not self._same_content(current, previous):
+                return None
+            image_fingerprints[image_path] = current
+
+        with self._lock:
+            entry = dict(entry, html=html_fingerprint, images=image_fingerprints)
+            self._pages[html_file_path] = entry
+            self.unchanged += 1
+        return entry
+
+    def record(self, html_file_path: str, html_fingerprint: Optional[dict], output_path: str,
+               image_paths: Iterable[str], image_results: dict, shared_image_paths: Optional[set] = None) -> None:
+        """
+        Guarda la entrada de un archivo HTML recién procesado.
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
+            html_fingerprint (Optional[dict]): La huella del archivo HTML tomada antes de leerlo.
+            output_path (str): La ruta absoluta del archivo procesado.
+            image_paths (Iterable[str]): Las rutas absolutas de las imágenes que referencia,
+                                         incluidas las que fallaron (ej. porque no existen).
+            image_results (dict): Los resultados de sus imágenes (`success`/`fail` y el detalle de
+                                  cada referencia en `images`, ver `HtmlImageReplacer`).
+            shared_image_paths (Optional[set]): Las imágenes que se enlazan como recursos compartidos.
+        """
+        if html_fingerprint is None or not output_path:
+            self.forget(html_file_path)
+            return
+        images = {image_path: self.fingerprint(image_path) for image_path in sorted(set(image_paths))}
+        entry = {
+            "html": html_fingerprint,
+            "output": output_path,
+            "images": images,
+            "results": {
+                "success": image_results["success"],
+                "fail": image_results["fail"],
+                "images": [{key: image[key] for key in ("src", "path", "status", "bytes", "error")}
+                           for image in image_results["images"]],
+            },
+        }
+        if shared_image_paths:
+            entry["shared"] = sorted(set(images) & shared_image_paths)
+        with self._lock:
+            self._pages[html_file_path] = entry
+            self.rebuilt += 1
+
+    def forget(self, html_file_path: str) -> None:
+        """
+        Quita un archivo HTML del manifiesto (ej. si falló), para que se procese la próxima vez.
+        """
+        with self._lock:
+            self._pages.pop(html_file_path, None)
+
+    def remove_deleted_sources(self, html_file_paths: Iterable[str], output_root_directory: str) -> None:
+        """
+        Borra los archivos procesados cuyo archivo HTML original ya no existe, junto con los
+        directorios que queden vacíos dentro del directorio de salida.
+
+        Args:
+            html_file_paths (Iterable[str]): Las rutas absolutas de los archivos HTML actuales.
+            output_root_directory (str): La ruta absoluta del directorio de salida.
+        """
+        current_files = set(html_file_paths)
+        output_root_directory = os.path.abspath(output_root_directory)
+        with self._lock:
+            deleted_sources = sorted(path for path in self._pages if path not in current_files)
+            deleted_entries = [(path, self._pages.pop(path)) for path in deleted_sources]
+
+        for html_file_path, entry in deleted_entries:
+            output_path = entry["output"]
+            try:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                    print(f"Archivo procesado eliminado (su original ya no existe): {output_path}")
+                directory = os.path.dirname(output_path)
+                while directory.startswith(output_root_directory + os.sep) and not os.listdir(directory):
+                    os.rmdir(directory)
+                    directory = os.path.dirname(directory)
+            except OSError as e:
+                print(f"Error al eliminar el archivo procesado {output_path}: {e}")
+            self.removed += 1
+
+    def save(self) -> bool:
+        """
+        Guarda el manifiesto. Se escribe en un archivo temporal que luego reemplaza al anterior,
+        así una ejecución interrumpida no deja un manifiesto a medio escribir.
+
+        Returns:
+            bool: True si se guardó, False si hubo un error.
+        """
+        temporary_path = f"{self.manifest_path}.tmp"
+        with self._lock:
+            data = {"options": self.options, "pages": self._pages}
+            try:
+                os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+                with open(temporary_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, sort_keys=True)
+                os.replace(temporary_path, self.manifest_path)
+                return True
+            except Exception as e:
+                print(f"Error al guardar el manifiesto {self.manifest_path}: {e}")
+                return False
+
+    def stats(self) -> dict:
+        """
+        Devuelve cuántos archivos HTML se omitieron por no tener cambios (`unchanged`), cuántos se
+        procesaron (`rebuilt`) y cuántos archivos procesados se eliminaron (`removed`).
+        """
+        with self._lock:
+            return {"unchanged": self.unchanged, "rebuilt": self.rebuilt, "removed": self.removed}
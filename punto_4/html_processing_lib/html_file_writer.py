@@ -1,47 +1,236 @@
 import os
+import uuid
+import threading
+from urllib.parse import quote
+from typing import Callable, TextIO
 
 class HtmlFileWriter:
     """
     Clase encargada de escribir contenido HTML procesado a un nuevo archivo.
+    Cada archivo se escribe en un temporal del mismo directorio que luego lo reemplaza
+    (`os.replace`), así una ejecución interrumpida nunca deja un archivo procesado truncado.
+    Ante un corte de energía esto solo se garantiza con `fsync_batch_size` > 0: cada temporal
+    se sincroniza con el disco antes de renombrarlo, y los renombres (los directorios) se
+    sincronizan en lotes. Es segura para usarse desde varios hilos.
     """
-    def __init__(self, input_root_directory: str, output_root_directory: str):
+    WRITE_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, input_root_directory: str, output_root_directory: str,
+                 buffer_size: int = WRITE_BUFFER_SIZE, fsync_batch_size: int = 0):
         """
         Inicializa HtmlFileWriter con los directorios raíz de entrada y salida.
 
         Args:
             input_root_directory (str): La ruta absoluta del directorio raíz de los archivos HTML de entrada.
             output_root_directory (str): La ruta absoluta del directorio raíz donde se guardarán los archivos procesados.
+            buffer_size (int): Tamaño en bytes del búfer de escritura de cada archivo.
+            fsync_batch_size (int): Si es mayor que 0, cada archivo se sincroniza con el disco
+                                    (`fsync`) antes de reemplazar al archivo procesado, y sus
+                                    directorios se sincronizan en lotes de este número de
+                                    archivos (ver `sync`). Con 0 no se sincroniza nada y queda a
+                                    cargo del sistema operativo.
         """
         self.input_root_directory = os.path.abspath(input_root_directory)
         self.output_root_directory = os.path.abspath(output_root_directory)
+        self.buffer_size = buffer_size
+        self.fsync_batch_size = max(0, fsync_batch_size)
+        self._created_directories = set()
+        # Directorios con renombres sin sincronizar y número de archivos renombrados en ellos
+        self._unsynced_directories = set()
+        self._unsynced_files = 0
+        self._lock = threading.Lock()
 
-    def write_processed_html(self, original_file_path: str, processed_content: str) -> str:
+    def get_processed_file_path(self, original_file_path: str) -> str:
         """
-        Escribe el contenido HTML procesado a un nuevo archivo, añadiendo '_processed'
-        al nombre del archivo original.
+        Calcula la ruta del archivo procesado: la misma ruta relativa dentro del directorio de
+        salida, con '_processed' añadido al nombre del archivo. Crea su directorio si no existe
+        (cada directorio se crea una sola vez).
 
         Args:
             original_file_path (str): La ruta absoluta del archivo HTML original.
-            processed_content (str): El contenido HTML procesado a escribir.
 
         Returns:
-            str: La ruta absoluta del nuevo archivo procesado, o una cadena vacía si hay un error.
+            str: La ruta absoluta del archivo procesado.
         """
+        new_file_path = self._processed_file_path(original_file_path)
+        directory = os.path.dirname(new_file_path)
+        if directory not in self._created_directories:
+            os.makedirs(directory, exist_ok=True)
+            with self._lock:
+                self._created_directories.add(directory)
+        return new_file_path
+
+    def _processed_file_path(self, original_file_path: str) -> str:
         relative_path = os.path.relpath(original_file_path, self.input_root_directory)
         dirname = os.path.dirname(relative_path)
         basename = os.path.basename(original_file_path)
         name, ext = os.path.splitext(basename)
         new_filename = f"{name}_processed{ext}"
+        return os.path.join(self.output_root_directory, dirname, new_filename)
+
+    def get_relative_url(self, original_file_path: str, target_path: str) -> str:
+        """
+        Calcula la URL relativa desde el archivo procesado de un HTML hasta otro archivo (ej. una
+        imagen que se enlaza en lugar de incrustarse), para que el enlace funcione desde el
+        directorio de salida.
+
+        Args:
+            original_file_path (str): La ruta absoluta del archivo HTML original.
+            target_path (str): La ruta absoluta del archivo enlazado.
+
+        Returns:
+            str: La URL relativa, con '/' como separador y los caracteres especiales codificados.
+        """
+        relative_path = os.path.relpath(target_path, os.path.dirname(self._processed_file_path(original_file_path)))
+        return quote(relative_path.replace(os.sep, '/'))
+
+    def _open_temporary_file(self, new_file_path: str) -> tuple[str, TextIO]:
+        """
+        Crea un archivo temporal junto al archivo procesado (en el mismo directorio, para que
+        `os.replace` sea atómico) y lo abre en modo texto con el búfer de escritura.
+        """
+        directory, file_name = os.path.split(new_file_path)
+        temporary_path = os.path.join(directory, f".{file_name}.{uuid.uuid4().hex[:12]}.tmp")
+        # Con os.open y 0o666 el archivo recibe los mismos permisos (según la umask) que con open()
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+        try:
+            file_descriptor = os.open(temporary_path, flags, 0o666)
+        except FileNotFoundError:
+            # El directorio se borró después de crearlo (ej. entre dos ejecuciones)
+            os.makedirs(directory, exist_ok=True)
+            file_descriptor = os.open(temporary_path, flags, 0o666)
+        try:
+            return temporary_path, os.fdopen(file_descriptor, 'w', encoding='utf-8', buffering=self.buffer_size)
+        except Exception:
+            os.close(file_descriptor)
+            os.remove(temporary_path)
+            raise
+
+    def _sync_temporary_file(self, f: TextIO) -> None:
+        """
+        Vacía el búfer del archivo temporal aún abierto y, si `fsync_batch_size` > 0, lo
+        sincroniza con el disco, para que su contenido esté completo antes de renombrarlo.
+        """
+        if self.fsync_batch_size:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _commit_temporary_file(self, temporary_path: str, new_file_path: str) -> None:
+        """
+        Reemplaza el archivo procesado por el temporal ya escrito, sincronizado y cerrado, y deja
+        su directorio pendiente de sincronizar si `fsync_batch_size` > 0.
+        """
+        os.replace(temporary_path, new_file_path)
+        if self.fsync_batch_size:
+            with self._lock:
+                self._unsynced_directories.add(os.path.dirname(new_file_path))
+                self._unsynced_files += 1
+                full_batch = self._unsynced_files >= self.fsync_batch_size
+            if full_batch:
+                self.sync()
+
+    def _remove_temporary_file(self, temporary_path: str) -> None:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+
+    def write_processed_html(self, original_file_path: str, processed_content: str) -> str:
+        """
+        Escribe el contenido HTML procesado a un nuevo archivo, añadiendo '_processed'
+        al nombre del archivo original. El contenido se escribe en un archivo temporal que
+        luego reemplaza al archivo procesado, así una ejecución interrumpida nunca deja un
+        archivo procesado a medio escribir.
 
-        output_dir = os.path.join(self.output_root_directory, dirname)
-        os.makedirs(output_dir, exist_ok=True)
+        Args:
+            original_file_path (str): La ruta absoluta del archivo HTML original.
+            processed_content (str): El contenido HTML procesado a escribir.
 
-        new_file_path = os.path.join(output_dir, new_filename)
+        Returns:
+            str: La ruta absoluta del nuevo archivo procesado, o una cadena vacía si hay un error.
+        """
+        new_file_path = self.get_processed_file_path(original_file_path)
 
+        temporary_path = None
         try:
-            with open(new_file_path, 'w', encoding='utf-8') as f:
+            temporary_path, f = self._open_temporary_file(new_file_path)
+            with f:
                 f.write(processed_content)
+                self._sync_temporary_file(f)
+            self._commit_temporary_file(temporary_path, new_file_path)
             return new_file_path
         except Exception as e:
+            if temporary_path is not None:
+                self._remove_temporary_file(temporary_path)
             print(f"Error al escribir el archivo procesado {new_file_path}: {e}")
             return ""
+
+    def write_processed_html_stream(self, original_file_path: str, write_content: Callable[[TextIO], dict]) -> tuple[str, dict]:
+        """
+        Escribe el archivo procesado por bloques: abre un archivo temporal y se lo entrega a
+        `write_content`, que escribe el contenido a medida que lo genera. Cuando termina, el
+        temporal reemplaza al archivo procesado; si `write_content` falla, se borra.
+
+        Args:
+            original_file_path (str): La ruta absoluta del archivo HTML original.
+            write_content (Callable[[TextIO], dict]): Función que escribe el contenido en el archivo
+                                                      abierto y devuelve sus resultados.
+
+        Returns:
+            tuple[str, dict]: La ruta absoluta del nuevo archivo procesado (o una cadena vacía si no
+                              se pudo escribir) y lo que devuelve `write_content`.
+        """
+        new_file_path = self.get_processed_file_path(original_file_path)
+
+        try:
+            temporary_path, f = self._open_temporary_file(new_file_path)
+        except Exception as e:
+            print(f"Error al escribir el archivo procesado {new_file_path}: {e}")
+            return "", None
+        try:
+            with f:
+                results = write_content(f)
+                self._sync_temporary_file(f)
+        except BaseException:
+            self._remove_temporary_file(temporary_path)
+            raise
+        try:
+            self._commit_temporary_file(temporary_path, new_file_path)
+        except Exception as e:
+            self._remove_temporary_file(temporary_path)
+            print(f"Error al escribir el archivo procesado {new_file_path}: {e}")
+            return "", results
+        return new_file_path, results
+
+    def sync(self) -> bool:
+        """
+        Sincroniza con el disco (`fsync`) los directorios con archivos procesados renombrados
+        desde la última llamada, de modo que los renombres sobrevivan a un corte de energía (el
+        contenido de cada archivo ya se sincronizó antes de renombrarlo). Se llama cada
+        `fsync_batch_size` archivos y al terminar el procesamiento, antes de guardar el
+        manifiesto incremental.
+
+        Returns:
+            bool: True si se sincronizaron todos, False si hubo un error.
+        """
+        with self._lock:
+            directories, self._unsynced_directories = self._unsynced_directories, set()
+            self._unsynced_files = 0
+        success = True
+        for directory in sorted(directories):
+            try:
+                file_descriptor = os.open(directory, os.O_RDONLY)
+            except OSError as e:
+                # En Windows no se pueden abrir directorios; los archivos ya están sincronizados
+                if not os.path.isdir(directory):
+                    print(f"Error al sincronizar {directory}: {e}")
+                    success = False
+                continue
+            try:
+                os.fsync(file_descriptor)
+            except OSError as e:
+                print(f"Error al sincronizar {directory}: {e}")
+                success = False
+            finally:
+                os.close(file_descriptor)
+        return success
@@ -1,12 +1,23 @@
 import os
 import re
+import html
+import time
+from typing import Callable, Iterator, List, Optional, TextIO, Tuple
+from urllib.parse import unquote
 from .image_encoder import ImageEncoder
+from .html_tag_tokenizer import HtmlTagTokenizer
 
 class HtmlImageReplacer:
     """
     Clase encargada de encontrar y reemplazar las rutas de imágenes en un contenido HTML
     por sus representaciones en Base64.
     """
+    # Elementos cuyo contenido es texto y no etiquetas (las etiquetas que contengan no se procesan)
+    RAW_TEXT_ELEMENTS = ('script', 'style', 'textarea', 'title', 'xmp', 'iframe', 'noembed', 'noframes')
+    # Caracteres que se conservan al final de un bloque por si inician una etiqueta o un comentario ('<!-')
+    TAG_START_LOOKBEHIND = 3
+    # Caracteres que se conservan por si cierran un comentario o un elemento de texto ('</noframes')
+    TEXT_END_LOOKBEHIND = max(len(name) for name in RAW_TEXT_ELEMENTS) + 2
     def __init__(self, image_encoder: ImageEncoder):
         """
         Inicializa HtmlImageReplacer con una instancia de ImageEncoder.
@@ -15,7 +26,22 @@ class HtmlImageReplacer:
             image_encoder (ImageEncoder): Una instancia de ImageEncoder para codificar imágenes.
         """
         self.image_encoder = image_encoder
-        self.img_src_pattern = re.compile(r'<img[^>]+src=("|")(.*?)\1[^>]*>', re.IGNORECASE)
+        self.tag_tokenizer = HtmlTagTokenizer()
+        # Inicio de una etiqueta de apertura o de un comentario
+        self.tag_start_pattern = re.compile(r'<(?:[a-zA-Z]|!--)')
+        self.tag_name_pattern = re.compile(r'<([a-zA-Z][^\s/>]*)')
+        self.comment_end_pattern = re.compile(r'-->')
+        self.raw_text_end_patterns = {
+            name: re.compile(r'</' + name + r'[\s/>]', re.IGNORECASE) for name in self.RAW_TEXT_ELEMENTS
+        }
+        self.tag_delimiter_pattern = re.compile(r'[>=]')
+        # Función (archivo HTML, ruta de la imagen) -> URL con la que se enlazan las imágenes que
+        # no se incrustan por su tamaño (ver ImageEncoder.inline_max_bytes). Si es None, se
+        # conserva la URL original.
+        self.link_resolver: Optional[Callable[[str, str], str]] = None
+        # Recursos compartidos (ver SharedAssetStore): las imágenes que tienen un recurso se
+        # enlazan en lugar de incrustarse. Lo asigna HtmlProcessor.
+        self.shared_assets = None
 
     def _resolve_image_path(self, html_file_path: str, image_src: str) -> str:
         """
@@ -33,45 +59,373 @@ class HtmlImageReplacer:
         else:
             return os.path.abspath(os.path.join(os.path.dirname(html_file_path), image_src))
 
-    def replace_images_with_base64(self, html_content: str, html_file_path: str) -> tuple[str, dict]:
+    def _find_tag_end(self, text: str, start: int, at_eof: bool) -> int:
         """
-        Encuentra todas las imágenes en el contenido HTML y reemplaza sus atributos 'src'
-        con la representación Base64 de la imagen.
+        Busca el cierre '>' de la etiqueta que empieza en `start`, sin tomar como cierre
+        los '>' dentro de valores de atributos entre comillas.
+
+        Args:
+            text (str): El texto donde está la etiqueta.
+            start (int): La posición del '<' de la etiqueta.
+            at_eof (bool): Si `text` llega hasta el final del documento. Si es False y la etiqueta
+                           (o un valor entre comillas) no termina en `text`, se necesita más texto.
+
+        Returns:
+            int: La posición siguiente al '>' de cierre, o -1 si hace falta leer más texto
+                 (o, al final del documento, si la etiqueta no se cierra).
+        """
+        position = start + 1
+        while True:
+            delimiter = self.tag_delimiter_pattern.search(text, position)
+            if delimiter is None:
+                return -1
+            if delimiter.group(0) == '>':
+                return delimiter.end()
+            value_start = delimiter.end()
+            while value_start < len(text) and text[value_start] in ' \t\n\r\f':
+                value_start += 1
+            if value_start == len(text):
+                return -1 if not at_eof else self._find_unquoted_tag_end(text, start)
+            if text[value_start] in '"\'':
+                value_end = text.find(text[value_start], value_start + 1)
+                if value_end == -1:
+                    return -1 if not at_eof else self._find_unquoted_tag_end(text, start)
+                position = value_end + 1
+            else:
+                position = value_start
+
+    def _find_unquoted_tag_end(self, text: str, start: int) -> int:
+        end = text.find('>', start)
+        return end + 1 if end != -1 else -1
+
+    def _raw_text_end_pattern(self, tag: str) -> Optional[re.Pattern]:
+        """
+        Devuelve el patrón del cierre de la etiqueta si su contenido es texto (ej. <script>),
+        o None si no lo es.
+        """
+        tag_name = self.tag_name_pattern.match(tag)
+        return self.raw_text_end_patterns.get(tag_name.group(1).lower()) if tag_name else None
+
+    def _iter_html_segments(self, read_chunk: Callable[[], str]) -> Iterator[tuple[bool, str]]:
+        """
+        Recorre un documento HTML leído por bloques y lo separa en etiquetas de apertura y
+        texto intermedio. Las etiquetas partidas entre dos bloques se completan con el bloque
+        siguiente, así que en memoria solo queda el bloque en curso y la etiqueta incompleta.
+        Los comentarios (<!-- ... -->) y el contenido de los elementos de texto como <script>,
+        <style> o <textarea> se devuelven como texto, aunque contengan etiquetas.
+
+        Args:
+            read_chunk (Callable[[], str]): Función que devuelve el siguiente bloque de texto,
+                                            o una cadena vacía al final del documento.
+
+        Yields:
+            tuple[bool, str]: (True, etiqueta) para cada etiqueta de apertura completa y (False, texto)
+                              para el texto entre etiquetas, en el orden del documento.
+        """
+        buffer = ""
+        at_eof = False
+        # Patrón que cierra el comentario o el elemento de texto en curso
+        text_end_pattern = None
+        while not at_eof:
+            chunk = read_chunk()
+            at_eof = not chunk
+            buffer += chunk
+            position = 0
+            while True:
+                if text_end_pattern is not None:
+                    text_end = text_end_pattern.search(buffer, position)
+                    if text_end is None:
+                        # Se conserva el final del bloque por si el cierre quedó partido
+                        keep_from = len(buffer) if at_eof else max(position, len(buffer) - self.TEXT_END_LOOKBEHIND)
+                        if keep_from > position:
+                            yield False, buffer[position:keep_from]
+                        position = keep_from
+                        break
+                    yield False, buffer[position:text_end.end()]
+                    position = text_end.end()
+                    text_end_pattern = None
+
+                tag_start = self.tag_start_pattern.search(buffer, position)
+                if tag_start is None:
+                    keep_from = len(buffer) if at_eof else max(position, len(buffer) - self.TAG_START_LOOKBEHIND)
+                    if keep_from > position:
+                        yield False, buffer[position:keep_from]
+                    position = keep_from
+                    break
+                if tag_start.group(0) == '<!--':
+                    # El cierre '-->' se busca desde el segundo carácter, así '<!-->' es un comentario vacío
+                    yield False, buffer[position:tag_start.start() + 2]
+                    position = tag_start.start() + 2
+                    text_end_pattern = self.comment_end_pattern
+                    continue
+                tag_end = self._find_tag_end(buffer, tag_start.start(), at_eof)
+                if tag_end == -1:
+                    if at_eof:
+                        yield False, buffer[position:]
+                        position = len(buffer)
+                    elif tag_start.start() > position:
+                        yield False, buffer[position:tag_start.start()]
+                        position = tag_start.start()
+                    break
+                if tag_start.start() > position:
+                    yield False, buffer[position:tag_start.start()]
+                tag = buffer[tag_start.start():tag_end]
+                yield True, tag
+                position = tag_end
+                text_end_pattern = self._raw_text_end_pattern(tag)
+            buffer = buffer[position:]
+
+    def _image_path_from_url(self, image_src: str) -> str:
+        """
+        Convierte una URL relativa o absoluta de una imagen en una ruta del sistema de archivos:
+        decodifica las entidades HTML (ej. '&amp;') y los caracteres '%XX', y quita la
+        consulta ('?v=2') y el fragmento ('#id').
+        """
+        image_path = html.unescape(image_src).split('#', 1)[0].split('?', 1)[0]
+        return unquote(image_path)
+
+    def resolve_image_reference(self, html_file_path: str, image_src: str) -> str:
+        """
+        Devuelve la ruta absoluta de la imagen a la que apunta una URL de un archivo HTML, tal
+        como la resuelve el reemplazo (ej. para las claves de los resultados de imágenes).
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
+            image_src (str): La URL de la imagen, como aparece en el HTML.
+
+        Returns:
+            str: La ruta absoluta de la imagen.
+        """
+        return self._resolve_image_path(html_file_path, self._image_path_from_url(image_src))
+
+    def _link_to_image(self, html_file_path: str, absolute_image_path: str, image_src: str) -> str:
+        """
+        Devuelve la URL con la que se enlaza una imagen que no se incrusta por su tamaño.
+        """
+        if self.link_resolver is None:
+            return image_src
+        return html.escape(self.link_resolver(html_file_path, absolute_image_path))
+
+    def _record_image(self, image_processing_results: dict, image_src: str, absolute_image_path: str, status: str,
+                      written: Optional[int], started: float, error: Optional[str] = None) -> None:
+        """
+        Registra el resultado de una imagen: en `success` o `fail` y, con su estado, los
+        caracteres escritos en la página y el tiempo que tomó, en la lista `images`.
+        """
+        if error is None:
+            image_processing_results["success"][image_src] = absolute_image_path
+        else:
+            image_processing_results["fail"][image_src] = error
+        image_processing_results["images"].append({
+            "src": image_src, "path": absolute_image_path, "status": status,
+            "bytes": written, "seconds": time.perf_counter() - started, "error": error,
+        })
+
+    def _shared_asset_url(self, html_file_path: str, absolute_image_path: str) -> Optional[str]:
+        """
+        Devuelve la URL del recurso compartido de una imagen, o None si la imagen se incrusta.
+        """
+        if self.shared_assets is None or self.link_resolver is None:
+            return None
+        asset_path = self.shared_assets.get_asset_path(absolute_image_path)
+        if asset_path is None:
+            return None
+        asset_url = html.escape(self.link_resolver(html_file_path, asset_path))
+        self.shared_assets.record_reference(absolute_image_path, len(asset_url))
+        return asset_url
+
+    def find_image_paths(self, html_input: TextIO, html_file_path: str, chunk_size: int = 64 * 1024) -> List[str]:
+        """
+        Recorre un archivo HTML por bloques y devuelve las rutas absolutas de las imágenes locales
+        que se reemplazarían, sin leerlas ni codificarlas.
+
+        Args:
+            html_input (TextIO): El archivo HTML abierto en modo texto.
+            html_file_path (str): La ruta absoluta del archivo HTML.
+            chunk_size (int): Número de caracteres por bloque de lectura.
+
+        Returns:
+            List[str]: Las rutas absolutas de las imágenes, sin repetir, en el orden del documento.
+        """
+        image_paths = {}
+        for is_tag, segment in self._iter_html_segments(lambda: html_input.read(chunk_size)):
+            if is_tag and self._tag_may_reference_images(segment):
+                for start, end in self._find_image_references(segment):
+                    image_paths[self.resolve_image_reference(html_file_path, segment[start:end])] = None
+        return list(image_paths)
+
+    def _find_image_references(self, tag: str) -> List[Tuple[int, int]]:
+        """
+        Ubica en una sola pasada las referencias a imágenes locales de una etiqueta: el 'src'
+        y las URL del 'srcset' de <img> (y del 'srcset' de <source>) y las URL de los url() del
+        atributo 'style' de cualquier etiqueta. Se omiten las imágenes remotas, las que ya
+        están en Base64 y los valores vacíos.
+
+        Args:
+            tag (str): La etiqueta completa.
+
+        Returns:
+            List[Tuple[int, int]]: Posición de inicio y fin de cada URL dentro de la etiqueta, en orden.
+        """
+        tag_name, attributes = self.tag_tokenizer.tokenize(tag)
+        references = []
+        for attribute in attributes:
+            if tag_name == 'img' and attribute.name == 'src':
+                references.append((attribute.value_start, attribute.value_end))
+            elif tag_name in ('img', 'source') and attribute.name == 'srcset':
+                value = tag[attribute.value_start:attribute.value_end]
+                references.extend((attribute.value_start + start, attribute.value_start + end)
+                                  for start, end in self.tag_tokenizer.iter_srcset_urls(value))
+            elif attribute.name == 'style':
+                value = tag[attribute.value_start:attribute.value_end]
+                references.extend((attribute.value_start + start, attribute.value_start + end)
+                                  for start, end in self.tag_tokenizer.iter_css_urls(value))
+        references.sort()
+        return [
+            (start, end) for start, end in references
+            if start < end and not tag[start:end].lower().startswith(('http://', 'https://', 'data:', '//'))
+        ]
+
+    def _tag_may_reference_images(self, tag: str) -> bool:
+        """
+        Descarta sin tokenizar las etiquetas que no pueden tener imágenes (la mayoría).
+        """
+        return tag[1:4].lower() == 'img' or tag[1:7].lower() == 'source' or 'url(' in tag.lower()
+
+    def _replace_tag(self, original_tag: str, html_file_path: str, image_processing_results: dict,
+                     encoded_images: Optional[dict] = None) -> str:
+        """
+        Devuelve una etiqueta con sus imágenes reemplazadas por sus data URI en Base64. Cada
+        URL se reemplaza por posición, conservando las comillas originales del atributo. Las
+        imágenes que están en `encoded_images` no se vuelven a codificar.
+        """
+        if not self._tag_may_reference_images(original_tag):
+            return original_tag
+
+        processed_parts = []
+        last_end = 0
+        for start, end in self._find_image_references(original_tag):
+            image_src = original_tag[start:end]
+            absolute_image_path = self.resolve_image_reference(html_file_path, image_src)
+            started = time.perf_counter()
+
+            status = "shared"
+            success, result = True, self._shared_asset_url(html_file_path, absolute_image_path)
+            if result is None:
+                status = "inlined"
+                if encoded_images is not None and absolute_image_path in encoded_images:
+                    success, result = encoded_images[absolute_image_path]
+                else:
+                    success, result = self.image_encoder.image_to_base64(absolute_image_path)
+                if success and result is None:
+                    status = "linked"
+                    result = self._link_to_image(html_file_path, absolute_image_path, image_src)
+
+            if success:
+                processed_parts.append(original_tag[last_end:start])
+                processed_parts.append(result)
+                last_end = end
+                self._record_image(image_processing_results, image_src, absolute_image_path, status,
+                                   len(result), started)
+            else:
+                self._record_image(image_processing_results, image_src, absolute_image_path, "failed",
+                                   None, started, result)
+        processed_parts.append(original_tag[last_end:])
+        return "".join(processed_parts)
+
+    def replace_images_with_base64(self, html_content: str, html_file_path: str,
+                                   encoded_images: Optional[dict] = None) -> tuple[str, dict]:
+        """
+        Encuentra todas las imágenes locales en el contenido HTML (src, srcset y url() de
+        style) y las reemplaza con la representación Base64 de la imagen.
 
         Args:
             html_content (str): El contenido HTML como una cadena.
             html_file_path (str): La ruta absoluta del archivo HTML original.
+            encoded_images (Optional[dict]): Resultados de `ImageEncoder.image_to_base64` ya
+                                             calculados, por ruta absoluta de la imagen (ej. en
+                                             `AsyncHtmlProcessor`). Las imágenes que no están se
+                                             codifican al reemplazarlas.
 
         Returns:
             tuple[str, dict]: Una tupla que contiene el contenido HTML modificado y un diccionario
-                              con los resultados del procesamiento de imágenes.
+                              con los resultados del procesamiento de imágenes: `success` (URL ->
+                              ruta absoluta), `fail` (URL -> error) e `images` (una entrada por
+                              referencia con su estado, bytes escritos y tiempo).
         """
-        image_processing_results = {"success": {}, "fail": {}}
+        image_processing_results = {"success": {}, "fail": {}, "images": []}
+        chunks = iter((html_content,))
+
+        processed_parts = []
+        for is_tag, segment in self._iter_html_segments(lambda: next(chunks, "")):
+            if is_tag:
+                segment = self._replace_tag(segment, html_file_path, image_processing_results, encoded_images)
+            processed_parts.append(segment)
+        return "".join(processed_parts), image_processing_results
 
-        def _replacer(match):
-            original_tag = match.group(0)
-            image_src = match.group(2)
+    def _write_tag_streaming(self, original_tag: str, html_file_path: str, output: TextIO,
+                             image_processing_results: dict, chunk_size: int) -> None:
+        """
+        Escribe una etiqueta en `output` copiando sus imágenes en Base64 por bloques,
+        sin construir los data URI completos en memoria.
+        """
+        if not self._tag_may_reference_images(original_tag):
+            output.write(original_tag)
+            return
 
-            if image_src.startswith(('http://', 'https://', 'data:')):
-                return original_tag
+        last_end = 0
+        for start, end in self._find_image_references(original_tag):
+            image_src = original_tag[start:end]
+            absolute_image_path = self.resolve_image_reference(html_file_path, image_src)
+            started = time.perf_counter()
 
-            absolute_image_path = self._resolve_image_path(html_file_path, image_src)
-            
-            success, result = self.image_encoder.image_to_base64(absolute_image_path)
+            status = "shared"
+            shared_asset_url = self._shared_asset_url(html_file_path, absolute_image_path)
+            if shared_asset_url is not None:
+                success, result = True, iter((shared_asset_url,))
+            else:
+                status = "inlined"
+                success, result = self.image_encoder.iter_base64(absolute_image_path, chunk_size)
+                if success and result is None:
+                    status = "linked"
+                    result = iter((self._link_to_image(html_file_path, absolute_image_path, image_src),))
 
             if success:
-                src_attribute_match = re.search(r'src=("|")' + re.escape(image_src) + r'("|")', original_tag, re.IGNORECASE)
-                if src_attribute_match:
-                    old_src_full_string = src_attribute_match.group(0) 
-                    new_src_full_string = f'src="{result}"'
-                    image_processing_results["success"][image_src] = absolute_image_path
-                    return original_tag.replace(old_src_full_string, new_src_full_string)
-                else:
-                    image_processing_results["fail"][image_src] = f"No se pudo encontrar el atributo src en la etiqueta: {original_tag}"
-                    return original_tag
+                output.write(original_tag[last_end:start])
+                written = 0
+                for encoded_chunk in result:
+                    output.write(encoded_chunk)
+                    written += len(encoded_chunk)
+                last_end = end
+                self._record_image(image_processing_results, image_src, absolute_image_path, status,
+                                   written, started)
             else:
-                image_processing_results["fail"][image_src] = result
-                return original_tag
+                self._record_image(image_processing_results, image_src, absolute_image_path, "failed",
+                                   None, started, result)
+        output.write(original_tag[last_end:])
+
+    def rewrite_stream(self, html_input: TextIO, output: TextIO, html_file_path: str,
+                       chunk_size: int = 64 * 1024) -> dict:
+        """
+        Versión por bloques de `replace_images_with_base64`: lee el HTML de `html_input` por
+        bloques, copia a `output` el texto que no cambia y escribe cada imagen en Base64 por
+        bloques. La memoria usada queda acotada por `chunk_size` (y por la etiqueta más
+        larga) en lugar de por el tamaño de la página y sus imágenes. El resultado es idéntico
+        al de `replace_images_with_base64`.
+
+        Args:
+            html_input (TextIO): El archivo HTML original abierto en modo texto.
+            output (TextIO): El archivo de salida abierto en modo texto.
+            html_file_path (str): La ruta absoluta del archivo HTML original.
+            chunk_size (int): Número de caracteres por bloque de lectura y de Base64 escrito.
 
-        processed_html = self.img_src_pattern.sub(_replacer, html_content)
-        return processed_html, image_processing_results
+        Returns:
+            dict: Un diccionario con los resultados del procesamiento de imágenes.
+        """
+        image_processing_results = {"success": {}, "fail": {}, "images": []}
+        for is_tag, segment in self._iter_html_segments(lambda: html_input.read(chunk_size)):
+            if is_tag:
+                self._write_tag_streaming(segment, html_file_path, output, image_processing_results, chunk_size)
+            else:
+                output.write(segment)
+        return image_processing_results
@@ -1,19 +1,118 @@
 import os
-from typing import List
+import re
+import fnmatch
+from typing import Iterable, Iterator, List, Optional, TextIO
 
 class HtmlReader:
     """
     Clase encargada de encontrar y leer archivos HTML dentro de una ruta especificada,
     incluyendo subcarpetas.
     """
-    def __init__(self, root_path: str):
+    DEFAULT_INCLUDE_PATTERNS = ('*.html', '*.htm')
+    DEFAULT_EXCLUDE_PATTERNS = ('.git', 'node_modules')
+
+    def __init__(self, root_path: str, include_patterns: Optional[Iterable[str]] = None,
+                 exclude_patterns: Optional[Iterable[str]] = None, max_depth: Optional[int] = None,
+                 follow_symlinks: bool = False):
         """
         Inicializa HtmlReader con la ruta raíz donde buscar archivos HTML.
 
+        Los patrones son de tipo glob (ej. '*.html', 'docs/*', 'build') y no distinguen
+        mayúsculas. Un patrón sin '/' se compara con el nombre del archivo o directorio y uno con
+        '/' con su ruta relativa a la raíz (con '/' como separador).
+
         Args:
             root_path (str): La ruta absoluta del directorio raíz.
+            include_patterns (Optional[Iterable[str]]): Archivos que se buscan. Por defecto '*.html' y '*.htm'.
+            exclude_patterns (Optional[Iterable[str]]): Archivos y directorios que se omiten; los
+                                                        directorios excluidos no se recorren. Por
+                                                        defecto '.git' y 'node_modules'.
+            max_depth (Optional[int]): Profundidad máxima de subdirectorios (0 = solo la raíz).
+                                       Si es None no hay límite.
+            follow_symlinks (bool): Si es True, se recorren los enlaces simbólicos a directorios,
+                                    sin volver a entrar en un directorio ya visitado (evita ciclos).
         """
         self.root_path = os.path.abspath(root_path)
+        self.include_patterns = list(include_patterns or self.DEFAULT_INCLUDE_PATTERNS)
+        self.exclude_patterns = list(self.DEFAULT_EXCLUDE_PATTERNS if exclude_patterns is None else exclude_patterns)
+        self._include_matchers = self._compile_patterns(self.include_patterns)
+        self._exclude_matchers = self._compile_patterns(self.exclude_patterns)
+        self.max_depth = max_depth
+        self.follow_symlinks = follow_symlinks
+        self.excluded_directories = set()
+
+    def exclude_directory(self, directory: str) -> None:
+        """
+        Excluye un directorio de la búsqueda (ej. el directorio de salida, si está dentro de la raíz).
+
+        Args:
+            directory (str): La ruta del directorio.
+        """
+        self.excluded_directories.add(os.path.abspath(directory))
+
+    def _compile_patterns(self, patterns: List[str]) -> tuple:
+        # Una sola expresión regular para los patrones de nombre y otra para los de ruta relativa
+        name_patterns = [fnmatch.translate(pattern) for pattern in patterns if '/' not in pattern]
+        path_patterns = [fnmatch.translate(pattern) for pattern in patterns if '/' in pattern]
+        return tuple(re.compile('|'.join(group), re.IGNORECASE).match if group else None
+                     for group in (name_patterns, path_patterns))
+
+    def _matches(self, matchers: tuple, name: str, relative_path: str) -> bool:
+        name_matcher, path_matcher = matchers
+        return bool((name_matcher and name_matcher(name)) or (path_matcher and path_matcher(relative_path)))
+
+    def iter_html_files(self) -> Iterator[str]:
+        """
+        Recorre la ruta raíz y sus subcarpetas con `os.scandir` y devuelve los archivos HTML a
+        medida que los encuentra, sin esperar a recorrer todo el árbol. El orden es el mismo que
+        el de `os.walk`: los archivos de cada directorio y luego sus subdirectorios.
+
+        Yields:
+            str: La ruta absoluta de cada archivo HTML.
+        """
+        visited_directories = set()
+        # Pila de (iterador de subdirectorios pendientes, profundidad de esos subdirectorios)
+        pending = [(iter([(self.root_path, '')]), 0)]
+        while pending:
+            subdirectories, depth = pending[-1]
+            next_directory = next(subdirectories, None)
+            if next_directory is None:
+                pending.pop()
+                continue
+            directory, relative_directory = next_directory
+
+            if self.follow_symlinks:
+                try:
+                    stat_result = os.stat(directory)
+                except OSError:
+                    continue
+                directory_id = (stat_result.st_dev, stat_result.st_ino)
+                if directory_id in visited_directories:
+                    continue
+                visited_directories.add(directory_id)
+
+            child_directories = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = f"{relative_directory}{entry.name}"
+                        try:
+                            is_directory = entry.is_dir(follow_symlinks=self.follow_symlinks)
+                            is_file = not is_directory and entry.is_file()
+                        except OSError:
+                            continue
+                        if self._matches(self._exclude_matchers, entry.name, relative_path):
+                            continue
+                        if is_file and self._matches(self._include_matchers, entry.name, relative_path):
+                            yield entry.path
+                        elif (is_directory and (self.max_depth is None or depth < self.max_depth)
+                              and os.path.abspath(entry.path) not in self.excluded_directories):
+                            child_directories.append((entry.path, f"{relative_path}/"))
+            except OSError as e:
+                print(f"No se pudo leer el directorio {directory}: {e}")
+                continue
+            if child_directories:
+                pending.append((iter(child_directories), depth + 1))
 
     def find_html_files(self) -> List[str]:
         """
@@ -23,12 +122,7 @@ class HtmlReader:
         Returns:
             List[str]: Una lista de rutas absolutas a los archivos HTML.
         """
-        html_files = []
-        for dirpath, _, filenames in os.walk(self.root_path):
-            for filename in filenames:
-                if filename.endswith(('.html', '.htm')):
-                    html_files.append(os.path.join(dirpath, filename))
-        return html_files
+        return list(self.iter_html_files())
 
     def read_html_content(self, file_path: str) -> str:
         """
@@ -47,3 +141,20 @@ class HtmlReader:
                 return f.read()
         except Exception as e:
             raise IOError(f"Error al leer el archivo {file_path}: {e}")
+
+    def open_html_file(self, file_path: str) -> TextIO:
+        """
+        Abre un archivo HTML para leerlo por bloques (ver `HtmlImageReplacer.rewrite_stream`).
+
+        Args:
+            file_path (str): La ruta absoluta del archivo HTML a leer.
+
+        Returns:
+            TextIO: El archivo abierto en modo texto; quien lo abre debe cerrarlo.
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"El archivo no se encontró: {file_path}")
+        try:
+            return open(file_path, 'r', encoding='utf-8')
+        except Exception as e:
+            raise IOError(f"Error al leer el archivo {file_path}: {e}")
@@ -0,0 +1,172 @@
+import re
+import html
+from typing import Iterator, List, NamedTuple, Tuple
+
+class TagAttribute(NamedTuple):
+    """
+    Atributo de una etiqueta HTML con la posición de su valor dentro de la etiqueta.
+    """
+    name: str
+    value_start: int
+    value_end: int
+    quote: str
+
+class HtmlTagTokenizer:
+    """
+    Clase encargada de separar una etiqueta HTML en su nombre y sus atributos en una sola
+    pasada, siguiendo las reglas de HTML: valores entre comillas dobles, simples o sin
+    comillas, nombres sin distinguir mayúsculas y, si un atributo se repite, vale el primero.
+    También ubica las URL dentro de los valores de `srcset` y de los `url()` de CSS, de modo
+    que los reemplazos se hacen por posición sin volver a buscar en la etiqueta.
+    """
+    WHITESPACE = ' \t\n\r\f'
+    # Los url() de CSS pueden ir entre comillas dobles, simples o sin comillas
+    css_url_pattern = re.compile(r'''url\(\s*(?:"([^"]*)"|'([^']*)'|([^)"'\s]*))\s*\)''', re.IGNORECASE)
+    # Referencias de caracteres de HTML (ej. '&quot;', '&#39;', '&amp')
+    entity_pattern = re.compile(r'&(?:#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[A-Za-z][A-Za-z0-9]*;?)')
+
+    def tokenize(self, tag: str) -> Tuple[str, List[TagAttribute]]:
+        """
+        Separa una etiqueta de apertura (ej. '<img src="a.png" alt=x>') en nombre y atributos.
+
+        Args:
+            tag (str): La etiqueta completa, desde '<' hasta '>'.
+
+        Returns:
+            Tuple[str, List[TagAttribute]]: El nombre de la etiqueta en minúsculas y sus atributos
+                                            (sin repetidos) en el orden en que aparecen. Los
+                                            atributos sin valor tienen value_start == value_end.
+        """
+        length = len(tag)
+        position = 1
+        while position < length and tag[position] not in self.WHITESPACE and tag[position] not in '/>':
+            position += 1
+        tag_name = tag[1:position].lower()
+
+        attributes = []
+        seen_names = set()
+        while position < length:
+            character = tag[position]
+            if character in self.WHITESPACE or character == '/':
+                position += 1
+                continue
+            if character == '>':
+                break
+
+            # Nombre del atributo (un '=' inicial forma parte del nombre, como en HTML)
+            name_start = position
+            position += 1
+            while position < length and tag[position] not in self.WHITESPACE and tag[position] not in '/>=':
+                position += 1
+            name = tag[name_start:position].lower()
+
+            while position < length and tag[position] in self.WHITESPACE:
+                position += 1
+            value_start = value_end = position
+            quote = ''
+            if position < length and tag[position] == '=':
+                position += 1
+                while position < length and tag[position] in self.WHITESPACE:
+                    position += 1
+                if position < length and tag[position] in '"\'':
+                    quote = tag[position]
+                    value_start = position + 1
+                    value_end = tag.find(quote, value_start)
+                    if value_end == -1:
+                        value_end = length
+                    position = value_end + 1
+                else:
+                    value_start = position
+                    while position < length and tag[position] not in self.WHITESPACE and tag[position] != '>':
+                        position += 1
+                    value_end = position
+
+            if name not in seen_names:
+                seen_names.add(name)
+                attributes.append(TagAttribute(name, value_start, value_end, quote))
+        return tag_name, attributes
+
+    def iter_srcset_urls(self, value: str) -> Iterator[Tuple[int, int]]:
+        """
+        Recorre las URL de un valor `srcset` (ej. 'a.png 1x, b.png 2x').
+
+        Args:
+            value (str): El valor del atributo srcset.
+
+        Yields:
+            Tuple[int, int]: Posición de inicio y fin de cada URL dentro de `value`.
+        """
+        length = len(value)
+        position = 0
+        while position < length:
+            while position < length and (value[position] in self.WHITESPACE or value[position] == ','):
+                position += 1
+            if position >= length:
+                return
+            url_start = position
+            while position < length and value[position] not in self.WHITESPACE:
+                position += 1
+            url_end = position
+            # Las comas finales de la URL separan candidatos (la URL no tiene descriptores)
+            if value[url_end - 1] == ',':
+                while url_end > url_start and value[url_end - 1] == ',':
+                    url_end -= 1
+                if url_end > url_start:
+                    yield url_start, url_end
+                continue
+            yield url_start, url_end
+            # Descriptores (ej. '2x' o '480w') hasta la siguiente coma fuera de paréntesis
+            depth = 0
+            while position < length:
+                character = value[position]
+                if character == '(':
+                    depth += 1
+                elif character == ')':
+                    depth = max(0, depth - 1)
+                elif character == ',' and depth == 0:
+                    break
+                position += 1
+
+    def _unescape_with_offsets(self, value: str) -> Tuple[str, List[int]]:
+        """
+        Decodifica las referencias de caracteres de un valor de atributo y, para cada carácter
+        decodificado (y para el final), la posición en `value` donde empieza su origen.
+        """
+        parts = []
+        offsets = []
+        position = 0
+        for match in self.entity_pattern.finditer(value):
+            parts.append(value[position:match.start()])
+            offsets.extend(range(position, match.start()))
+            entity = match.group(0)
+            decoded = html.unescape(entity)
+            parts.append(decoded)
+            if decoded == entity:
+                offsets.extend(range(match.start(), match.end()))
+            else:
+                offsets.extend([match.start()] * len(decoded))
+            position = match.end()
+        parts.append(value[position:])
+        offsets.extend(range(position, len(value) + 1))
+        return "".join(parts), offsets
+
+    def iter_css_urls(self, value: str) -> Iterator[Tuple[int, int]]:
+        """
+        Recorre las URL de las funciones url() de un valor CSS (ej. el atributo `style`). Las
+        referencias de caracteres se decodifican antes de buscar, como hace el navegador, de
+        modo que 'url(&quot;a.png&quot;)' equivale a 'url("a.png")'.
+
+        Args:
+            value (str): El valor CSS, tal como aparece en la etiqueta.
+
+        Yields:
+            Tuple[int, int]: Posición de inicio y fin de cada URL (sin comillas) dentro de `value`.
+        """
+        decoded, offsets = self._unescape_with_offsets(value) if '&' in value else (value, None)
+        for match in self.css_url_pattern.finditer(decoded):
+            group = next(index for index in (1, 2, 3) if match.group(index) is not None)
+            start, end = match.start(group), match.end(group)
+            if offsets is not None:
+                start, end = offsets[start], offsets[end]
+            if start < end:
+                yield start, end
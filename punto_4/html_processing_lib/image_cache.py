@@ -0,0 +1,175 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+class ImageEncodingCache:
+    """
+    Caché LRU de imágenes ya codificadas como data URI, compartida por todos los archivos
+    HTML de un procesamiento. Las entradas se direccionan por contenido (hash SHA-256 y tipo
+    MIME), de modo que una misma imagen en varias rutas se guarda una sola vez, y un índice
+    por archivo (ruta absoluta, tamaño y fecha de modificación) evita volver a leer las
+    imágenes que no cambiaron. El tamaño total de las entradas está acotado en bytes.
+    Es segura para usarse desde varios hilos.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Inicializa la caché.
+
+        Args:
+            max_bytes (int): Tamaño máximo en bytes de los data URI guardados. Al superarlo se
+                             descartan las entradas usadas menos recientemente.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._file_index = {}
+        self._entry_files = {}
+        self.hits = 0
+        self.content_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_key(image_path: str, stat_result: os.stat_result) -> tuple:
+        """
+        Construye la clave de un archivo de imagen: ruta absoluta, tamaño y fecha de modificación.
+
+        Args:
+            image_path (str): La ruta absoluta de la imagen.
+            stat_result (os.stat_result): El resultado de os.stat sobre la imagen.
+
+        Returns:
+            tuple: La clave del archivo en el índice de la caché.
+        """
+        return (image_path, stat_result.st_size, stat_result.st_mtime_ns)
+
+    @staticmethod
+    def content_hasher():
+        """
+        Devuelve un hash vacío con el que se calcula por bloques la clave de contenido de una
+        imagen (ver `content_key_from_hasher`).
+        """
+        return hashlib.sha256()
+
+    @staticmethod
+    def content_key_from_hasher(hasher, mime_type: str) -> tuple:
+        """
+        Construye la clave de contenido de una imagen a partir del hash de todos sus bytes.
+
+        Args:
+            hasher: El hash de `content_hasher` actualizado con el contenido de la imagen.
+            mime_type (str): El tipo MIME con el que se codifica.
+
+        Returns:
+            tuple: La clave de la entrada en la caché (igual a la de `content_key`).
+        """
+        return (hasher.hexdigest(), mime_type)
+
+    @staticmethod
+    def content_key(image_data: bytes, mime_type: str) -> tuple:
+        """
+        Construye la clave de contenido de una imagen: hash SHA-256 de sus bytes y tipo MIME.
+
+        Args:
+            image_data (bytes): El contenido de la imagen.
+            mime_type (str): El tipo MIME con el que se codifica.
+
+        Returns:
+            tuple: La clave de la entrada en la caché.
+        """
+        hasher = ImageEncodingCache.content_hasher()
+        hasher.update(image_data)
+        return ImageEncodingCache.content_key_from_hasher(hasher, mime_type)
+
+    def get_by_file(self, file_key: tuple) -> Optional[str]:
+        """
+        Busca el data URI de un archivo que no cambió desde que se guardó, sin leerlo.
+
+        Args:
+            file_key (tuple): La clave del archivo (ver `file_key`).
+
+        Returns:
+            Optional[str]: El data URI guardado, o None si el archivo no está en la caché.
+        """
+        with self._lock:
+            content_key = self._file_index.get(file_key)
+            if content_key is None:
+                return None
+            self.hits += 1
+            self._entries.move_to_end(content_key)
+            return self._entries[content_key]
+
+    def get_by_content(self, file_key: tuple, content_key: tuple) -> Optional[str]:
+        """
+        Busca el data URI de un contenido ya codificado (ej. la misma imagen en otra ruta)
+        y, si está, asocia el archivo a esa entrada. Si no está, cuenta un fallo de caché.
+
+        Args:
+            file_key (tuple): La clave del archivo (ver `file_key`).
+            content_key (tuple): La clave del contenido (ver `content_key`).
+
+        Returns:
+            Optional[str]: El data URI guardado, o None si el contenido no está en la caché.
+        """
+        with self._lock:
+            data_uri = self._entries.get(content_key)
+            if data_uri is None:
+                self.misses += 1
+                return None
+            self.content_hits += 1
+            self._entries.move_to_end(content_key)
+            self._link_file(file_key, content_key)
+            return data_uri
+
+    def put(self, file_key: tuple, content_key: tuple, data_uri: str) -> None:
+        """
+        Guarda un data URI y descarta las entradas menos usadas hasta respetar `max_bytes`.
+        Los data URI más grandes que `max_bytes` no se guardan.
+
+        Args:
+            file_key (tuple): La clave del archivo (ver `file_key`).
+            content_key (tuple): La clave del contenido (ver `content_key`).
+            data_uri (str): El data URI de la imagen.
+        """
+        size = len(data_uri)
+        with self._lock:
+            if size > self.max_bytes or content_key in self._entries:
+                return
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                self._evict_oldest()
+            self._entries[content_key] = data_uri
+            self.current_bytes += size
+            self._link_file(file_key, content_key)
+
+    def _link_file(self, file_key: tuple, content_key: tuple) -> None:
+        self._file_index[file_key] = content_key
+        self._entry_files.setdefault(content_key, []).append(file_key)
+
+    def _evict_oldest(self) -> None:
+        content_key, data_uri = self._entries.popitem(last=False)
+        self.current_bytes -= len(data_uri)
+        self.evictions += 1
+        for file_key in self._entry_files.pop(content_key, []):
+            self._file_index.pop(file_key, None)
+
+    def stats(self) -> dict:
+        """
+        Devuelve las estadísticas de uso de la caché.
+
+        Returns:
+            dict: Aciertos por archivo (`hits`) y por contenido (`content_hits`), fallos (`misses`),
+                  entradas descartadas (`evictions`), número de entradas y bytes ocupados.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "content_hits": self.content_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
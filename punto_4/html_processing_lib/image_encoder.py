@@ -1,46 +1,139 @@
 import os
+import mmap
 import base64
-import imghdr
-from typing import Optional
+import binascii
+from concurrent.futures import Executor
+import threading
+from typing import Iterator, Optional, Union
+from .image_cache import ImageEncodingCache
+from .image_optimizer import ImageOptimizer
+from .mime_sniffer import MimeSniffer
+
+# Tamaño mínimo de imagen que se codifica en el pool de procesos (para imágenes más pequeñas
+# enviar los bytes a otro proceso cuesta más que codificarlas en el hilo actual)
+PROCESS_ENCODING_MIN_BYTES = 256 * 1024
+# Tamaño mínimo de imagen que se lee con mmap en lugar de read() (para imágenes pequeñas
+# mapear el archivo cuesta más que copiarlo)
+MMAP_MIN_BYTES = 256 * 1024
+# Bytes que se codifican por bloque en `encode_data_uri` (múltiplo de 3, para que ningún
+# bloque lleve relleno '=')
+ENCODE_BLOCK_BYTES = 3 * 256 * 1024
+
+def encode_base64(image_data: bytes) -> str:
+    """
+    Codifica bytes a una cadena Base64. Es una función de módulo para poder ejecutarse en un pool de procesos.
+
+    Args:
+        image_data (bytes): Los bytes a codificar.
+
+    Returns:
+        str: La cadena Base64.
+    """
+    return base64.b64encode(image_data).decode('utf-8')
+
+def encode_data_uri(image_data: bytes, mime_type: str, hasher=None) -> str:
+    """
+    Construye el data URI de una imagen codificándola por bloques en un búfer preasignado con
+    el tamaño exacto del resultado, en lugar de crear el Base64 completo como bytes, luego
+    como str y luego concatenado al prefijo. Es una función de módulo para poder ejecutarse
+    en un pool de procesos.
+
+    Args:
+        image_data (bytes): Los bytes a codificar (o un objeto que los exponga, como un mmap).
+        mime_type (str): El tipo MIME de la imagen.
+        hasher: Hash opcional (ej. `ImageEncodingCache.content_hasher()`) que se actualiza con
+                cada bloque en la misma pasada, antes de liberar sus páginas.
+
+    Returns:
+        str: El data URI con el prefijo 'data:<tipo MIME>;base64,'.
+    """
+    prefix = f"data:{mime_type};base64,".encode('ascii')
+    size = len(image_data)
+    buffer = bytearray(len(prefix) + 4 * ((size + 2) // 3))
+    buffer[:len(prefix)] = prefix
+    position = len(prefix)
+    # Las páginas de un mmap ya codificadas se liberan, para que no sigan ocupando memoria del proceso
+    release_pages = getattr(image_data, 'madvise', None) if hasattr(mmap, 'MADV_DONTNEED') else None
+    with memoryview(image_data) as view:
+        for start in range(0, size, ENCODE_BLOCK_BYTES):
+            with view[start:start + ENCODE_BLOCK_BYTES] as block_view:
+                if hasher is not None:
+                    hasher.update(block_view)
+                block = binascii.b2a_base64(block_view, newline=False)
+            buffer[position:position + len(block)] = block
+            position += len(block)
+            if release_pages is not None:
+                release_pages(mmap.MADV_DONTNEED, start, min(ENCODE_BLOCK_BYTES, size - start))
+    return buffer.decode('ascii')
+
+def map_image_file(image_file) -> Optional[mmap.mmap]:
+    """
+    Mapea en memoria (solo lectura) un archivo abierto, para leerlo sin copiarlo. El mapa
+    sigue siendo válido después de cerrar el archivo.
+
+    Args:
+        image_file: El archivo abierto en modo binario.
+
+    Returns:
+        Optional[mmap.mmap]: El mapa, o None si el archivo está vacío o no se puede mapear.
+    """
+    try:
+        return mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
 
 class ImageEncoder:
     """
     Clase encargada de codificar imágenes a Base64 y determinar su tipo MIME.
+
+    Las imágenes grandes que no se optimizan ni se envían al pool de procesos se leen con
+    mmap y se codifican por bloques (ver `encode_data_uri`), así el pico de memoria de una
+    imagen de N bytes es el de su data URI (~2.7 N entre el búfer y la cadena final) en lugar
+    de ~3.7 N, también con la caché activada (ver `_encode_mapped_image`). Como con cualquier
+    mmap, si otro proceso trunca la imagen mientras se codifica el proceso puede terminar con
+    SIGBUS.
     """
-    def __init__(self):
+    def __init__(self, cache: Optional[ImageEncodingCache] = None, optimizer: Optional[ImageOptimizer] = None,
+                 inline_max_bytes: int = 0):
         """
         Inicializa ImageEncoder.
+
+        Args:
+            cache (Optional[ImageEncodingCache]): Caché de imágenes codificadas compartida entre
+                                                  archivos HTML. Si es None, cada imagen se lee
+                                                  y codifica en cada uso.
+            optimizer (Optional[ImageOptimizer]): Optimizador que reduce y recomprime las imágenes
+                                                  antes de codificarlas. Si es None, se codifican
+                                                  los bytes originales.
+            inline_max_bytes (int): Tamaño máximo en bytes (después de optimizar) de una imagen que
+                                    se incrusta; las más grandes se enlazan. Con 0 no hay límite.
         """
-        pass
+        self.cache = cache
+        self.mime_sniffer = MimeSniffer()
+        self.optimizer = optimizer
+        self.inline_max_bytes = max(0, inline_max_bytes)
+        # Claves de archivo (ver ImageEncodingCache.file_key) de las imágenes que se enlazan
+        self._linked_file_keys = set()
+        self.linked_images = 0
+        self.linked_bytes = 0
+        self._lock = threading.Lock()
+        # Pool de procesos opcional donde se codifican las imágenes grandes (lo asigna HtmlProcessor)
+        self.encoding_executor: Optional[Executor] = None
 
-    def _get_mime_type(self, image_path: str) -> str:
+    def _get_mime_type(self, image_path: str, header: bytes) -> str:
         """
-        Determina el tipo MIME de la imagen.
+        Determina el tipo MIME de la imagen a partir de los bytes ya leídos (ver `MimeSniffer`),
+        sin volver a abrir el archivo.
 
         Args:
             image_path (str): La ruta absoluta de la imagen.
+            header (bytes): Los primeros bytes de la imagen (o la imagen completa).
 
         Returns:
             str: El tipo MIME de la imagen (ej. 'image/png', 'image/jpeg').
                  Retorna 'application/octet-stream' si no puede determinar el tipo.
         """
-        try:
-            with open(image_path, 'rb') as f:
-                header = f.read(32)
-            image_type = imghdr.what(None, h=header)
-            if image_type:
-                return f"image/{image_type}"
-            else:
-                ext = os.path.splitext(image_path)[1].lower()
-                if ext == '.svg':
-                    return 'image/svg+xml'
-                elif ext == '.ico':
-                    return 'image/x-icon'
-                elif ext == '.webp':
-                    return 'image/webp'
-                return 'application/octet-stream'
-        except Exception:
-            return 'application/octet-stream'
+        return self.mime_sniffer.sniff(header, image_path)
 
     def image_to_base64(self, image_path: str) -> tuple[bool, Optional[str]]:
         """
@@ -53,16 +146,186 @@ class ImageEncoder:
         Returns:
             tuple[bool, Optional[str]]: Una tupla donde el primer elemento es True si la codificación fue exitosa
                                        y False en caso contrario. El segundo elemento es la cadena Base64 con el prefijo data: URI
-                                       si fue exitoso, o un mensaje de error si falló.
+                                       si fue exitoso, o un mensaje de error si falló. Es (True, None) si la imagen
+                                       supera `inline_max_bytes` y debe enlazarse en lugar de incrustarse.
         """
-        if not os.path.exists(image_path):
+        try:
+            stat_result = os.stat(image_path)
+        except OSError:
             return False, f"Imagen no encontrada en {image_path}"
 
         try:
+            file_key = ImageEncodingCache.file_key(image_path, stat_result)
+            if file_key in self._linked_file_keys:
+                return True, None
+            if self.cache is not None:
+                cached_data_uri = self.cache.get_by_file(file_key)
+                if cached_data_uri is not None:
+                    return True, cached_data_uri
+
+            mapped_image = None
             with open(image_path, 'rb') as f:
-                image_data = f.read()
-            encoded_string = base64.b64encode(image_data).decode('utf-8')
-            mime_type = self._get_mime_type(image_path)
-            return True, f"data:{mime_type};base64,{encoded_string}"
+                large_image = self.encoding_executor is not None and stat_result.st_size >= PROCESS_ENCODING_MIN_BYTES
+                if stat_result.st_size >= MMAP_MIN_BYTES and self.optimizer is None and not large_image:
+                    mapped_image = map_image_file(f)
+                image_data = mapped_image if mapped_image is not None else f.read()
+            try:
+                return True, self._encode_image_data(file_key, image_path, image_data)
+            finally:
+                if mapped_image is not None:
+                    mapped_image.close()
         except Exception as e:
             return False, f"Error al procesar la imagen {image_path}: {e}"
+
+    def _encode_image_data(self, file_key: tuple, image_path: str, image_data: bytes) -> Optional[str]:
+        """
+        Codifica el contenido ya leído (o mapeado) de una imagen, usando y actualizando la caché.
+
+        Returns:
+            Optional[str]: El data URI, o None si la imagen supera `inline_max_bytes`.
+        """
+        mime_type = self._get_mime_type(image_path, image_data)
+        if isinstance(image_data, mmap.mmap):
+            return self._encode_mapped_image(file_key, image_data, mime_type)
+
+        if self.cache is not None:
+            content_key = self.cache.content_key(image_data, mime_type)
+            cached_data_uri = self.cache.get_by_content(file_key, content_key)
+            if cached_data_uri is not None:
+                return cached_data_uri
+
+        large_image = self.encoding_executor is not None and len(image_data) >= PROCESS_ENCODING_MIN_BYTES
+        if self.optimizer is not None:
+            image_data = self.optimizer.optimize(image_data, mime_type, self.encoding_executor if large_image else None)
+        if self.inline_max_bytes and len(image_data) > self.inline_max_bytes:
+            self._mark_linked(file_key, len(image_data))
+            return None
+
+        if self.encoding_executor is not None and len(image_data) >= PROCESS_ENCODING_MIN_BYTES:
+            data_uri = self.encoding_executor.submit(encode_data_uri, image_data, mime_type).result()
+        else:
+            data_uri = encode_data_uri(image_data, mime_type)
+        if self.cache is not None:
+            self.cache.put(file_key, content_key, data_uri)
+        return data_uri
+
+    def _encode_mapped_image(self, file_key: tuple, mapped_image: mmap.mmap, mime_type: str) -> Optional[str]:
+        """
+        Codifica una imagen mapeada (que no se optimiza ni se envía al pool de procesos)
+        calculando su clave de contenido en la misma pasada por bloques que la codificación, de
+        modo que cada página del mapa se lee una sola vez y se libera al codificarla, en lugar
+        de leer la imagen completa para el hash antes de codificarla. Si el mismo contenido ya
+        estaba en la caché (ej. la misma imagen en otra ruta), se devuelve esa entrada.
+
+        Returns:
+            Optional[str]: El data URI, o None si la imagen supera `inline_max_bytes`.
+        """
+        if self.inline_max_bytes and len(mapped_image) > self.inline_max_bytes:
+            self._mark_linked(file_key, len(mapped_image))
+            return None
+        if self.cache is None:
+            return encode_data_uri(mapped_image, mime_type)
+
+        hasher = self.cache.content_hasher()
+        data_uri = encode_data_uri(mapped_image, mime_type, hasher)
+        content_key = self.cache.content_key_from_hasher(hasher, mime_type)
+        cached_data_uri = self.cache.get_by_content(file_key, content_key)
+        if cached_data_uri is not None:
+            return cached_data_uri
+        self.cache.put(file_key, content_key, data_uri)
+        return data_uri
+
+    def read_image_data(self, image_path: str) -> tuple[bytes, str]:
+        """
+        Lee una imagen y devuelve los bytes que se incrustarían (optimizados, si hay un
+        optimizador) y su tipo MIME, sin codificarlos (ej. para guardarla como archivo aparte).
+
+        Args:
+            image_path (str): La ruta absoluta de la imagen.
+
+        Returns:
+            tuple[bytes, str]: Los bytes de la imagen y su tipo MIME.
+
+        Raises:
+            OSError: Si la imagen no existe o no se puede leer.
+        """
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+        mime_type = self._get_mime_type(image_path, image_data)
+        if self.optimizer is not None:
+            large_image = self.encoding_executor is not None and len(image_data) >= PROCESS_ENCODING_MIN_BYTES
+            image_data = self.optimizer.optimize(image_data, mime_type, self.encoding_executor if large_image else None)
+        return image_data, mime_type
+
+    def _mark_linked(self, file_key: tuple, image_size: int) -> None:
+        with self._lock:
+            if file_key not in self._linked_file_keys:
+                self._linked_file_keys.add(file_key)
+                self.linked_images += 1
+                self.linked_bytes += image_size
+
+    def linked_stats(self) -> dict:
+        """
+        Devuelve cuántas imágenes se enlazaron en lugar de incrustarse por superar
+        `inline_max_bytes` (`linked_images`) y cuántos bytes suman (`linked_bytes`).
+        """
+        with self._lock:
+            return {"linked_images": self.linked_images, "linked_bytes": self.linked_bytes}
+
+    def iter_base64(self, image_path: str, chunk_size: int = 64 * 1024) -> tuple[bool, Union[Iterator[str], str]]:
+        """
+        Versión por bloques de `image_to_base64`: devuelve el data URI como un iterador de
+        bloques de texto, leyendo y codificando la imagen de a `chunk_size` caracteres, sin
+        tenerla completa en memoria. Las imágenes que ya están en la caché se devuelven en un
+        solo bloque y las que caben en un bloque se obtienen con `image_to_base64`, igual que
+        todas las imágenes si hay un optimizador (Pillow necesita la imagen completa).
+
+        La imagen se abre antes de devolver el iterador, de modo que una imagen inexistente o
+        ilegible se informa como fallo antes de escribir nada.
+
+        Args:
+            image_path (str): La ruta absoluta de la imagen.
+            chunk_size (int): Número aproximado de caracteres Base64 por bloque.
+
+        Returns:
+            tuple[bool, Union[Iterator[str], str]]: (True, iterador de bloques del data URI) si la
+                                                    imagen se pudo abrir, (True, None) si debe
+                                                    enlazarse, o (False, mensaje de error).
+        """
+        try:
+            stat_result = os.stat(image_path)
+        except OSError:
+            return False, f"Imagen no encontrada en {image_path}"
+
+        file_key = ImageEncodingCache.file_key(image_path, stat_result)
+        if file_key in self._linked_file_keys:
+            return True, None
+        if self.cache is not None:
+            cached_data_uri = self.cache.get_by_file(file_key)
+            if cached_data_uri is not None:
+                return True, iter((cached_data_uri,))
+        if stat_result.st_size <= chunk_size or self.optimizer is not None:
+            success, result = self.image_to_base64(image_path)
+            return (True, iter((result,)) if result is not None else None) if success else (False, result)
+        if self.inline_max_bytes and stat_result.st_size > self.inline_max_bytes:
+            self._mark_linked(file_key, stat_result.st_size)
+            return True, None
+
+        try:
+            image_file = open(image_path, 'rb')
+        except Exception as e:
+            return False, f"Error al procesar la imagen {image_path}: {e}"
+        return True, self._iter_base64_chunks(image_file, image_path, chunk_size)
+
+    def _iter_base64_chunks(self, image_file, image_path: str, chunk_size: int) -> Iterator[str]:
+        # Se leen múltiplos de 3 bytes para que cada bloque se codifique sin relleno '='; el tipo
+        # MIME se determina con el primer bloque, sin volver a leer el inicio del archivo
+        read_size = max(3, chunk_size // 4 * 3, MimeSniffer.HEADER_SIZE // 3 * 3 + 3)
+        # Cada bloque se lee en el mismo búfer preasignado, sin crear un objeto bytes por bloque
+        buffer = bytearray(read_size)
+        with image_file, memoryview(buffer) as view:
+            read_bytes = image_file.readinto(buffer)
+            yield f"data:{self._get_mime_type(image_path, view[:read_bytes])};base64,"
+            while read_bytes:
+                yield encode_base64(view[:read_bytes])
+                read_bytes = image_file.readinto(buffer)
@@ -0,0 +1,193 @@
+import os
+import io
+import json
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import Executor
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Formatos de Pillow de los tipos MIME que se pueden optimizar
+OPTIMIZABLE_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/webp': 'WEBP',
+}
+
+def optimize_image_data(image_data: bytes, mime_type: str, max_dimension: int, quality: int,
+                        strip_metadata: bool) -> bytes:
+    """
+    Reduce y recomprime una imagen JPEG, PNG o WebP. Es una función de módulo para poder
+    ejecutarse en un pool de procesos.
+
+    Args:
+        image_data (bytes): El contenido de la imagen.
+        mime_type (str): El tipo MIME de la imagen.
+        max_dimension (int): Tamaño máximo en píxeles del lado más largo. Con 0 no se reduce.
+        quality (int): Calidad de compresión de JPEG y WebP (1-95).
+        strip_metadata (bool): Si es True, se descartan los metadatos EXIF y XMP.
+
+    Returns:
+        bytes: La imagen optimizada, o la original si la optimizada no es más pequeña, si el
+               formato no se optimiza (ej. imágenes animadas) o si Pillow no está instalado.
+    """
+    image_format = OPTIMIZABLE_FORMATS.get(mime_type)
+    if Image is None or image_format is None:
+        return image_data
+
+    with Image.open(io.BytesIO(image_data)) as image:
+        if getattr(image, "is_animated", False):
+            return image_data
+        exif = image.info.get('exif')
+        icc_profile = image.info.get('icc_profile')
+        # Se aplica la orientación EXIF antes de descartarla para que la imagen no quede girada
+        image = ImageOps.exif_transpose(image) if strip_metadata else image.copy()
+        if max_dimension and max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        save_options = {}
+        if icc_profile:
+            save_options['icc_profile'] = icc_profile
+        if exif and not strip_metadata:
+            save_options['exif'] = exif
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L', 'CMYK'):
+                image = image.convert('RGB')
+            save_options.update(quality=quality, optimize=True, progressive=True)
+        elif image_format == 'PNG':
+            save_options.update(optimize=True)
+        else:
+            save_options.update(quality=quality, method=6)
+
+        output = io.BytesIO()
+        image.save(output, format=image_format, **save_options)
+    optimized_data = output.getvalue()
+    return optimized_data if len(optimized_data) < len(image_data) else image_data
+
+class ImageOptimizer:
+    """
+    Clase encargada de optimizar las imágenes antes de incrustarlas: reduce su tamaño en
+    píxeles, recomprime JPEG/PNG/WebP y descarta sus metadatos. Usa Pillow, que es opcional;
+    si no está instalado las imágenes se incrustan sin optimizar.
+
+    Las imágenes optimizadas pueden guardarse en un directorio, direccionadas por el hash
+    SHA-256 de la imagen original y la configuración, para no volver a optimizarlas en las
+    siguientes ejecuciones. Es segura para usarse desde varios hilos.
+    """
+    def __init__(self, max_dimension: int = 0, quality: int = 85, strip_metadata: bool = True,
+                 cache_directory: Optional[str] = None):
+        """
+        Inicializa ImageOptimizer.
+
+        Args:
+            max_dimension (int): Tamaño máximo en píxeles del lado más largo. Con 0 no se reduce.
+            quality (int): Calidad de compresión de JPEG y WebP (1-95).
+            strip_metadata (bool): Si es True, se descartan los metadatos EXIF y XMP.
+            cache_directory (Optional[str]): Directorio donde se guardan las imágenes optimizadas.
+                                             Si es None, se optimizan en cada ejecución.
+        """
+        self.max_dimension = max(0, max_dimension)
+        self.quality = min(95, max(1, quality))
+        self.strip_metadata = strip_metadata
+        self.cache_directory = cache_directory
+        self._settings_key = hashlib.sha256(json.dumps(self.settings(), sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.optimized = 0
+        self.cache_hits = 0
+        self.original_bytes = 0
+        self.optimized_bytes = 0
+        self._lock = threading.Lock()
+        if Image is None:
+            print("La optimización de imágenes requiere el paquete Pillow (pip install Pillow); "
+                  "las imágenes se incrustarán sin optimizar.")
+
+    def settings(self) -> dict:
+        """
+        Devuelve la configuración que determina el resultado de la optimización.
+        """
+        return {"max_dimension": self.max_dimension, "quality": self.quality, "strip_metadata": self.strip_metadata}
+
+    def _cache_path(self, image_data: bytes) -> Optional[str]:
+        if self.cache_directory is None:
+            return None
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        return os.path.join(self.cache_directory, f"{content_hash}-{self._settings_key}")
+
+    def _read_cached(self, cache_path: Optional[str]) -> Optional[bytes]:
+        if cache_path is None:
+            return None
+        try:
+            with open(cache_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_cached(self, cache_path: Optional[str], optimized_data: bytes) -> None:
+        if cache_path is None:
+            return
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as f:
+                f.write(optimized_data)
+            os.replace(temporary_path, cache_path)
+        except OSError as e:
+            print(f"Error al guardar la imagen optimizada en {cache_path}: {e}")
+
+    def optimize(self, image_data: bytes, mime_type: str, executor: Optional[Executor] = None) -> bytes:
+        """
+        Optimiza una imagen, o la devuelve sin cambios si su formato no se optimiza.
+
+        Args:
+            image_data (bytes): El contenido de la imagen.
+            mime_type (str): El tipo MIME de la imagen.
+            executor (Optional[Executor]): Pool (ej. de procesos) donde optimizar la imagen. Si es
+                                           None, se optimiza en el hilo actual.
+
+        Returns:
+            bytes: La imagen optimizada, o la original si no se pudo reducir.
+        """
+        if Image is None or mime_type not in OPTIMIZABLE_FORMATS:
+            return image_data
+
+        cache_path = self._cache_path(image_data)
+        optimized_data = self._read_cached(cache_path)
+        cache_hit = optimized_data is not None
+        if not cache_hit:
+            arguments = (image_data, mime_type, self.max_dimension, self.quality, self.strip_metadata)
+            try:
+                if executor is not None:
+                    optimized_data = executor.submit(optimize_image_data, *arguments).result()
+                else:
+                    optimized_data = optimize_image_data(*arguments)
+            except Exception as e:
+                print(f"No se pudo optimizar una imagen {mime_type}, se incrusta sin optimizar: {e}")
+                return image_data
+            self._write_cached(cache_path, optimized_data)
+
+        with self._lock:
+            self.optimized += 1
+            self.cache_hits += cache_hit
+            self.original_bytes += len(image_data)
+            self.optimized_bytes += len(optimized_data)
+        return optimized_data
+
+    def stats(self) -> dict:
+        """
+        Devuelve las estadísticas de la optimización.
+
+        Returns:
+            dict: Imágenes optimizadas (`optimized`), de ellas cuántas se leyeron del directorio de
+                  caché (`cache_hits`), y bytes antes (`original_bytes`) y después (`optimized_bytes`).
+        """
+        with self._lock:
+            return {
+                "optimized": self.optimized,
+                "cache_hits": self.cache_hits,
+                "original_bytes": self.original_bytes,
+                "optimized_bytes": self.optimized_bytes,
+            }
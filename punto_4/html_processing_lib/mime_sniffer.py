@@ -0,0 +1,105 @@
+import os
+from typing import Optional
+
+class MimeSniffer:
+    """
+    Clase encargada de determinar el tipo MIME de una imagen a partir de sus primeros bytes
+    (firmas o "magic bytes"), sin volver a abrir el archivo y sin depender de `imghdr`, que
+    ya no existe en Python 3.13. Se prueba primero la firma del tipo que indica la extensión
+    y, si no coincide, el resto de firmas; si ninguna coincide se usa el tipo de la extensión.
+    """
+    # Bytes del inicio del archivo que necesita `sniff` (los SVG pueden empezar con una
+    # declaración XML, comentarios o un DOCTYPE antes de la etiqueta <svg>)
+    HEADER_SIZE = 512
+    DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+    EXTENSION_MIME_TYPES = {
+        '.jpg': 'image/jpeg',
+        '.jpeg': 'image/jpeg',
+        '.jpe': 'image/jpeg',
+        '.png': 'image/png',
+        '.gif': 'image/gif',
+        '.webp': 'image/webp',
+        '.avif': 'image/avif',
+        '.svg': 'image/svg+xml',
+        '.ico': 'image/x-icon',
+        '.bmp': 'image/bmp',
+        '.tif': 'image/tiff',
+        '.tiff': 'image/tiff',
+    }
+
+    def __init__(self):
+        """
+        Inicializa MimeSniffer con la función que reconoce la firma de cada tipo MIME.
+        """
+        self.signature_checks = {
+            'image/jpeg': self._is_jpeg,
+            'image/png': self._is_png,
+            'image/gif': self._is_gif,
+            'image/webp': self._is_webp,
+            'image/avif': self._is_avif,
+            'image/x-icon': self._is_ico,
+            'image/bmp': self._is_bmp,
+            'image/tiff': self._is_tiff,
+            'image/svg+xml': self._is_svg,
+        }
+
+    def _is_jpeg(self, header: bytes) -> bool:
+        return header[:3] == b'\xff\xd8\xff'
+
+    def _is_png(self, header: bytes) -> bool:
+        return header[:8] == b'\x89PNG\r\n\x1a\n'
+
+    def _is_gif(self, header: bytes) -> bool:
+        return header[:6] in (b'GIF87a', b'GIF89a')
+
+    def _is_webp(self, header: bytes) -> bool:
+        return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+
+    def _is_avif(self, header: bytes) -> bool:
+        # Caja 'ftyp' de ISO BMFF: marca principal en [8:12] y marcas compatibles hasta el fin de la caja
+        if header[4:8] != b'ftyp':
+            return False
+        box_size = int.from_bytes(header[:4], 'big')
+        brands = [header[8:12]] + [header[i:i + 4] for i in range(16, min(box_size, len(header)) - 3, 4)]
+        return b'avif' in brands or b'avis' in brands
+
+    def _is_ico(self, header: bytes) -> bool:
+        # Reservado (0), tipo (1 = icono, 2 = cursor) y al menos una imagen
+        return header[:4] in (b'\x00\x00\x01\x00', b'\x00\x00\x02\x00') and header[4:6] != b'\x00\x00'
+
+    def _is_bmp(self, header: bytes) -> bool:
+        return header[:2] == b'BM' and len(header) >= 14
+
+    def _is_tiff(self, header: bytes) -> bool:
+        return header[:4] in (b'II*\x00', b'MM\x00*')
+
+    def _is_svg(self, header: bytes) -> bool:
+        text = header.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+        return text.startswith((b'<?xml', b'<svg', b'<!--', b'<!doctype svg')) and b'<svg' in text
+
+    def sniff(self, header: bytes, file_name: Optional[str] = None) -> str:
+        """
+        Determina el tipo MIME de una imagen a partir de sus primeros bytes.
+
+        Args:
+            header (bytes): Los primeros bytes de la imagen (al menos `HEADER_SIZE` si el archivo
+                            es más grande; puede ser la imagen completa o un memoryview).
+            file_name (Optional[str]): El nombre o la ruta del archivo, para probar primero el tipo
+                                       de su extensión y como respaldo si ninguna firma coincide.
+
+        Returns:
+            str: El tipo MIME de la imagen (ej. 'image/png', 'image/jpeg').
+                 Retorna 'application/octet-stream' si no puede determinar el tipo.
+        """
+        header = bytes(header[:self.HEADER_SIZE])
+        extension_mime_type = None
+        if file_name:
+            extension_mime_type = self.EXTENSION_MIME_TYPES.get(os.path.splitext(file_name)[1].lower())
+            if extension_mime_type is not None and self.signature_checks[extension_mime_type](header):
+                return extension_mime_type
+
+        for mime_type, is_mime_type in self.signature_checks.items():
+            if mime_type != extension_mime_type and is_mime_type(header):
+                return mime_type
+        return extension_mime_type or self.DEFAULT_MIME_TYPE
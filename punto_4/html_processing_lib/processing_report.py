@@ -0,0 +1,167 @@
+import os
+import json
+import sqlite3
+from collections import Counter
+from typing import Optional
+
+class ProcessingReport:
+    """
+    Clase encargada del informe de un procesamiento. Escribe a medida que llegan los resultados
+    de cada archivo HTML y de cada imagen (estado, bytes y tiempos) en un archivo JSONL (una
+    línea JSON por registro) o en una base SQLite (tablas `pages` e `images`), y en memoria
+    solo guarda contadores y una muestra acotada de los fallos para el resumen de consola.
+    Sin ruta de informe solo se llevan los contadores.
+    """
+    PAGE_STATUSES = ("processed", "unchanged", "error")
+    IMAGE_STATUSES = ("inlined", "linked", "shared", "reused", "failed")
+    SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+    SQLITE_COMMIT_EVERY = 1000
+
+    def __init__(self, report_path: Optional[str] = None, max_failure_samples: int = 20):
+        """
+        Inicializa el informe y abre su archivo, si hay uno.
+
+        Args:
+            report_path (Optional[str]): Ruta del informe. Con extensión '.db', '.sqlite' o '.sqlite3'
+                                         se escribe una base SQLite; con cualquier otra, JSONL.
+                                         Si es None no se escribe ningún archivo.
+            max_failure_samples (int): Número máximo de fallos que se guardan para el resumen.
+        """
+        self.report_path = os.path.abspath(report_path) if report_path else None
+        self.max_failure_samples = max_failure_samples
+        self.page_counts = Counter()
+        self.image_counts = Counter()
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.inlined_bytes = 0
+        self.page_seconds = 0.0
+        self.failure_samples = []
+        self.failures = 0
+        self._jsonl_file = None
+        self._connection = None
+        self._pending_rows = 0
+        if self.report_path is not None:
+            self._open()
+
+    def _open(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.report_path), exist_ok=True)
+            if self.report_path.lower().endswith(self.SQLITE_EXTENSIONS):
+                if os.path.exists(self.report_path):
+                    os.remove(self.report_path)
+                self._connection = sqlite3.connect(self.report_path, check_same_thread=False)
+                self._connection.executescript("""
+                    CREATE TABLE pages (
+                        html TEXT, output TEXT, status TEXT, seconds REAL,
+                        input_bytes INTEGER, output_bytes INTEGER, error TEXT
+                    );
+                    CREATE TABLE images (
+                        html TEXT, src TEXT, path TEXT, status TEXT,
+                        bytes INTEGER, seconds REAL, error TEXT
+                    );
+                """)
+            else:
+                self._jsonl_file = open(self.report_path, 'w', encoding='utf-8')
+        except Exception as e:
+            print(f"Error al crear el informe {self.report_path}, solo se mostrará el resumen: {e}")
+            self.report_path = None
+            self._jsonl_file = None
+            self._connection = None
+
+    def _write(self, table: str, record: dict) -> None:
+        if self._jsonl_file is not None:
+            self._jsonl_file.write(json.dumps({"type": table[:-1], **record}, ensure_ascii=False) + "\n")
+        elif self._connection is not None:
+            columns = ", ".join(record)
+            placeholders = ", ".join("?" for _ in record)
+            self._connection.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(record.values()))
+            self._pending_rows += 1
+            if self._pending_rows >= self.SQLITE_COMMIT_EVERY:
+                self._connection.commit()
+                self._pending_rows = 0
+
+    def record_page(self, html_file_path: str, output_path: str, status: str, seconds: float,
+                    input_bytes: int, output_bytes: int, error: Optional[str] = None) -> None:
+        """
+        Registra el resultado de un archivo HTML.
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
+            output_path (str): La ruta del archivo procesado (cadena vacía si no se generó).
+            status (str): 'processed', 'unchanged' (omitido en el modo incremental) o 'error'.
+            seconds (float): Tiempo que tomó el archivo.
+            input_bytes (int): Tamaño del archivo HTML.
+            output_bytes (int): Tamaño del archivo procesado.
+            error (Optional[str]): El mensaje de error, si el archivo falló.
+        """
+        self.page_counts[status] += 1
+        self.page_seconds += seconds
+        self.input_bytes += input_bytes
+        self.output_bytes += output_bytes
+        if error is not None:
+            self._add_failure(html_file_path, None, error)
+        self._write("pages", {
+            "html": html_file_path, "output": output_path, "status": status, "seconds": round(seconds, 6),
+            "input_bytes": input_bytes, "output_bytes": output_bytes, "error": error,
+        })
+
+    def record_image(self, html_file_path: str, image: dict) -> None:
+        """
+        Registra el resultado de una imagen de un archivo HTML.
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
+            image (dict): `src`, `path` (ruta absoluta), `status` ('inlined', 'linked', 'shared',
+                          'reused' o 'failed'), `bytes` (lo que se escribió en la página), `seconds`
+                          y `error` (ver `HtmlImageReplacer`).
+        """
+        self.image_counts[image["status"]] += 1
+        if image["status"] == "inlined":
+            self.inlined_bytes += image["bytes"] or 0
+        if image["status"] == "failed":
+            self._add_failure(html_file_path, image["src"], image["error"])
+        self._write("images", {
+            "html": html_file_path, "src": image["src"], "path": image["path"], "status": image["status"],
+            "bytes": image["bytes"], "seconds": round(image["seconds"], 6) if image["seconds"] is not None else None,
+            "error": image["error"],
+        })
+
+    def _add_failure(self, html_file_path: str, image_src: Optional[str], error: str) -> None:
+        self.failures += 1
+        if len(self.failure_samples) < self.max_failure_samples:
+            self.failure_samples.append({"html": html_file_path, "src": image_src, "error": error})
+
+    def close(self) -> None:
+        """
+        Cierra el archivo del informe, guardando lo que quede pendiente.
+        """
+        try:
+            if self._jsonl_file is not None:
+                self._jsonl_file.close()
+            if self._connection is not None:
+                self._connection.commit()
+                self._connection.close()
+        except Exception as e:
+            print(f"Error al cerrar el informe {self.report_path}: {e}")
+        self._jsonl_file = None
+        self._connection = None
+
+    def summary(self) -> dict:
+        """
+        Devuelve el resumen del procesamiento.
+
+        Returns:
+            dict: Archivos HTML por estado (`pages`), imágenes por estado (`images`), bytes leídos y
+                  escritos y bytes de data URI incrustados (`bytes`), tiempo total de los archivos
+                  (`seconds`), número de fallos (`failures`), una muestra de ellos (`failure_samples`)
+                  y la ruta del informe (`report_path`).
+        """
+        return {
+            "pages": {status: self.page_counts[status] for status in self.PAGE_STATUSES},
+            "images": {status: self.image_counts[status] for status in self.IMAGE_STATUSES},
+            "bytes": {"input": self.input_bytes, "output": self.output_bytes, "inlined": self.inlined_bytes},
+            "seconds": self.page_seconds,
+            "failures": self.failures,
+            "failure_samples": list(self.failure_samples),
+            "report_path": self.report_path,
+        }
@@ -0,0 +1,149 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from collections import Counter
+from typing import Iterable, Optional
+from .image_encoder import ImageEncoder
+
+class SharedAssetStore:
+    """
+    Clase encargada del modo de recursos compartidos: las imágenes referenciadas por más de
+    `min_pages` archivos HTML se guardan una sola vez en un directorio de recursos del
+    directorio de salida, y las páginas las enlazan en lugar de incrustar su data URI en cada
+    una. Los archivos se nombran por el hash SHA-256 de su contenido, así la misma imagen en
+    varias rutas se guarda una vez y una imagen modificada recibe un nombre nuevo.
+    Es segura para usarse desde varios hilos.
+    """
+    DEFAULT_DIRECTORY = "_shared_assets"
+    asset_name_pattern = re.compile(r'^[0-9a-f]{24}\.\w+$')
+    MIME_EXTENSIONS = {
+        'image/jpeg': '.jpg',
+        'image/png': '.png',
+        'image/gif': '.gif',
+        'image/webp': '.webp',
+        'image/avif': '.avif',
+        'image/svg+xml': '.svg',
+        'image/x-icon': '.ico',
+        'image/bmp': '.bmp',
+        'image/tiff': '.tif',
+    }
+
+    def __init__(self, asset_directory: str, min_pages: int, image_encoder: ImageEncoder):
+        """
+        Inicializa SharedAssetStore.
+
+        Args:
+            asset_directory (str): La ruta absoluta del directorio donde se guardan los recursos.
+            min_pages (int): Las imágenes referenciadas por más de `min_pages` archivos HTML se
+                             comparten; el resto se siguen incrustando.
+            image_encoder (ImageEncoder): El codificador, para leer (y optimizar) las imágenes.
+        """
+        self.asset_directory = os.path.abspath(asset_directory)
+        self.min_pages = min_pages
+        self.image_encoder = image_encoder
+        self.page_counts = Counter()
+        # Ruta absoluta de la imagen -> (ruta del recurso, longitud del data URI que reemplaza)
+        self._assets = {}
+        self.linked_references = 0
+        self.inline_bytes_avoided = 0
+        self._lock = threading.Lock()
+
+    def count_references(self, image_paths: Iterable[str]) -> None:
+        """
+        Cuenta las imágenes que referencia un archivo HTML (cada imagen una vez por página).
+
+        Args:
+            image_paths (Iterable[str]): Las rutas absolutas de las imágenes del archivo.
+        """
+        with self._lock:
+            self.page_counts.update(set(image_paths))
+
+    def prepare_assets(self) -> None:
+        """
+        Guarda en el directorio de recursos las imágenes que superan `min_pages` páginas (las
+        que ya existen con el mismo contenido no se vuelven a escribir) y borra los recursos de
+        ejecuciones anteriores que ya no se usan. Las imágenes que no se pueden leer no se
+        comparten: al procesar las páginas se informan como fallos, igual que en modo incrustado.
+        """
+        shared_images = sorted(path for path, count in self.page_counts.items() if count > self.min_pages)
+        used_names = set()
+        for image_path in shared_images:
+            try:
+                image_data, mime_type = self.image_encoder.read_image_data(image_path)
+            except OSError:
+                continue
+            extension = self.MIME_EXTENSIONS.get(mime_type) or os.path.splitext(image_path)[1].lower() or '.bin'
+            asset_name = hashlib.sha256(image_data).hexdigest()[:24] + extension
+            asset_path = os.path.join(self.asset_directory, asset_name)
+            if not os.path.exists(asset_path) and not self._write_asset(asset_path, image_data):
+                continue
+            used_names.add(asset_name)
+            data_uri_length = len(f"data:{mime_type};base64,") + 4 * ((len(image_data) + 2) // 3)
+            self._assets[image_path] = (asset_path, data_uri_length)
+        self._remove_unused_assets(used_names)
+
+    def _write_asset(self, asset_path: str, image_data: bytes) -> bool:
+        try:
+            os.makedirs(self.asset_directory, exist_ok=True)
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.asset_directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as f:
+                f.write(image_data)
+            os.replace(temporary_path, asset_path)
+            return True
+        except OSError as e:
+            print(f"Error al escribir el recurso compartido {asset_path}: {e}")
+            return False
+
+    def _remove_unused_assets(self, used_names: set) -> None:
+        if not os.path.isdir(self.asset_directory):
+            return
+        for entry in os.scandir(self.asset_directory):
+            if entry.is_file() and self.asset_name_pattern.match(entry.name) and entry.name not in used_names:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    print(f"Error al eliminar el recurso compartido {entry.path}: {e}")
+
+    def get_asset_path(self, image_path: str) -> Optional[str]:
+        """
+        Devuelve la ruta del recurso compartido de una imagen, o None si la imagen se incrusta.
+        """
+        asset = self._assets.get(image_path)
+        return asset[0] if asset is not None else None
+
+    def shared_image_paths(self) -> set:
+        """
+        Devuelve las rutas absolutas de las imágenes que se comparten.
+        """
+        return set(self._assets)
+
+    def record_reference(self, image_path: str, url_length: int) -> None:
+        """
+        Registra que una referencia a una imagen compartida se enlazó con una URL de
+        `url_length` caracteres en lugar de incrustar su data URI.
+        """
+        with self._lock:
+            self.linked_references += 1
+            self.inline_bytes_avoided += self._assets[image_path][1] - url_length
+
+    def stats(self) -> dict:
+        """
+        Devuelve las estadísticas del modo de recursos compartidos.
+
+        Returns:
+            dict: Imágenes compartidas (`shared_images`), archivos en el directorio de recursos
+                  (`asset_files`) y sus bytes (`asset_bytes`), referencias enlazadas
+                  (`linked_references`) y bytes de data URI que no se escribieron en las páginas
+                  (`inline_bytes_avoided`, ya descontada la longitud de las URL).
+        """
+        with self._lock:
+            asset_paths = {asset_path for asset_path, _ in self._assets.values()}
+            return {
+                "shared_images": len(self._assets),
+                "asset_files": len(asset_paths),
+                "asset_bytes": sum(os.path.getsize(path) for path in asset_paths if os.path.exists(path)),
+                "linked_references": self.linked_references,
+                "inline_bytes_avoided": self.inline_bytes_avoided,
+            }
@@ -0,0 +1,211 @@
+import os
+import io
+import time
+import asyncio
+import itertools
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, List, Optional
+from html_processing_lib.processing_report import ProcessingReport
+from .html_processor import HtmlProcessor, PageResult
+
+class AsyncHtmlProcessor:
+    """
+    Variante asyncio de `HtmlProcessor`, para ejecutarse dentro de un servicio asíncrono sin
+    bloquear el bucle de eventos. Usa los mismos `HtmlReader`, `ImageEncoder`,
+    `HtmlImageReplacer`, `HtmlFileWriter` (y el manifiesto, los recursos compartidos y el
+    informe) del `HtmlProcessor` que recibe, y produce los mismos archivos y el mismo resumen.
+
+    La lectura de los archivos HTML, la escritura de los resultados y el resto de operaciones
+    de disco se hacen en hilos (`asyncio.to_thread`). Las imágenes de cada archivo se leen y
+    codifican en un executor, con un semáforo que limita cuántas se codifican a la vez; una
+    imagen que ya se está codificando para otro archivo no se codifica de nuevo.
+    """
+    # Archivos HTML que se piden a la vez al recorrido del directorio (cada pedido es un salto a un hilo)
+    DISCOVERY_BATCH_SIZE = 256
+
+    def __init__(self, processor: HtmlProcessor, max_concurrency: int = 8, encoding_concurrency: int = 4,
+                 executor: Optional[Executor] = None):
+        """
+        Inicializa AsyncHtmlProcessor.
+
+        Args:
+            processor (HtmlProcessor): El procesador con la configuración y los componentes a usar.
+                                       Sus opciones `workers` no se usan: la concurrencia la
+                                       definen los parámetros siguientes.
+            max_concurrency (int): Número máximo de archivos HTML en proceso a la vez.
+            encoding_concurrency (int): Número máximo de imágenes que se leen y codifican a la vez.
+            executor (Optional[Executor]): Executor donde se codifican las imágenes. Si es None se
+                                           usa el executor por defecto del bucle de eventos. Las
+                                           imágenes grandes se siguen enviando al pool de procesos
+                                           si `processor` tiene `encoding_processes`.
+        """
+        self.processor = processor
+        self.max_concurrency = max(1, max_concurrency)
+        self.encoding_concurrency = max(1, encoding_concurrency)
+        self.executor = executor
+        self._encoding_limit: Optional[asyncio.Semaphore] = None
+        # Ruta absoluta de la imagen -> futuro de su codificación en curso
+        self._pending_images = {}
+
+    async def _iter_html_file_batches(self, html_files: Iterable[str]):
+        html_files = iter(html_files)
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(html_files, self.DISCOVERY_BATCH_SIZE))
+            if not batch:
+                return
+            yield batch
+
+    async def _encode_image(self, image_path: str) -> tuple:
+        """
+        Lee y codifica una imagen en el executor (ver `ImageEncoder.image_to_base64`), esperando
+        al semáforo. Si la imagen ya se está codificando, espera ese resultado.
+        """
+        pending = self._pending_images.get(image_path)
+        if pending is not None:
+            return await pending
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending_images[image_path] = future
+        try:
+            async with self._encoding_limit:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.processor.image_encoder.image_to_base64, image_path
+                )
+        except asyncio.CancelledError:
+            # Los archivos que esperaban esta imagen también se cancelan
+            future.cancel()
+            raise
+        except Exception as e:
+            result = (False, f"Error al procesar la imagen {image_path}: {e}")
+        finally:
+            del self._pending_images[image_path]
+        future.set_result(result)
+        return result
+
+    async def _encode_images(self, image_paths: List[str]) -> dict:
+        """
+        Codifica a la vez las imágenes de un archivo HTML que se van a incrustar.
+
+        Returns:
+            dict: Ruta absoluta de la imagen -> resultado de `ImageEncoder.image_to_base64`.
+        """
+        shared_assets = self.processor.shared_assets
+        if shared_assets is not None:
+            image_paths = [path for path in image_paths if shared_assets.get_asset_path(path) is None]
+        results = await asyncio.gather(*(self._encode_image(path) for path in image_paths))
+        return dict(zip(image_paths, results))
+
+    async def _process_html_file(self, html_file_path: str) -> PageResult:
+        """
+        Versión asíncrona de `HtmlProcessor._process_html_file`: lee el archivo HTML en un hilo,
+        codifica sus imágenes en el executor, reemplaza las referencias y escribe el resultado
+        en un hilo. En el modo por bloques el archivo se procesa completo en un hilo, porque los
+        data URI se escriben a medida que se leen las imágenes.
+        """
+        processor = self.processor
+        if processor.streaming:
+            return await asyncio.to_thread(processor._process_html_file, html_file_path)
+
+        started = time.perf_counter()
+        input_bytes = 0
+        build_manifest = processor.build_manifest
+        try:
+            html_fingerprint = None
+            shared_image_paths = processor.shared_assets.shared_image_paths() if processor.shared_assets is not None else None
+            if build_manifest is not None:
+                unchanged_entry = await asyncio.to_thread(build_manifest.get_unchanged_entry, html_file_path,
+                                                          shared_image_paths)
+                if unchanged_entry is not None:
+                    return PageResult(unchanged_entry["output"], unchanged_entry["results"], None, True,
+                                      time.perf_counter() - started, unchanged_entry["html"]["size"],
+                                      await asyncio.to_thread(os.path.getsize, unchanged_entry["output"]))
+                html_fingerprint = await asyncio.to_thread(build_manifest.fingerprint, html_file_path)
+
+            html_content = await asyncio.to_thread(processor.html_reader.read_html_content, html_file_path)
+            input_bytes = await asyncio.to_thread(os.path.getsize, html_file_path)
+            image_paths = await asyncio.to_thread(
+                processor.html_image_replacer.find_image_paths, io.StringIO(html_content), html_file_path,
+                processor.chunk_size
+            )
+            encoded_images = await self._encode_images(image_paths)
+            processed_html_content, image_results = await asyncio.to_thread(
+                processor.html_image_replacer.replace_images_with_base64, html_content, html_file_path, encoded_images
+            )
+            new_file_path = await asyncio.to_thread(
+                processor.html_file_writer.write_processed_html, html_file_path, processed_html_content
+            )
+
+            if build_manifest is not None:
+                image_paths = [image["path"] for image in image_results["images"]]
+                await asyncio.to_thread(build_manifest.record, html_file_path, html_fingerprint, new_file_path,
+                                        image_paths, image_results, shared_image_paths)
+            output_bytes = await asyncio.to_thread(os.path.getsize, new_file_path) if new_file_path else 0
+            return PageResult(new_file_path, image_results, None, False, time.perf_counter() - started,
+                              input_bytes, output_bytes)
+        except Exception as e:
+            if build_manifest is not None:
+                build_manifest.forget(html_file_path)
+            return PageResult("", None, str(e), False, time.perf_counter() - started, input_bytes, 0)
+
+    async def process_all_html_files(self) -> dict:
+        """
+        Versión asíncrona de `HtmlProcessor.process_all_html_files`. Mantiene hasta
+        `max_concurrency` archivos en proceso a la vez y combina sus resultados en el orden en
+        que se encontraron, por lo que los archivos generados, el informe y el resumen son los
+        mismos que en el modo secuencial (salvo los tiempos).
+
+        Returns:
+            dict: El resumen del procesamiento (ver `ProcessingReport.summary`).
+        """
+        processor = self.processor
+        self._encoding_limit = asyncio.Semaphore(self.encoding_concurrency)
+        html_files = processor.html_reader.iter_html_files()
+        report = await asyncio.to_thread(ProcessingReport, processor.report_path)
+        found_files = 0
+        current_files = [] if processor.build_manifest is not None else None
+
+        encoding_executor = ProcessPoolExecutor(max_workers=processor.encoding_processes) if processor.encoding_processes else None
+        processor.image_encoder.encoding_executor = encoding_executor
+        pending = deque()
+
+        async def report_next_page() -> None:
+            html_file_path, task = pending.popleft()
+            # El informe se escribe en un hilo; como se espera cada escritura, no hay dos a la vez
+            await asyncio.to_thread(processor._report_page, report, html_file_path, await task)
+
+        try:
+            if processor.shared_assets is not None:
+                # Hay que contar las referencias de todas las páginas antes de procesar la primera
+                html_files = await asyncio.to_thread(list, html_files)
+                await asyncio.to_thread(processor._prepare_shared_assets, html_files, None)
+
+            async for batch in self._iter_html_file_batches(html_files):
+                for html_file_path in batch:
+                    found_files += 1
+                    if current_files is not None:
+                        current_files.append(html_file_path)
+                    pending.append((html_file_path, asyncio.create_task(self._process_html_file(html_file_path))))
+                    if len(pending) >= self.max_concurrency:
+                        await report_next_page()
+            while pending:
+                await report_next_page()
+
+            if not found_files:
+                print(f"No se encontraron archivos HTML en la ruta: {processor.html_reader.root_path}")
+            if processor.build_manifest is not None:
+                await asyncio.to_thread(processor.build_manifest.remove_deleted_sources, current_files,
+                                        processor.output_root_directory)
+        finally:
+            for _, task in pending:
+                task.cancel()
+            processor.image_encoder.encoding_executor = None
+            if encoding_executor is not None:
+                await asyncio.to_thread(encoding_executor.shutdown)
+            if processor.html_file_writer.fsync_batch_size:
+                await asyncio.to_thread(processor.html_file_writer.sync)
+            if processor.build_manifest is not None:
+                await asyncio.to_thread(processor.build_manifest.save)
+            await asyncio.to_thread(report.close)
+
+        return report.summary()
@@ -1,43 +1,165 @@
+import os
+import time
+import itertools
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
 from html_processing_lib.html_reader import HtmlReader
 from html_processing_lib.image_encoder import ImageEncoder
+from html_processing_lib.image_cache import ImageEncodingCache
+from html_processing_lib.image_optimizer import ImageOptimizer
 from html_processing_lib.html_image_replacer import HtmlImageReplacer
 from html_processing_lib.html_file_writer import HtmlFileWriter
+from html_processing_lib.build_manifest import BuildManifest
+from html_processing_lib.shared_assets import SharedAssetStore
+from html_processing_lib.processing_report import ProcessingReport
+
+def ordered_map(executor: Executor, function: Callable, items: Iterable, max_pending: int) -> Iterator:
+    """
+    Aplica una función a cada elemento en un pool y devuelve los resultados en el orden de
+    los elementos. A diferencia de `Executor.map`, solo mantiene `max_pending` tareas enviadas
+    a la vez, de modo que la memoria no crece con el número de elementos.
+
+    Args:
+        executor (Executor): El pool donde se ejecuta la función.
+        function (Callable): La función a aplicar.
+        items (Iterable): Los elementos a procesar.
+        max_pending (int): Número máximo de tareas enviadas y no consumidas.
+
+    Yields:
+        El resultado de cada elemento, en el orden de `items`.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
+
+class PageResult(NamedTuple):
+    """
+    Resultado del procesamiento de un archivo HTML.
+    """
+    output_path: str
+    image_results: Optional[dict]
+    error: Optional[str]
+    unchanged: bool
+    seconds: float
+    input_bytes: int
+    output_bytes: int
 
 class HtmlProcessor:
     """
     Clase principal que orquesta el procesamiento de archivos HTML:
     lectura, reemplazo de imágenes por Base64 y escritura de archivos procesados.
     """
-    def __init__(self, root_path: str, output_root_directory: str):
+    def __init__(self, root_path: str, output_root_directory: str, cache_max_bytes: int = 64 * 1024 * 1024,
+                 workers: int = 1, encoding_processes: int = 0, streaming: bool = False, chunk_size: int = 64 * 1024,
+                 incremental: bool = False, image_optimizer: Optional[ImageOptimizer] = None, inline_max_bytes: int = 0,
+                 shared_asset_min_pages: int = 0, html_reader: Optional[HtmlReader] = None,
+                 report_path: Optional[str] = None, verbose: bool = True, fsync_batch_size: int = 0):
         """
         Inicializa HtmlProcessor con la ruta raíz de los archivos HTML.
 
         Args:
             root_path (str): La ruta absoluta del directorio raíz donde buscar archivos HTML.
+            output_root_directory (str): La ruta absoluta del directorio donde se guardan los archivos procesados.
+            cache_max_bytes (int): Tamaño máximo en bytes de la caché de imágenes codificadas que
+                                   comparten todos los archivos HTML. Con 0 se desactiva la caché.
+            workers (int): Número de hilos que leen, procesan y escriben archivos HTML a la vez.
+                           Con 1 los archivos se procesan uno a uno.
+            encoding_processes (int): Número de procesos para codificar a Base64 las imágenes
+                                      grandes. Con 0 se codifican en el hilo que las lee.
+            streaming (bool): Si es True, cada archivo se lee, reescribe y escribe por bloques
+                              (ver `HtmlImageReplacer.rewrite_stream`), sin cargarlo completo
+                              en memoria junto con sus imágenes.
+            chunk_size (int): Número de caracteres por bloque en el modo por bloques.
+            incremental (bool): Si es True, se guarda un manifiesto (`BuildManifest`) en el directorio
+                                de salida y en las siguientes ejecuciones solo se procesan los archivos
+                                HTML que cambiaron o cuyas imágenes cambiaron. También se borran los
+                                archivos procesados cuyo original ya no existe.
+            image_optimizer (Optional[ImageOptimizer]): Optimizador que reduce y recomprime las
+                                                        imágenes antes de incrustarlas.
+            inline_max_bytes (int): Tamaño máximo en bytes (después de optimizar) de las imágenes que
+                                    se incrustan. Las más grandes se dejan enlazadas con una URL
+                                    relativa al archivo procesado. Con 0 no hay límite.
+            shared_asset_min_pages (int): Si es mayor que 0, las imágenes referenciadas por más de
+                                          este número de archivos HTML se guardan una vez en el
+                                          directorio de recursos compartidos (`SharedAssetStore`) y
+                                          se enlazan; el resto se siguen incrustando.
+            html_reader (Optional[HtmlReader]): Lector con los filtros de búsqueda de archivos HTML
+                                                (patrones, profundidad, enlaces simbólicos). Por
+                                                defecto busca '*.html' y '*.htm' en toda la raíz.
+                                                El directorio de salida siempre se excluye.
+            report_path (Optional[str]): Ruta del informe detallado por archivo e imagen (JSONL, o
+                                         SQLite si termina en '.db' o '.sqlite'). Si es None solo
+                                         se devuelve el resumen.
+            verbose (bool): Si es False, no se muestra una línea por cada archivo (los errores sí).
+            fsync_batch_size (int): Si es mayor que 0, cada archivo generado se sincroniza con el
+                                    disco antes de renombrarlo, y sus directorios en lotes de
+                                    este tamaño y al terminar, antes de guardar el manifiesto
+                                    (ver `HtmlFileWriter.sync`).
         """
-        self.html_reader = HtmlReader(root_path)
-        self.image_encoder = ImageEncoder()
+        self.html_reader = html_reader if html_reader is not None else HtmlReader(root_path)
+        self.html_reader.exclude_directory(output_root_directory)
+        self.image_cache = ImageEncodingCache(cache_max_bytes) if cache_max_bytes > 0 else None
+        self.image_optimizer = image_optimizer
+        self.image_encoder = ImageEncoder(self.image_cache, image_optimizer, inline_max_bytes)
         self.html_image_replacer = HtmlImageReplacer(self.image_encoder)
-        self.html_file_writer = HtmlFileWriter(root_path, output_root_directory)
+        self.html_file_writer = HtmlFileWriter(root_path, output_root_directory, fsync_batch_size=fsync_batch_size)
+        self.html_image_replacer.link_resolver = self.html_file_writer.get_relative_url
+        self.workers = max(1, workers)
+        self.encoding_processes = max(0, encoding_processes)
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        self.output_root_directory = output_root_directory
+        self.report_path = report_path
+        self.verbose = verbose
+        self.shared_assets = None
+        if shared_asset_min_pages > 0:
+            self.shared_assets = SharedAssetStore(os.path.join(output_root_directory, SharedAssetStore.DEFAULT_DIRECTORY),
+                                                  shared_asset_min_pages, self.image_encoder)
+            self.html_image_replacer.shared_assets = self.shared_assets
+        self.build_manifest = None
+        if incremental:
+            # Las opciones que cambian los archivos generados invalidan el manifiesto anterior
+            build_options = {}
+            if image_optimizer is not None:
+                build_options["optimizer"] = image_optimizer.settings()
+            if inline_max_bytes:
+                build_options["inline_max_bytes"] = inline_max_bytes
+            self.build_manifest = BuildManifest(os.path.join(output_root_directory, BuildManifest.DEFAULT_FILENAME),
+                                                build_options)
 
-    def process_all_html_files(self) -> dict:
+    def _process_html_file(self, html_file_path: str) -> PageResult:
         """
-        Encuentra todos los archivos HTML en la ruta raíz y sus subcarpetas,
-        procesa sus imágenes y guarda los archivos HTML resultantes.
+        Lee un archivo HTML, reemplaza sus imágenes y guarda el resultado.
+
+        Args:
+            html_file_path (str): La ruta absoluta del archivo HTML.
 
         Returns:
-            dict: Un diccionario que contiene las imágenes procesadas exitosamente y las que fallaron.
+            PageResult: El archivo generado, los resultados de sus imágenes, el error (si lo hubo),
+                        si se omitió por no tener cambios, el tiempo y los tamaños de entrada y salida.
         """
-        html_files = self.html_reader.find_html_files()
-        if not html_files:
-            print(f"No se encontraron archivos HTML en la ruta: {self.html_reader.root_path}")
-            return {"success": {}, "fail": {}}
-
-        all_image_results = {"success": {}, "fail": {}}
+        started = time.perf_counter()
+        input_bytes = 0
+        try:
+            html_fingerprint = None
+            shared_image_paths = self.shared_assets.shared_image_paths() if self.shared_assets is not None else None
+            if self.build_manifest is not None:
+                unchanged_entry = self.build_manifest.get_unchanged_entry(html_file_path, shared_image_paths)
+                if unchanged_entry is not None:
+                    return PageResult(unchanged_entry["output"], unchanged_entry["results"], None, True,
+                                      time.perf_counter() - started, unchanged_entry["html"]["size"],
+                                      os.path.getsize(unchanged_entry["output"]))
+                html_fingerprint = self.build_manifest.fingerprint(html_file_path)
+            input_bytes = os.path.getsize(html_file_path)
 
-        for html_file_path in html_files:
-            print(f"Procesando archivo: {html_file_path}")
-            try:
+            if self.streaming:
+                new_file_path, image_results = self._process_html_file_streaming(html_file_path)
+            else:
                 html_content = self.html_reader.read_html_content(html_file_path)
                 processed_html_content, image_results = self.html_image_replacer.replace_images_with_base64(
                     html_content, html_file_path
@@ -45,14 +167,155 @@ class HtmlProcessor:
                 new_file_path = self.html_file_writer.write_processed_html(
                     html_file_path, processed_html_content
                 )
-                if new_file_path:
-                    print(f"Archivo procesado guardado en: {new_file_path}")
-                
-                all_image_results["success"].update(image_results["success"])
-                all_image_results["fail"].update(image_results["fail"])
-
-            except Exception as e:
-                print(f"Error al procesar {html_file_path}: {e}")
-                all_image_results["fail"][html_file_path] = str(e)
-        
-        return all_image_results
+
+            if self.build_manifest is not None:
+                image_paths = [image["path"] for image in image_results["images"]]
+                self.build_manifest.record(html_file_path, html_fingerprint, new_file_path, image_paths, image_results,
+                                           shared_image_paths)
+            output_bytes = os.path.getsize(new_file_path) if new_file_path else 0
+            return PageResult(new_file_path, image_results, None, False, time.perf_counter() - started,
+                              input_bytes, output_bytes)
+        except Exception as e:
+            if self.build_manifest is not None:
+                self.build_manifest.forget(html_file_path)
+            return PageResult("", None, str(e), False, time.perf_counter() - started, input_bytes, 0)
+
+    def _process_html_file_streaming(self, html_file_path: str) -> tuple:
+        """
+        Procesa un archivo HTML por bloques, escribiendo el resultado a medida que se genera.
+
+        Returns:
+            tuple: (ruta del archivo procesado o cadena vacía, resultados de sus imágenes).
+        """
+        with self.html_reader.open_html_file(html_file_path) as html_input:
+            new_file_path, image_results = self.html_file_writer.write_processed_html_stream(
+                html_file_path,
+                lambda output: self.html_image_replacer.rewrite_stream(html_input, output, html_file_path, self.chunk_size)
+            )
+        return new_file_path, image_results or {"success": {}, "fail": {}, "images": []}
+
+    def _report_page(self, report: ProcessingReport, html_file_path: str, page: PageResult) -> None:
+        """
+        Muestra el resultado de un archivo HTML y lo registra en el informe con sus imágenes.
+        """
+        if page.unchanged:
+            if self.verbose:
+                print(f"Sin cambios, se omite: {html_file_path}")
+            report.record_page(html_file_path, page.output_path, "unchanged", page.seconds,
+                               page.input_bytes, page.output_bytes)
+            # Las imágenes que se escribieron en el archivo sin cambios se informan como reutilizadas
+            for image in page.image_results["images"]:
+                status = "failed" if image["status"] == "failed" else "reused"
+                report.record_image(html_file_path, dict(image, status=status, seconds=None))
+            return
+
+        if self.verbose:
+            print(f"Procesando archivo: {html_file_path}")
+        if page.error is not None:
+            print(f"Error al procesar {html_file_path}: {page.error}")
+            report.record_page(html_file_path, "", "error", page.seconds, page.input_bytes, 0, page.error)
+            return
+        if page.output_path:
+            if self.verbose:
+                print(f"Archivo procesado guardado en: {page.output_path}")
+            report.record_page(html_file_path, page.output_path, "processed", page.seconds,
+                               page.input_bytes, page.output_bytes)
+        else:
+            report.record_page(html_file_path, "", "error", page.seconds, page.input_bytes, 0,
+                               "No se pudo escribir el archivo procesado")
+        for image in page.image_results["images"]:
+            report.record_image(html_file_path, image)
+
+    def _find_image_paths(self, html_file_path: str) -> list:
+        """
+        Devuelve las imágenes que referencia un archivo HTML, tomadas del manifiesto si el archivo
+        no cambió o leyéndolo por bloques. Si no se puede leer devuelve una lista vacía (el error
+        se informa al procesarlo).
+        """
+        if self.build_manifest is not None:
+            image_paths = self.build_manifest.get_image_references(html_file_path)
+            if image_paths is not None:
+                return image_paths
+        try:
+            with self.html_reader.open_html_file(html_file_path) as html_input:
+                return self.html_image_replacer.find_image_paths(html_input, html_file_path, self.chunk_size)
+        except Exception:
+            return []
+
+    def _prepare_shared_assets(self, html_files: List[str], file_executor: Optional[Executor]) -> None:
+        """
+        Cuenta en cuántos archivos HTML aparece cada imagen y guarda como recursos compartidos
+        las que superan el mínimo de páginas, antes de procesar los archivos.
+        """
+        if file_executor is not None:
+            references = ordered_map(file_executor, self._find_image_paths, html_files, self.workers * 4)
+        else:
+            references = map(self._find_image_paths, html_files)
+        for image_paths in references:
+            self.shared_assets.count_references(image_paths)
+        self.shared_assets.prepare_assets()
+
+    def process_all_html_files(self) -> dict:
+        """
+        Encuentra todos los archivos HTML en la ruta raíz y sus subcarpetas,
+        procesa sus imágenes y guarda los archivos HTML resultantes.
+
+        Los archivos se procesan a medida que se encuentran (ver `HtmlReader.iter_html_files`),
+        sin esperar a recorrer todo el árbol de directorios. El resultado de cada archivo y de
+        cada imagen se escribe en el informe (`ProcessingReport`) y en memoria solo quedan los
+        contadores del resumen.
+
+        Con `workers` > 1 los archivos se procesan en un pool de hilos, pero sus resultados
+        se combinan en el mismo orden que en el modo secuencial, por lo que los archivos
+        generados, el informe y el resumen son idénticos (salvo los tiempos). En el modo
+        incremental, los archivos sin cambios se omiten y aportan al informe los resultados
+        guardados en el manifiesto. En el modo de recursos compartidos, antes se recorren todos
+        los archivos para contar en cuántos aparece cada imagen.
+
+        Returns:
+            dict: El resumen del procesamiento (ver `ProcessingReport.summary`).
+        """
+        html_files = self.html_reader.iter_html_files()
+        report = ProcessingReport(self.report_path)
+        found_files = 0
+        # Solo el manifiesto necesita la lista de archivos (para borrar los resultados de los eliminados)
+        current_files = [] if self.build_manifest is not None else None
+
+        encoding_executor = ProcessPoolExecutor(max_workers=self.encoding_processes) if self.encoding_processes else None
+        file_executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self.image_encoder.encoding_executor = encoding_executor
+        try:
+            if self.shared_assets is not None:
+                # Hay que contar las referencias de todas las páginas antes de procesar la primera
+                html_files = list(html_files)
+                self._prepare_shared_assets(html_files, file_executor)
+
+            html_files, files_to_process = itertools.tee(html_files)
+            if file_executor is not None:
+                file_results = ordered_map(file_executor, self._process_html_file, files_to_process, self.workers * 4)
+            else:
+                file_results = map(self._process_html_file, files_to_process)
+
+            for html_file_path, page in zip(html_files, file_results):
+                found_files += 1
+                if current_files is not None:
+                    current_files.append(html_file_path)
+                self._report_page(report, html_file_path, page)
+
+            if not found_files:
+                print(f"No se encontraron archivos HTML en la ruta: {self.html_reader.root_path}")
+            if self.build_manifest is not None:
+                self.build_manifest.remove_deleted_sources(current_files, self.output_root_directory)
+        finally:
+            self.image_encoder.encoding_executor = None
+            if file_executor is not None:
+                file_executor.shutdown()
+            if encoding_executor is not None:
+                encoding_executor.shutdown()
+            if self.html_file_writer.fsync_batch_size:
+                self.html_file_writer.sync()
+            if self.build_manifest is not None:
+                self.build_manifest.save()
+            report.close()
+
+        return report.summary()
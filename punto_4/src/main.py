@@ -1,8 +1,35 @@
 import os
+import asyncio
+import argparse
 from .core.html_processor import HtmlProcessor
+from .core.async_html_processor import AsyncHtmlProcessor
+from html_processing_lib.image_optimizer import ImageOptimizer
+from html_processing_lib.html_reader import HtmlReader
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reemplaza las imágenes de archivos HTML por su representación en Base64.")
+    parser.add_argument('--workers', type=int, default=1, help='Número de hilos que procesan archivos HTML a la vez.')
+    parser.add_argument('--procesos_codificacion', type=int, default=0, help='Número de procesos para codificar a Base64 las imágenes grandes.')
+    parser.add_argument('--asincrono', action='store_true', help='Usa la variante asyncio: --workers archivos e imágenes a la vez, con la E/S en hilos.')
+    parser.add_argument('--por_bloques', action='store_true', help='Lee, reescribe y escribe cada archivo por bloques para acotar la memoria.')
+    parser.add_argument('--tamano_bloque', type=int, default=64 * 1024, help='Caracteres por bloque en el modo por bloques.')
+    parser.add_argument('--optimizar', action='store_true', help='Reduce y recomprime las imágenes JPEG, PNG y WebP antes de incrustarlas (requiere Pillow).')
+    parser.add_argument('--dimension_maxima', type=int, default=0, help='Tamaño máximo en píxeles del lado más largo de las imágenes optimizadas (0 = sin límite).')
+    parser.add_argument('--calidad', type=int, default=85, help='Calidad de compresión JPEG/WebP de las imágenes optimizadas (1-95).')
+    parser.add_argument('--conservar_metadatos', action='store_true', help='Conserva los metadatos EXIF de las imágenes optimizadas.')
+    parser.add_argument('--limite_incrustar', type=int, default=0, help='Tamaño máximo en bytes de una imagen incrustada; las más grandes se enlazan (0 = sin límite).')
+    parser.add_argument('--compartir_desde', type=int, default=0, help='Las imágenes usadas en más de N páginas se guardan una vez en results/_shared_assets y se enlazan (0 = todo incrustado).')
+    parser.add_argument('--incluir', nargs='+', default=None, help="Patrones glob de los archivos a procesar (por defecto '*.html' '*.htm').")
+    parser.add_argument('--excluir', nargs='*', default=None, help="Patrones glob de archivos y directorios a omitir (por defecto '.git' 'node_modules').")
+    parser.add_argument('--profundidad_maxima', type=int, default=None, help='Profundidad máxima de subdirectorios a recorrer (0 = solo la raíz).')
+    parser.add_argument('--seguir_enlaces', action='store_true', help='Recorre los enlaces simbólicos a directorios (sin entrar dos veces en el mismo).')
+    parser.add_argument('--informe', default=None, help="Ruta del informe por archivo e imagen: JSONL, o SQLite si termina en '.db' o '.sqlite'.")
+    parser.add_argument('--resumido', action='store_true', help='No muestra una línea por cada archivo procesado, solo los errores y el resumen.')
+    parser.add_argument('--fsync_cada', type=int, default=0, help='Sincroniza con el disco cada archivo generado antes de renombrarlo y sus directorios en lotes de N archivos (0 = no sincroniza).')
+    parser.add_argument('--incremental', action='store_true', help='Solo procesa los archivos HTML (o imágenes) que cambiaron desde la ejecución anterior.')
+    args = parser.parse_args()
+
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
     html_root_directory = os.path.join(project_root, "test_html_files") 
@@ -10,13 +37,73 @@ if __name__ == "__main__":
     results_directory = os.path.join(project_root, "results")
     os.makedirs(results_directory, exist_ok=True)
 
-    processor = HtmlProcessor(html_root_directory, results_directory)
-    image_processing_summary = processor.process_all_html_files()
-    print("\nResumen del procesamiento de imágenes:")
-    print(f"  Imágenes procesadas exitosamente: {len(image_processing_summary["success"])}")
-    for original_src, absolute_path in image_processing_summary["success"].items():
-        print(f"    - {original_src} (Ruta absoluta: {absolute_path})")
-    
-    print(f"  Imágenes que fallaron: {len(image_processing_summary["fail"])}")
-    for original_src, error_message in image_processing_summary["fail"].items():
-        print(f"    - {original_src} (Error: {error_message})")
\ No newline at end of file
+    image_optimizer = None
+    if args.optimizar:
+        image_optimizer = ImageOptimizer(args.dimension_maxima, args.calidad, not args.conservar_metadatos,
+                                         cache_directory=os.path.join(results_directory, ".optimized_images"))
+
+    html_reader = HtmlReader(html_root_directory, args.incluir, args.excluir, args.profundidad_maxima, args.seguir_enlaces)
+
+    processor = HtmlProcessor(html_root_directory, results_directory, workers=args.workers, encoding_processes=args.procesos_codificacion,
+                              streaming=args.por_bloques, chunk_size=args.tamano_bloque, incremental=args.incremental,
+                              image_optimizer=image_optimizer, inline_max_bytes=args.limite_incrustar,
+                              shared_asset_min_pages=args.compartir_desde, html_reader=html_reader,
+                              report_path=args.informe, verbose=not args.resumido,
+                              fsync_batch_size=args.fsync_cada)
+    if args.asincrono:
+        summary = asyncio.run(AsyncHtmlProcessor(processor, max_concurrency=args.workers * 4,
+                                                 encoding_concurrency=args.workers).process_all_html_files())
+    else:
+        summary = processor.process_all_html_files()
+    page_counts = summary["pages"]
+    image_counts = summary["images"]
+    print("\nResumen del procesamiento:")
+    print(f"  Archivos HTML: {page_counts['processed']} procesados, {page_counts['unchanged']} sin cambios, {page_counts['error']} con error")
+    print(f"  Imágenes: {image_counts['inlined']} incrustadas, {image_counts['linked']} enlazadas, {image_counts['shared']} compartidas, "
+          f"{image_counts['reused']} reutilizadas, {image_counts['failed']} fallidas")
+    print(f"  Bytes: {summary['bytes']['input']} leídos, {summary['bytes']['output']} escritos ({summary['bytes']['inlined']} en data URI)")
+    print(f"  Tiempo de procesamiento de los archivos: {summary['seconds']:.2f} s")
+    if summary["failures"]:
+        print(f"  Fallos: {summary['failures']}")
+        for failure in summary["failure_samples"]:
+            failed_item = f"{failure['src']} en {failure['html']}" if failure["src"] is not None else failure["html"]
+            print(f"    - {failed_item} (Error: {failure['error']})")
+        remaining_failures = summary["failures"] - len(summary["failure_samples"])
+        if remaining_failures:
+            print(f"    y {remaining_failures} más")
+    if summary["report_path"] is not None:
+        print(f"  Informe detallado: {summary['report_path']}")
+
+    if processor.image_cache is not None:
+        cache_stats = processor.image_cache.stats()
+        print("  Caché de imágenes codificadas:")
+        print(f"    Aciertos: {cache_stats['hits']} por archivo, {cache_stats['content_hits']} por contenido")
+        print(f"    Fallos (imágenes codificadas): {cache_stats['misses']}")
+        print(f"    Entradas: {cache_stats['entries']} ({cache_stats['bytes']} de {cache_stats['max_bytes']} bytes), descartadas: {cache_stats['evictions']}")
+
+    if processor.image_optimizer is not None:
+        optimizer_stats = processor.image_optimizer.stats()
+        saved_bytes = optimizer_stats['original_bytes'] - optimizer_stats['optimized_bytes']
+        print("  Optimización de imágenes:")
+        print(f"    Imágenes optimizadas: {optimizer_stats['optimized']} ({optimizer_stats['cache_hits']} leídas de la caché)")
+        print(f"    Bytes: {optimizer_stats['original_bytes']} -> {optimizer_stats['optimized_bytes']} (ahorro: {saved_bytes})")
+
+    linked_stats = processor.image_encoder.linked_stats()
+    if linked_stats['linked_images']:
+        print(f"  Imágenes enlazadas en lugar de incrustadas: {linked_stats['linked_images']} ({linked_stats['linked_bytes']} bytes)")
+
+    if processor.shared_assets is not None:
+        shared_stats = processor.shared_assets.stats()
+        written_bytes = summary['bytes']['output'] + shared_stats['asset_bytes']
+        print("  Recursos compartidos:")
+        print(f"    Imágenes compartidas: {shared_stats['shared_images']} ({shared_stats['asset_files']} archivos, {shared_stats['asset_bytes']} bytes)")
+        print(f"    Referencias enlazadas: {shared_stats['linked_references']}")
+        print(f"    Bytes escritos: {written_bytes} (HTML: {summary['bytes']['output']}, recursos: {shared_stats['asset_bytes']})")
+        print(f"    Bytes estimados solo incrustando: {summary['bytes']['output'] + shared_stats['inline_bytes_avoided']}")
+
+    if processor.build_manifest is not None:
+        build_stats = processor.build_manifest.stats()
+        print("  Compilación incremental:")
+        print(f"    Archivos sin cambios (omitidos): {build_stats['unchanged']}")
+        print(f"    Archivos procesados: {build_stats['rebuilt']}")
+        print(f"    Archivos procesados eliminados (su original ya no existe): {build_stats['removed']}")
@@ -0,0 +1,157 @@
+import os
+import zlib
+import shutil
+import random
+import struct
+import argparse
+
+# Palabras con las que se rellena el texto de las páginas
+FILLER_WORDS = ("datos", "imagen", "página", "sitio", "proceso", "archivo", "reporte", "tabla",
+                "cliente", "valor", "fecha", "resumen", "detalle", "sección", "contenido")
+
+def make_png(rng: random.Random, target_bytes: int) -> bytes:
+    """
+    Genera una imagen PNG válida (RGB, píxeles aleatorios, que casi no se comprimen) de
+    aproximadamente `target_bytes` bytes, sin depender de Pillow.
+
+    Args:
+        rng (random.Random): El generador aleatorio.
+        target_bytes (int): El tamaño aproximado del archivo.
+
+    Returns:
+        bytes: El contenido del archivo PNG.
+    """
+    width = max(1, int((max(target_bytes, 64) / 3) ** 0.5))
+    height = max(1, target_bytes // (3 * width))
+    row_bytes = 3 * width
+    raw = b"".join(b"\x00" + rng.randbytes(row_bytes) for _ in range(height))
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+def _random_directory(rng: random.Random, max_depth: int, branching: int) -> str:
+    depth = rng.randint(0, max_depth)
+    return os.path.join(*(f"d{rng.randrange(branching)}" for _ in range(depth))) if depth else ""
+
+def _image_reference(rng: random.Random, image_url: str, index: int) -> str:
+    # La mayoría son <img src>, el resto srcset y url() de style, para medir los tres casos
+    kind = rng.random()
+    if kind < 0.7:
+        return f'<img src="{image_url}" alt="imagen {index}">'
+    if kind < 0.85:
+        return f'<img src="{image_url}" srcset="{image_url} 1x, {image_url} 2x" alt="imagen {index}">'
+    return f'<div class="banner" style="background-image: url(\'{image_url}\')"></div>'
+
+def generate_site(destination: str, pages: int = 200, max_depth: int = 3, images: int = 50,
+                  min_image_kb: int = 5, max_image_kb: int = 200, shared_ratio: float = 0.3,
+                  images_per_page: int = 5, text_kb: int = 4, seed: int = 42) -> dict:
+    """
+    Genera un sitio sintético de archivos HTML con imágenes locales, para medir el
+    procesamiento a escala. Con la misma semilla se obtiene el mismo sitio.
+
+    Las imágenes se dividen en compartidas (logos, íconos: el 10% de las imágenes, al menos
+    una) y propias. Cada referencia de una página apunta a una imagen compartida con
+    probabilidad `shared_ratio` y a una propia en otro caso.
+
+    Args:
+        destination (str): Directorio del sitio (se borra si existe).
+        pages (int): Número de archivos HTML.
+        max_depth (int): Profundidad máxima de subdirectorios de las páginas.
+        images (int): Número de imágenes distintas.
+        min_image_kb (int): Tamaño mínimo de las imágenes en KB.
+        max_image_kb (int): Tamaño máximo de las imágenes en KB.
+        shared_ratio (float): Proporción de referencias que apuntan a las imágenes compartidas.
+        images_per_page (int): Número de referencias a imágenes por página.
+        text_kb (int): Texto de relleno por página en KB.
+        seed (int): Semilla del generador aleatorio.
+
+    Returns:
+        dict: Número de páginas (`pages`), imágenes (`images`) y referencias (`references`), y
+              bytes de HTML (`html_bytes`) y de imágenes (`image_bytes`) generados.
+    """
+    rng = random.Random(seed)
+    shutil.rmtree(destination, ignore_errors=True)
+    image_directory = os.path.join(destination, "img")
+    os.makedirs(image_directory, exist_ok=True)
+
+    image_paths = []
+    image_bytes = 0
+    for index in range(max(1, images)):
+        size = rng.randint(min_image_kb, max(min_image_kb, max_image_kb)) * 1024
+        image_path = os.path.join(image_directory, f"imagen{index}.png")
+        data = make_png(rng, size)
+        with open(image_path, 'wb') as f:
+            f.write(data)
+        image_paths.append(image_path)
+        image_bytes += len(data)
+    shared_count = max(1, len(image_paths) // 10)
+    shared_images, own_images = image_paths[:shared_count], image_paths[shared_count:] or image_paths
+
+    html_bytes = 0
+    references = 0
+    branching = 4
+    for page in range(pages):
+        directory = os.path.join(destination, _random_directory(rng, max_depth, branching))
+        os.makedirs(directory, exist_ok=True)
+        parts = [f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>Página {page}</title></head>\n<body>\n"]
+        filler_paragraphs = max(1, text_kb * 1024 // 600)
+        for index in range(max(images_per_page, filler_paragraphs)):
+            if index < filler_paragraphs:
+                parts.append("<p>" + " ".join(rng.choices(FILLER_WORDS, k=80)) + "</p>\n")
+            if index < images_per_page:
+                image_path = rng.choice(shared_images if rng.random() < shared_ratio else own_images)
+                image_url = os.path.relpath(image_path, directory).replace(os.sep, '/')
+                parts.append(_image_reference(rng, image_url, index) + "\n")
+                references += 1
+        parts.append("</body>\n</html>\n")
+        content = "".join(parts)
+        with open(os.path.join(directory, f"pagina{page}.html"), 'w', encoding='utf-8') as f:
+            f.write(content)
+        html_bytes += len(content.encode('utf-8'))
+
+    return {"pages": pages, "images": len(image_paths), "references": references,
+            "html_bytes": html_bytes, "image_bytes": image_bytes}
+
+def add_site_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Agrega a un parser los argumentos de `generate_site` (compartidos con benchmark.py).
+    """
+    parser.add_argument('--paginas', type=int, default=200, help='Número de archivos HTML.')
+    parser.add_argument('--profundidad', type=int, default=3, help='Profundidad máxima de subdirectorios.')
+    parser.add_argument('--imagenes', type=int, default=50, help='Número de imágenes distintas.')
+    parser.add_argument('--tamano_min_kb', type=int, default=5, help='Tamaño mínimo de las imágenes en KB.')
+    parser.add_argument('--tamano_max_kb', type=int, default=200, help='Tamaño máximo de las imágenes en KB.')
+    parser.add_argument('--proporcion_compartidas', type=float, default=0.3, help='Proporción de referencias a imágenes compartidas por todo el sitio.')
+    parser.add_argument('--imagenes_por_pagina', type=int, default=5, help='Referencias a imágenes por página.')
+    parser.add_argument('--texto_kb', type=int, default=4, help='Texto de relleno por página en KB.')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla del generador aleatorio.')
+
+def generate_site_from_args(destination: str, args: argparse.Namespace) -> dict:
+    return generate_site(
+        destination,
+        pages=args.paginas,
+        max_depth=args.profundidad,
+        images=args.imagenes,
+        min_image_kb=args.tamano_min_kb,
+        max_image_kb=args.tamano_max_kb,
+        shared_ratio=args.proporcion_compartidas,
+        images_per_page=args.imagenes_por_pagina,
+        text_kb=args.texto_kb,
+        seed=args.seed
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un sitio sintético de archivos HTML con imágenes locales.")
+    add_site_arguments(parser)
+    parser.add_argument('--destino', type=str, required=True, help='Directorio del sitio (se borra si existe).')
+    args = parser.parse_args()
+
+    site = generate_site_from_args(args.destino, args)
+    print(f"Sitio generado en {args.destino}: {site['pages']} páginas ({site['html_bytes']} bytes), "
+          f"{site['images']} imágenes ({site['image_bytes']} bytes), {site['references']} referencias.")
+
+if __name__ == "__main__":
+    main()
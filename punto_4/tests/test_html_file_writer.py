@@ -0,0 +1,47 @@
+import os
+import sys
+from unittest import mock
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from html_processing_lib.html_file_writer import HtmlFileWriter
+
+class TestHtmlFileWriter:
+
+    def test_atomic_write_leaves_no_temporary_files(self, tmp_path):
+        writer = HtmlFileWriter(str(tmp_path / 'entrada'), str(tmp_path / 'salida'))
+        original = str(tmp_path / 'entrada' / 'sub' / 'pagina.html')
+
+        new_file_path = writer.write_processed_html(original, '<p>uno</p>')
+        writer.write_processed_html(original, '<p>dos</p>')
+
+        assert new_file_path == str(tmp_path / 'salida' / 'sub' / 'pagina_processed.html')
+        assert os.listdir(tmp_path / 'salida' / 'sub') == ['pagina_processed.html']
+        with open(new_file_path, encoding='utf-8') as f:
+            assert f.read() == '<p>dos</p>'
+
+    def test_file_is_synced_before_replace(self, tmp_path):
+        """Cada temporal se sincroniza antes de renombrarlo; los directorios, por lotes"""
+        output_directory = str(tmp_path / 'salida')
+        writer = HtmlFileWriter(str(tmp_path / 'entrada'), output_directory, fsync_batch_size=2)
+        calls = []
+        real_fsync, real_replace = os.fsync, os.replace
+
+        def fsync(file_descriptor):
+            calls.append(('fsync', os.path.basename(os.readlink(f'/proc/self/fd/{file_descriptor}'))))
+            real_fsync(file_descriptor)
+
+        def replace(source, destination):
+            calls.append(('replace', os.path.basename(source)))
+            real_replace(source, destination)
+
+        with mock.patch('os.fsync', side_effect=fsync), mock.patch('os.replace', side_effect=replace):
+            for name in ('a', 'b', 'c'):
+                writer.write_processed_html(str(tmp_path / 'entrada' / f'{name}.html'), name)
+            assert writer.sync()
+
+        file_calls = [call for call in calls if call[1] != 'salida']
+        assert [kind for kind, _ in file_calls] == ['fsync', 'replace'] * 3
+        assert all(fsynced == replaced for (_, fsynced), (_, replaced) in zip(file_calls[::2], file_calls[1::2]))
+        # Un fsync del directorio al completar el lote de 2 archivos y otro al terminar
+        assert calls.count(('fsync', 'salida')) == 2
+        assert calls.index(('fsync', 'salida')) == 4
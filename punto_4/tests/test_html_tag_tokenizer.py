@@ -0,0 +1,152 @@
+import io
+import os
+import sys
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from html_processing_lib.html_tag_tokenizer import HtmlTagTokenizer
+from html_processing_lib.html_image_replacer import HtmlImageReplacer
+from html_processing_lib.image_encoder import ImageEncoder
+
+# Cabecera PNG mínima: basta para que la imagen se reconozca como image/png
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 16
+
+class TestHtmlTagTokenizer:
+
+    @pytest.fixture
+    def tokenizer(self):
+        return HtmlTagTokenizer()
+
+    def values(self, tag, attributes):
+        return {attribute.name: tag[attribute.value_start:attribute.value_end] for attribute in attributes}
+
+    def test_quoting_variants(self, tokenizer):
+        """Valores con comillas dobles, simples, sin comillas y atributos sin valor"""
+        tag = '<IMG SRC="a.png" alt=\'una imagen\' width=10 hidden data-x = "y">'
+        tag_name, attributes = tokenizer.tokenize(tag)
+
+        assert tag_name == 'img'
+        assert self.values(tag, attributes) == {
+            'src': 'a.png', 'alt': 'una imagen', 'width': '10', 'hidden': '', 'data-x': 'y'
+        }
+        assert [attribute.quote for attribute in attributes] == ['"', "'", '', '', '"']
+
+    def test_repeated_attribute_keeps_first(self, tokenizer):
+        tag = '<img src="a.png" src="b.png">'
+        _, attributes = tokenizer.tokenize(tag)
+
+        assert self.values(tag, attributes) == {'src': 'a.png'}
+
+    def test_greater_than_inside_quoted_value(self, tokenizer):
+        tag = '<img alt="a > b" src=\'c>d.png\'>'
+        _, attributes = tokenizer.tokenize(tag)
+
+        assert self.values(tag, attributes) == {'alt': 'a > b', 'src': 'c>d.png'}
+
+    def test_self_closing_tag(self, tokenizer):
+        tag = '<img src=a.png/>'
+        tag_name, attributes = tokenizer.tokenize(tag)
+
+        assert tag_name == 'img'
+        assert self.values(tag, attributes) == {'src': 'a.png/'}
+
+    @pytest.mark.parametrize("srcset, urls", [
+        ('a.png', ['a.png']),
+        ('a.png 1x, b.png 2x', ['a.png', 'b.png']),
+        ('a.png 480w,b.png 800w', ['a.png', 'b.png']),
+        ('a.png, b.png,', ['a.png', 'b.png']),
+        ('  a.png  1.5x ,\n b.png ', ['a.png', 'b.png']),
+        ('a.png (max-width: 1x, 2x), b.png', ['a.png', 'b.png']),
+        ('a,b.png 1x', ['a,b.png']),
+    ])
+    def test_srcset_descriptors(self, tokenizer, srcset, urls):
+        assert [srcset[start:end] for start, end in tokenizer.iter_srcset_urls(srcset)] == urls
+
+    @pytest.mark.parametrize("style, urls", [
+        ('background: url(a.png)', ['a.png']),
+        ('background: url("a.png")', ['a.png']),
+        ("background: url('a.png')", ['a.png']),
+        ('background: URL( a.png )', ['a.png']),
+        ('background: url(a.png), url("b.png")', ['a.png', 'b.png']),
+        ('background: url(&quot;a.png&quot;)', ['a.png']),
+        ('background: url(&#39;a.png&#39;)', ['a.png']),
+        ('background: url(&#x22;a b.png&#x22;)', ['a b.png']),
+        ('background: url(a.png?x=1&amp;y=2)', ['a.png?x=1&amp;y=2']),
+        ('background: url()', []),
+        ('background: url("")', []),
+    ])
+    def test_css_url_forms(self, tokenizer, style, urls):
+        assert [style[start:end] for start, end in tokenizer.iter_css_urls(style)] == urls
+
+class TestHtmlImageReplacerScanning:
+
+    @pytest.fixture
+    def site(self, tmp_path):
+        """Fixture que crea un directorio con una imagen y devuelve la ruta de un HTML dentro de él"""
+        (tmp_path / 'img').mkdir()
+        (tmp_path / 'img' / 'a.png').write_bytes(PNG_BYTES)
+        return str(tmp_path / 'pagina.html')
+
+    @pytest.fixture
+    def replacer(self):
+        return HtmlImageReplacer(ImageEncoder())
+
+    def replaced_sources(self, replacer, html_content, html_file_path):
+        _, results = replacer.replace_images_with_base64(html_content, html_file_path)
+        return [(image["src"], image["status"]) for image in results["images"]]
+
+    def test_img_src_and_srcset(self, replacer, site):
+        html_content = '<img src="img/a.png" srcset="img/a.png 1x, img/a.png 2x"><source srcset=img/a.png>'
+
+        assert self.replaced_sources(replacer, html_content, site) == [('img/a.png', 'inlined')] * 4
+
+    def test_remote_and_data_urls_are_skipped(self, replacer, site):
+        html_content = ('<img src="https://x.org/a.png"><img src="//x.org/a.png">'
+                        '<img src="data:image/png;base64,AAAA"><img src="">')
+
+        processed, results = replacer.replace_images_with_base64(html_content, site)
+        assert processed == html_content
+        assert results["images"] == []
+
+    def test_greater_than_inside_attribute(self, replacer, site):
+        html_content = '<img alt="1 > 0" src="img/a.png">'
+        processed, _ = replacer.replace_images_with_base64(html_content, site)
+
+        assert processed.startswith('<img alt="1 > 0" src="data:image/png;base64,')
+
+    def test_comments_are_not_processed(self, replacer, site):
+        html_content = ('<!-- <img src="img/missing.png"> --><img src="img/a.png">'
+                        '<!--><img src="img/a.png"><!---><!-- a -- b --->')
+
+        assert self.replaced_sources(replacer, html_content, site) == [('img/a.png', 'inlined')] * 2
+
+    @pytest.mark.parametrize("element", ['script', 'style', 'textarea', 'title'])
+    def test_raw_text_elements_are_not_processed(self, replacer, site, element):
+        html_content = (f'<{element}>"<img src="img/missing.png">"</{element.upper()} >'
+                        f'<img src="img/a.png">')
+
+        assert self.replaced_sources(replacer, html_content, site) == [('img/a.png', 'inlined')]
+
+    def test_entity_encoded_css_url(self, replacer, site):
+        html_content = '<div style="background:url(&quot;img/a.png&quot;)"></div>'
+        processed, results = replacer.replace_images_with_base64(html_content, site)
+
+        assert results["fail"] == {}
+        assert processed.startswith('<div style="background:url(&quot;data:image/png;base64,')
+        assert processed.endswith('&quot;)"></div>')
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+    def test_streaming_matches_in_memory(self, replacer, site, chunk_size):
+        """Las etiquetas, comentarios y cierres partidos entre bloques dan el mismo resultado"""
+        html_content = ('<p>texto</p><!-- <img src="img/missing.png"> --><img alt="a>b" src="img/a.png">'
+                        '<script>if (a <img) {}</script><IMG SRC=img/a.png>'
+                        '<div style="background:url(&#39;img/a.png&#39;)"></div><!--')
+        expected, expected_results = replacer.replace_images_with_base64(html_content, site)
+
+        output = io.StringIO()
+        results = replacer.rewrite_stream(io.StringIO(html_content), output, site, chunk_size)
+        assert output.getvalue() == expected
+        assert results["success"] == expected_results["success"]
+        assert replacer.find_image_paths(io.StringIO(html_content), site, chunk_size) == [
+            os.path.join(os.path.dirname(site), 'img', 'a.png')
+        ]
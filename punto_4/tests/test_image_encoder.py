@@ -0,0 +1,50 @@
+import os
+import sys
+import base64
+import random
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from html_processing_lib.image_encoder import ImageEncoder, MMAP_MIN_BYTES, ENCODE_BLOCK_BYTES
+from html_processing_lib.image_cache import ImageEncodingCache
+
+class TestImageEncoderMappedImages:
+
+    @pytest.fixture
+    def large_png(self, tmp_path):
+        """Fixture que crea una imagen que se lee con mmap (más de un bloque de codificación)"""
+        data = b'\x89PNG\r\n\x1a\n' + random.Random(1).randbytes(max(MMAP_MIN_BYTES, ENCODE_BLOCK_BYTES) * 2 + 7)
+        path = tmp_path / 'grande.png'
+        path.write_bytes(data)
+        return str(path), data
+
+    @pytest.mark.parametrize("cache", [None, ImageEncodingCache])
+    def test_mapped_image_matches_base64(self, large_png, cache):
+        path, data = large_png
+        encoder = ImageEncoder(cache() if cache else None)
+
+        success, data_uri = encoder.image_to_base64(path)
+        assert success
+        assert data_uri == "data:image/png;base64," + base64.b64encode(data).decode('ascii')
+
+    def test_content_key_computed_while_encoding(self, large_png, tmp_path):
+        """La clave de contenido calculada por bloques es la misma que la de la imagen completa"""
+        path, data = large_png
+        copy_path = str(tmp_path / 'copia.png')
+        with open(copy_path, 'wb') as f:
+            f.write(data)
+        cache = ImageEncodingCache()
+        encoder = ImageEncoder(cache)
+
+        _, data_uri = encoder.image_to_base64(path)
+        _, copy_data_uri = encoder.image_to_base64(copy_path)
+        assert copy_data_uri is data_uri
+        assert cache.stats()["content_hits"] == 1
+        assert cache.get_by_content(("otra", 0, 0), ImageEncodingCache.content_key(data, 'image/png')) is data_uri
+
+    def test_mapped_image_over_inline_limit_is_linked(self, large_png):
+        path, data = large_png
+        encoder = ImageEncoder(ImageEncodingCache(), inline_max_bytes=len(data) - 1)
+
+        assert encoder.image_to_base64(path) == (True, None)
+        assert encoder.linked_stats() == {"linked_images": 1, "linked_bytes": len(data)}
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import shutil
+import asyncio
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.html_processor import HtmlProcessor
+from src.core.async_html_processor import AsyncHtmlProcessor
+from synthetic_site import generate_site
+
+PUNTO_4_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modos de procesamiento que deben producir los mismos archivos, informe y resumen que el secuencial
+MODES = {
+    "secuencial": {},
+    "hilos": {"workers": 4},
+    "por_bloques": {"streaming": True, "chunk_size": 257},
+    "hilos_por_bloques": {"workers": 4, "streaming": True, "chunk_size": 257},
+    "asincrono": {"async": True},
+    "asincrono_por_bloques": {"async": True, "streaming": True, "chunk_size": 257},
+}
+
+# Opciones que cambian lo que se escribe en las páginas, combinadas con cada modo
+OPTIONS = {
+    "incrustar": {},
+    "limite_incrustar": {"inline_max_bytes": 12 * 1024},
+    "recursos_compartidos": {"shared_asset_min_pages": 3},
+}
+
+def process(site_directory: str, output_directory: str, mode: dict, options: dict) -> dict:
+    """
+    Procesa un sitio con un modo y unas opciones, y devuelve el resumen sin los campos que
+    dependen de la ejecución (tiempos y ruta del informe).
+    """
+    mode = dict(mode)
+    use_async = mode.pop("async", False)
+    processor = HtmlProcessor(site_directory, output_directory, verbose=False,
+                              report_path=os.path.join(output_directory, "informe.jsonl"), **mode, **options)
+    if use_async:
+        summary = asyncio.run(AsyncHtmlProcessor(processor, max_concurrency=4).process_all_html_files())
+    else:
+        summary = processor.process_all_html_files()
+    summary.pop("seconds")
+    summary.pop("report_path")
+    return summary
+
+def read_output_tree(output_directory: str) -> dict:
+    """
+    Devuelve el contenido de los archivos generados (ruta relativa -> bytes), con las líneas
+    del informe sin sus tiempos ni el directorio de salida.
+    """
+    files = {}
+    for directory, _, file_names in os.walk(output_directory):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, output_directory)] = f.read()
+    report_lines = []
+    for line in files.pop("informe.jsonl").decode('utf-8').splitlines():
+        record = json.loads(line)
+        record.pop("seconds")
+        if record.get("output"):
+            record["output"] = os.path.relpath(record["output"], output_directory)
+        report_lines.append(record)
+    return {"files": files, "report": report_lines}
+
+@pytest.fixture(scope="module")
+def site(tmp_path_factory):
+    """Fixture que crea un sitio sintético pequeño junto con las páginas de test_html_files"""
+    site_directory = str(tmp_path_factory.mktemp("modos") / "sitio")
+    generate_site(site_directory, pages=30, max_depth=2, images=8, min_image_kb=1, max_image_kb=40,
+                  shared_ratio=0.5, images_per_page=4, text_kb=2, seed=3)
+    shutil.copytree(os.path.join(PUNTO_4_DIRECTORY, "test_html_files"), os.path.join(site_directory, "ejemplos"))
+    with open(os.path.join(site_directory, "fallos.html"), 'w', encoding='utf-8') as f:
+        f.write('<html><body><!-- <img src="img/imagen0.png"> -->'
+                '<img src="img/no_existe.png"><img src="img/imagen1.png"></body></html>')
+    return site_directory
+
+@pytest.fixture(scope="module")
+def expected(site, tmp_path_factory):
+    """Fixture con el resultado del modo secuencial para cada conjunto de opciones"""
+    results = {}
+    for name, options in OPTIONS.items():
+        output_directory = str(tmp_path_factory.mktemp("secuencial") / name)
+        results[name] = (process(site, output_directory, MODES["secuencial"], options),
+                         read_output_tree(output_directory))
+    return results
+
+class TestProcessingModes:
+
+    def test_sequential_result(self, expected):
+        summary, output = expected["incrustar"]
+        assert summary["pages"]["processed"] == 33
+        assert summary["images"]["failed"] == 1
+        assert summary["images"]["inlined"] > 0
+        assert b"data:image/png;base64," in output["files"]["fallos_processed.html"]
+        assert b'<!-- <img src="img/imagen0.png"> -->' in output["files"]["fallos_processed.html"]
+
+    @pytest.mark.parametrize("options_name", list(OPTIONS))
+    @pytest.mark.parametrize("mode_name", [name for name in MODES if name != "secuencial"])
+    def test_mode_matches_sequential(self, site, expected, tmp_path, mode_name, options_name):
+        output_directory = str(tmp_path / "salida")
+        summary = process(site, output_directory, MODES[mode_name], OPTIONS[options_name])
+        expected_summary, expected_output = expected[options_name]
+
+        assert summary == expected_summary
+        output = read_output_tree(output_directory)
+        assert sorted(output["files"]) == sorted(expected_output["files"])
+        for relative_path, content in expected_output["files"].items():
+            assert output["files"][relative_path] == content, relative_path
+        assert output["report"] == expected_output["report"]
+
+    @pytest.mark.parametrize("mode_name", ["secuencial", "hilos", "asincrono"])
+    def test_incremental_rebuild_matches_full_build(self, site, expected, tmp_path, mode_name):
+        output_directory = str(tmp_path / "salida")
+        mode = dict(MODES[mode_name], incremental=True)
+        first_summary = process(site, output_directory, mode, {})
+        second_summary = process(site, output_directory, mode, {})
+        expected_summary, expected_output = expected["incrustar"]
+
+        assert first_summary == expected_summary
+        assert second_summary["pages"]["unchanged"] == sum(expected_summary["pages"].values())
+        assert second_summary["bytes"]["output"] == expected_summary["bytes"]["output"]
+        output = read_output_tree(output_directory)
+        for relative_path, content in expected_output["files"].items():
+            assert output["files"][relative_path] == content, relative_path
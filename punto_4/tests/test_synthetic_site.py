@@ -0,0 +1,98 @@
+import os
+import sys
+import zlib
+import struct
+import random
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic_site import generate_site, make_png
+from benchmark import run_once, STAGES
+from src.core.html_processor import HtmlProcessor
+from html_processing_lib.mime_sniffer import MimeSniffer
+
+SITE_OPTIONS = {"pages": 12, "max_depth": 2, "images": 6, "min_image_kb": 1, "max_image_kb": 8,
+                "shared_ratio": 0.3, "images_per_page": 3, "text_kb": 1}
+
+def read_tree(directory: str) -> dict:
+    files = {}
+    for current_directory, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            path = os.path.join(current_directory, file_name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, directory)] = f.read()
+    return files
+
+def read_png_chunks(data: bytes) -> list:
+    """Separa un PNG en sus bloques (tipo, datos) comprobando el CRC de cada uno"""
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks = []
+    position = 8
+    while position < len(data):
+        length, = struct.unpack(">I", data[position:position + 4])
+        chunk_type = data[position + 4:position + 8]
+        chunk_data = data[position + 8:position + 8 + length]
+        crc, = struct.unpack(">I", data[position + 8 + length:position + 12 + length])
+        assert crc == zlib.crc32(chunk_type + chunk_data)
+        chunks.append((chunk_type, chunk_data))
+        position += 12 + length
+    return chunks
+
+class TestSyntheticSite:
+
+    @pytest.fixture
+    def site(self, tmp_path):
+        """Fixture que genera un sitio sintético pequeño y devuelve su directorio y sus estadísticas"""
+        site_directory = str(tmp_path / "sitio")
+        return site_directory, generate_site(site_directory, seed=5, **SITE_OPTIONS)
+
+    def test_png_is_valid(self):
+        data = make_png(random.Random(1), 4096)
+        chunks = read_png_chunks(data)
+
+        assert [chunk_type for chunk_type, _ in chunks] == [b'IHDR', b'IDAT', b'IEND']
+        width, height, bit_depth, color_type = struct.unpack(">IIBB", chunks[0][1][:10])
+        assert (bit_depth, color_type) == (8, 2)
+        assert len(zlib.decompress(chunks[1][1])) == height * (1 + 3 * width)
+        assert abs(len(data) - 4096) < 4096 * 0.1
+        assert MimeSniffer().sniff(data[:32]) == 'image/png'
+
+    def test_same_seed_generates_same_site(self, site, tmp_path):
+        site_directory, _ = site
+        other_directory = str(tmp_path / "otro")
+        generate_site(other_directory, seed=5, **SITE_OPTIONS)
+
+        assert read_tree(other_directory) == read_tree(site_directory)
+        generate_site(other_directory, seed=6, **SITE_OPTIONS)
+        assert read_tree(other_directory) != read_tree(site_directory)
+
+    def test_statistics_match_files(self, site):
+        site_directory, stats = site
+        files = read_tree(site_directory)
+        html_files = [content for path, content in files.items() if path.endswith('.html')]
+        image_files = [content for path, content in files.items() if path.endswith('.png')]
+
+        assert stats["pages"] == len(html_files) == SITE_OPTIONS["pages"]
+        assert stats["images"] == len(image_files) == SITE_OPTIONS["images"]
+        assert stats["html_bytes"] == sum(len(content) for content in html_files)
+        assert stats["image_bytes"] == sum(len(content) for content in image_files)
+        assert stats["references"] == SITE_OPTIONS["pages"] * SITE_OPTIONS["images_per_page"]
+
+    def test_every_reference_is_inlined(self, site, tmp_path):
+        site_directory, stats = site
+        summary = HtmlProcessor(site_directory, str(tmp_path / "salida"), verbose=False).process_all_html_files()
+
+        assert summary["pages"]["processed"] == stats["pages"]
+        assert summary["images"]["failed"] == 0
+        # Las referencias de srcset tienen dos URL cada una
+        assert summary["images"]["inlined"] >= stats["references"]
+
+    def test_benchmark_run(self, site):
+        site_directory, stats = site
+        run = run_once(site_directory, {"workers": 2})
+
+        assert run["paginas"] == stats["pages"]
+        assert run["imagenes_fallidas"] == 0
+        assert run["bytes_leidos"] == stats["html_bytes"]
+        assert set(run["etapas"]) == set(STAGES)
+        assert all(seconds >= 0 for seconds in run["etapas"].values())